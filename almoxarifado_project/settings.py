@@ -139,8 +139,7 @@ STATICFILES_DIRS = [
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTHENTICATION_BACKENDS = [
-    'apps.users.backends.UsuarioSistemaBackend',  # Nosso backend customizado
-    'django.contrib.auth.backends.ModelBackend',   # O backend padrão (útil para o admin)
+    'apps.users.backends.UsuarioSistemaBackend',  # Nosso backend customizado (herda do ModelBackend)
 ]
 
 AUTH_USER_MODEL = 'users.UsuarioSistema'
@@ -95,15 +95,27 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Autenticação
+# O UsuarioSistemaBackend já herda do ModelBackend (senha e permissões);
+# repetir o ModelBackend aqui faria cada login inválido calcular o hash duas vezes.
 AUTHENTICATION_BACKENDS = [
     'apps.users.backends.UsuarioSistemaBackend',
-    'django.contrib.auth.backends.ModelBackend',
 ]
+# Tempo (s) que o usuário da sessão fica em cache entre requisições
+USUARIO_CACHE_TTL = env.int('USUARIO_CACHE_TTL', default=60)
 AUTH_USER_MODEL = 'users.UsuarioSistema'
 
 # Configuração do Django Channels
 ASGI_APPLICATION = 'almoxarifado_project.asgi.application'
 
+# Geração de PDF (apps.core.pdf): processos com o WeasyPrint pré-carregado
+# (0 = renderizar no próprio processo), PDFs simultâneos e tempo máximo (s)
+PDF_PROCESSOS = env.int('PDF_PROCESSOS', default=2)
+PDF_CONCORRENCIA = env.int('PDF_CONCORRENCIA', default=4)
+PDF_TIMEOUT = env.int('PDF_TIMEOUT', default=30)
+# Cache em disco dos PDFs que não mudam mais (apps.core.cache_pdf) e seu tamanho máximo em bytes
+PDF_CACHE_DIR = env('PDF_CACHE_DIR', default=os.path.join(BASE_DIR, 'pdf_cache'))
+PDF_CACHE_TAMANHO_MAXIMO = env.int('PDF_CACHE_TAMANHO_MAXIMO', default=200 * 1024 * 1024)
+
 # Configurações do Jazzmin
 JAZZMIN_SETTINGS = {
     # title of the window (Will default to current_admin_site.site_title if absent or None)
@@ -1,136 +1,208 @@
 # Em apps/chat/consumers.py
 
 import json
+from urllib.parse import parse_qs
+
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
-from django.utils.timezone import localtime # ✅ IMPORTAÇÃO PARA CORRIGIR O FUSO HORÁRIO
 
+from .db import chat_database_sync_to_async
+from .historico import mensagens_posteriores, pagina_historico, serializar_mensagem
 from .models import Mensagem, Conversa
+from .protocolo import (
+    SUBPROTOCOLO_MSGPACK, desempacotar, empacotar, evento_de_transmissao, mensagem_compacta
+)
 
 class ChatConsumer(AsyncWebsocketConsumer):
     """
     Consumer que gerencia as conexões WebSocket para o chat em tempo real.
+    O acesso ao banco roda no pool de threads próprio do chat (ver db.py).
+    Clientes que oferecem o subprotocolo 'chat.msgpack' trocam quadros
+    binários compactos (ver protocolo.py); os demais usam JSON.
     """
     async def connect(self):
         """
         Chamado quando a conexão WebSocket é iniciada.
         Valida o usuário, junta-o ao grupo da conversa e envia o histórico.
+        Numa reconexão, o cliente informa a última mensagem que já tem
+        (?after=<id>) e recebe só as posteriores.
         """
         self.user = self.scope['user']
         if not self.user.is_authenticated:
             await self.close()
             return
 
-        self.conversa_id = self.scope['url_route']['kwargs']['conversa_id']
+        self.conversa_id = int(self.scope['url_route']['kwargs']['conversa_id'])
         self.room_group_name = f'chat_{self.conversa_id}'
 
+        # A participação é verificada uma única vez, antes de entrar no grupo;
+        # daqui em diante o consumer só atende participantes da conversa.
+        self.is_participant = await self.check_participant()
+        if not self.is_participant:
+            await self.close()
+            return
+
+        self.binario = SUBPROTOCOLO_MSGPACK in self.scope.get('subprotocols', ())
+
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
-        await self.accept()
-        await self.send_message_history()
+        await self.accept(subprotocol=SUBPROTOCOLO_MSGPACK if self.binario else None)
+
+        ultimo_id = self.ultimo_id_recebido()
+        if ultimo_id is None:
+            await self.send_message_history()
+        else:
+            await self.send_catch_up(ultimo_id)
+
+    def ultimo_id_recebido(self):
+        """
+        Id da última mensagem que o cliente já tem, vindo da query string da
+        reconexão, ou None numa conexão nova.
+        """
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        try:
+            return int(query['after'][0])
+        except (KeyError, IndexError, ValueError):
+            return None
+
+    def serializar(self, mensagem):
+        """
+        Mensagem no formato do protocolo do cliente: lista compacta no
+        MessagePack, dicionário completo (com 'is_me') no JSON.
+        """
+        if self.binario:
+            return mensagem_compacta(mensagem)
+        return serializar_mensagem(mensagem, self.user)
+
+    async def enviar_quadro(self, quadro):
+        if self.binario:
+            await self.send(bytes_data=empacotar(quadro))
+        else:
+            await self.send(text_data=json.dumps(quadro))
+
+    @chat_database_sync_to_async
+    def check_participant(self):
+        """
+        EXISTS indexado na tabela de participantes da conversa.
+        """
+        return Conversa.participantes.through.objects.filter(
+            conversa_id=self.conversa_id, usuariosistema_id=self.user.pk
+        ).exists()
 
     async def disconnect(self, close_code):
         """
         Chamado quando a conexão WebSocket é fechada.
         """
-        await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        if getattr(self, 'is_participant', False):
+            await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
 
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         """
-        Recebe uma nova mensagem do cliente, salva e a transmite para o grupo.
+        Recebe uma mensagem do cliente. Pedidos de páginas antigas do
+        histórico chegam com type='load_older' e o cursor recebido na
+        página anterior; o resto é uma nova mensagem, que é salva e
+        transmitida para o grupo. Quadros malformados, que não sejam objetos
+        ou cuja mensagem não seja texto são ignorados, sem derrubar a conexão.
         """
-        text_data_json = json.loads(text_data)
+        try:
+            if bytes_data is not None:
+                text_data_json = desempacotar(bytes_data)
+            else:
+                text_data_json = json.loads(text_data)
+        except (ValueError, TypeError):
+            # JSON/MessagePack inválido (os erros de ambos derivam de ValueError)
+            return
+
+        # Só objetos são pedidos válidos; listas, números e textos decodificados são ignorados
+        if not isinstance(text_data_json, dict):
+            return
+
+        if text_data_json.get('type') == 'load_older':
+            await self.send_message_history(
+                cursor=text_data_json.get('cursor'), tipo='older_messages'
+            )
+            return
+
         message_text = text_data_json.get('message', '')
 
-        if not message_text.strip():
+        if not isinstance(message_text, str) or not message_text.strip():
             return # Ignora mensagens vazias
 
-        new_message_data = await self.save_message(message_text)
-        if new_message_data:
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'chat_message',
-                    'message_data': new_message_data
-                }
-            )
+        evento = await self.save_message(message_text)
+        if evento:
+            await self.channel_layer.group_send(self.room_group_name, evento)
 
     async def chat_message(self, event):
         """
         Recebe uma mensagem transmitida do grupo e a envia ao cliente WebSocket.
-        Calcula o campo 'is_me' para cada destinatário.
-        """
-        message_data = event['message_data']
-        is_me = (self.user.username == message_data.get('author_username'))
-        
-        payload = message_data.copy()
-        payload['is_me'] = is_me
-        
-        await self.send(text_data=json.dumps(payload))
+        O evento já traz os quadros prontos (ver evento_de_transmissao): no
+        JSON, só se escolhe a variante com o 'is_me' deste destinatário.
+        """
+        if self.binario:
+            await self.send(bytes_data=event['msgpack'])
+        elif event['autor_id'] == self.user.pk:
+            await self.send(text_data=event['json_autor'])
+        else:
+            await self.send(text_data=event['json_demais'])
     
-    @database_sync_to_async
-    def get_message_history(self):
+    @chat_database_sync_to_async
+    def get_message_history(self, cursor=None):
         """
-        Busca o histórico de mensagens no banco de dados, convertendo o
-        timestamp para o fuso horário local.
+        Busca uma página do histórico (as mensagens mais recentes ou, com um
+        cursor, as anteriores a ele), no formato do protocolo do cliente.
+        Retorna None se o cursor for inválido.
         """
         try:
-            conversa = Conversa.objects.get(id=self.conversa_id)
-            if self.user not in conversa.participantes.all():
-                return None
-
-            mensagens = conversa.mensagens.order_by('timestamp').select_related('autor__funcionario', 'autor')
-            
-            history = []
-            for msg in mensagens:
-                autor_nome = msg.autor.funcionario.nome if hasattr(msg.autor, 'funcionario') and msg.autor.funcionario else msg.autor.username
-                
-                # ✅ CONVERSÃO DO FUSO HORÁRIO APLICADA
-                timestamp_local = localtime(msg.timestamp).strftime('%d/%m/%Y %H:%M')
-                
-                history.append({
-                    'user': autor_nome,
-                    'message': msg.texto,
-                    'timestamp': timestamp_local,
-                    'is_me': msg.autor == self.user
-                })
-            return history
-        except Conversa.DoesNotExist:
+            mensagens, tem_mais, proximo_cursor = pagina_historico(self.conversa_id, cursor)
+        except ValueError:
             return None
 
-    async def send_message_history(self):
+        return {
+            'history': [self.serializar(msg) for msg in mensagens],
+            'has_more': tem_mais,
+            'cursor': proximo_cursor,
+        }
+
+    async def send_message_history(self, cursor=None, tipo='message_history'):
         """
-        Envia o histórico de mensagens formatado para o cliente que acabou de se conectar.
+        Envia uma página do histórico ao cliente: as últimas mensagens logo
+        após a conexão ('message_history') ou uma página mais antiga pedida
+        ao rolar a conversa para cima ('older_messages').
         """
-        history = await self.get_message_history()
-        if history is not None:
-            await self.send(text_data=json.dumps({
-                'type': 'message_history',
-                'history': history
-            }))
+        pagina = await self.get_message_history(cursor)
+        if pagina is not None:
+            await self.enviar_quadro({'type': tipo, **pagina})
 
-    @database_sync_to_async
+    @chat_database_sync_to_async
+    def get_catch_up(self, ultimo_id):
+        """
+        Mensagens que chegaram depois de 'ultimo_id' (ver mensagens_posteriores).
+        """
+        mensagens, atrasado_demais = mensagens_posteriores(self.conversa_id, ultimo_id)
+        if atrasado_demais:
+            return {'type': 'resync_required'}
+        return {
+            'type': 'catch_up',
+            'history': [self.serializar(msg) for msg in mensagens],
+        }
+
+    async def send_catch_up(self, ultimo_id):
+        """
+        Envia ao cliente reconectado só as mensagens que ele perdeu
+        ('catch_up') ou, se forem muitas, o aviso para recarregar a página
+        ('resync_required').
+        """
+        resposta = await self.get_catch_up(ultimo_id)
+        if resposta is not None:
+            await self.enviar_quadro(resposta)
+
+    @chat_database_sync_to_async
     def save_message(self, message_text):
         """
-        Salva uma nova mensagem no banco de dados e retorna um dicionário
-        com os dados formatados, incluindo o timestamp no fuso horário local.
+        Salva uma nova mensagem no banco de dados e retorna o evento de
+        transmissão para o grupo, já serializado uma única vez. A participação já foi verificada no connect: aqui é só o INSERT.
         """
-        try:
-            conversa = Conversa.objects.get(id=self.conversa_id)
-            message = Mensagem.objects.create(
-                conversa=conversa,
-                autor=self.user,
-                texto=message_text
-            )
-            autor_nome = self.user.funcionario.nome if hasattr(self.user, 'funcionario') and self.user.funcionario else self.user.username
-            
-            # ✅ CONVERSÃO DO FUSO HORÁRIO APLICADA
-            timestamp_local = localtime(message.timestamp).strftime('%d/%m/%Y %H:%M')
-
-            return {
-                'user': autor_nome,
-                'message': message.texto,
-                'timestamp': timestamp_local,
-                'author_username': self.user.username
-            }
-        except Conversa.DoesNotExist:
-            return None
+        message = Mensagem.objects.create(
+            conversa_id=self.conversa_id,
+            autor=self.user,
+            texto=message_text
+        )
+        return evento_de_transmissao(message)
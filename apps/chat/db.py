@@ -0,0 +1,46 @@
+# Em apps/chat/db.py
+
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.db import DatabaseSyncToAsync
+from django.conf import settings
+
+THREADS_PADRAO = 8
+
+_executor = None
+_trava = threading.Lock()
+
+
+def executor_do_chat():
+    """
+    Pool de threads exclusivo para o acesso ao banco dos consumers do chat,
+    com CHAT_DB_THREADS threads (cada uma com sua própria conexão).
+
+    O database_sync_to_async padrão (thread_sensitive=True) coloca todas as
+    chamadas de todos os sockets em uma única thread, compartilhada com as
+    views síncronas: um histórico lento travava o chat de todo mundo.
+    """
+    global _executor
+    if _executor is None:
+        with _trava:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'CHAT_DB_THREADS', THREADS_PADRAO),
+                    thread_name_prefix='chat-db'
+                )
+    return _executor
+
+
+def chat_database_sync_to_async(func):
+    """
+    Como o database_sync_to_async do Channels (inclusive o fechamento de
+    conexões antigas), mas executando no pool de executor_do_chat().
+    Serve para funções e métodos.
+    """
+    @functools.wraps(func)
+    async def envoltorio(*args, **kwargs):
+        chamada = DatabaseSyncToAsync(func, thread_sensitive=False, executor=executor_do_chat())
+        return await chamada(*args, **kwargs)
+    return envoltorio
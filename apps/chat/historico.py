@@ -0,0 +1,105 @@
+# Em apps/chat/historico.py
+
+import datetime
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.timezone import localtime
+
+from .models import Mensagem
+
+TAMANHO_PAGINA_PADRAO = 50
+LIMITE_RECUPERACAO_PADRAO = 200
+
+
+def tamanho_pagina():
+    return getattr(settings, 'CHAT_TAMANHO_PAGINA_HISTORICO', TAMANHO_PAGINA_PADRAO)
+
+
+def limite_recuperacao():
+    return getattr(settings, 'CHAT_LIMITE_RECUPERACAO', LIMITE_RECUPERACAO_PADRAO)
+
+
+def nome_autor(autor):
+    return autor.funcionario.nome if autor.funcionario_id else autor.username
+
+
+def serializar_mensagem(mensagem, user=None):
+    """
+    Dicionário enviado ao cliente para uma mensagem, com o timestamp já no
+    fuso horário local. 'is_me' só é incluído quando o usuário é informado.
+    """
+    dados = {
+        'id': mensagem.id,
+        'user': nome_autor(mensagem.autor),
+        'message': mensagem.texto,
+        'timestamp': localtime(mensagem.timestamp).strftime('%d/%m/%Y %H:%M'),
+        'author_username': mensagem.autor.username,
+    }
+    if user is not None:
+        dados['is_me'] = mensagem.autor_id == user.pk
+    return dados
+
+
+def cursor_da_mensagem(mensagem):
+    """
+    Cursor opaco '<timestamp ISO>|<id>' que aponta para uma mensagem; a
+    página seguinte traz as mensagens anteriores a ela.
+    """
+    return f"{mensagem.timestamp.isoformat()}|{mensagem.id}"
+
+
+def ler_cursor(cursor):
+    """
+    Converte o cursor em (timestamp, id). Levanta ValueError se for inválido.
+    """
+    timestamp, _, mensagem_id = str(cursor).partition('|')
+    return datetime.datetime.fromisoformat(timestamp), int(mensagem_id)
+
+
+def pagina_historico(conversa_id, cursor=None, limite=None):
+    """
+    Uma página do histórico da conversa em ordem cronológica: as 'limite'
+    mensagens mais recentes ou, com um cursor, as imediatamente anteriores
+    a ele. A paginação é por chave (timestamp, id), usando o índice
+    (conversa, timestamp), e o custo não depende do tamanho da conversa.
+
+    Retorna (mensagens, tem_mais, cursor_para_anteriores).
+    """
+    limite = limite or tamanho_pagina()
+    mensagens = (
+        Mensagem.objects.filter(conversa_id=conversa_id)
+        .select_related('autor__funcionario')
+        .order_by('-timestamp', '-id')
+    )
+    if cursor:
+        timestamp, mensagem_id = ler_cursor(cursor)
+        mensagens = mensagens.filter(
+            Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=mensagem_id)
+        )
+
+    pagina = list(mensagens[:limite + 1])
+    tem_mais = len(pagina) > limite
+    pagina = pagina[:limite][::-1]
+    proximo_cursor = cursor_da_mensagem(pagina[0]) if tem_mais else None
+    return pagina, tem_mais, proximo_cursor
+
+
+def mensagens_posteriores(conversa_id, ultimo_id, limite=None):
+    """
+    Mensagens da conversa posteriores à última que o cliente já tem (para
+    recuperar o que se perdeu durante uma reconexão), em ordem cronológica.
+    Busca no máximo 'limite' + 1 mensagens; se houver mais que 'limite', o
+    cliente está atrasado demais e deve recarregar a página.
+
+    Retorna (mensagens, atrasado_demais).
+    """
+    limite = limite or limite_recuperacao()
+    mensagens = list(
+        Mensagem.objects.filter(conversa_id=conversa_id, id__gt=ultimo_id)
+        .select_related('autor__funcionario')
+        .order_by('timestamp', 'id')[:limite + 1]
+    )
+    if len(mensagens) > limite:
+        return [], True
+    return mensagens, False
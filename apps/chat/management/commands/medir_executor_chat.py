@@ -0,0 +1,98 @@
+# app/chat/management/commands/medir_executor_chat.py
+
+import asyncio
+import time
+
+from channels.db import database_sync_to_async
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from apps.chat.db import chat_database_sync_to_async
+from apps.chat.historico import pagina_historico
+from apps.chat.management.medicao import ComandoMedicao
+from apps.chat.metricas import formatar_resumo, resumo_latencias
+from apps.chat.models import Conversa, Mensagem
+
+UsuarioSistema = get_user_model()
+
+MODOS = {
+    # database_sync_to_async padrão: uma única thread para todos os sockets
+    'thread_unica': database_sync_to_async,
+    # pool dedicado do chat (CHAT_DB_THREADS)
+    'pool_chat': chat_database_sync_to_async,
+}
+
+
+class Command(ComandoMedicao):
+    help = (
+        'Mede a latência de gravação de mensagens do chat com N escritores simultâneos, '
+        'enquanto leituras lentas de histórico disputam o acesso ao banco, comparando o '
+        'database_sync_to_async padrão (thread única) com o pool dedicado do chat. '
+        'Grava mensagens em uma conversa temporária, removida ao final. Só roda com DEBUG '
+        'ligado ou com --permitir-banco-real.'
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--escritores', type=int, default=50, help='Escritores simultâneos (sockets).')
+        parser.add_argument('--mensagens', type=int, default=20, help='Mensagens gravadas por escritor.')
+        parser.add_argument('--leitores-lentos', type=int, default=2, help='Leituras de histórico lentas em paralelo.')
+        parser.add_argument(
+            '--atraso-leitura', type=float, default=0.2,
+            help='Segundos extras em cada leitura de histórico, simulando uma consulta lenta.'
+        )
+        parser.add_argument('--modo', choices=sorted(MODOS), help='Mede só um dos modos.')
+
+    def handle(self, *args, **options):
+        # As gravações medidas rodam em outras threads (e conexões): os dados
+        # são gravados de fato e removidos ao final, mesmo se a medição falhar
+        with transaction.atomic():
+            usuario = UsuarioSistema.objects.create_user(
+                f'benchmark_chat_{int(time.time())}', None, email=None
+            )
+            conversa = Conversa.objects.create()
+            conversa.participantes.add(usuario)
+        try:
+            modos = [options['modo']] if options['modo'] else list(MODOS)
+            for modo in modos:
+                resumo, duracao = asyncio.run(self.medir(MODOS[modo], conversa.pk, usuario.pk, options))
+                total = options['escritores'] * options['mensagens']
+                self.stdout.write(formatar_resumo(modo, resumo) + f" vazão={total / duracao:8.1f} msg/s")
+        finally:
+            with transaction.atomic():
+                conversa.delete()
+                usuario.delete()
+        self.stdout.write(self.style.SUCCESS('Medição concluída.'))
+
+    async def medir(self, adaptador, conversa_id, usuario_id, options):
+        atraso = options['atraso_leitura']
+
+        def gravar(indice):
+            Mensagem.objects.create(conversa_id=conversa_id, autor_id=usuario_id, texto=f'mensagem {indice}')
+
+        def ler_historico():
+            pagina_historico(conversa_id)
+            time.sleep(atraso)
+
+        gravar_async = adaptador(gravar)
+        ler_async = adaptador(ler_historico)
+        latencias = []
+        escrevendo = True
+
+        async def escritor(numero):
+            for indice in range(options['mensagens']):
+                inicio = time.perf_counter()
+                await gravar_async(numero * options['mensagens'] + indice)
+                latencias.append(time.perf_counter() - inicio)
+
+        async def leitor_lento():
+            while escrevendo:
+                await ler_async()
+
+        leitores = [asyncio.create_task(leitor_lento()) for _ in range(options['leitores_lentos'])]
+        inicio = time.perf_counter()
+        await asyncio.gather(*(escritor(numero) for numero in range(options['escritores'])))
+        duracao = time.perf_counter() - inicio
+        escrevendo = False
+        await asyncio.gather(*leitores)
+        return resumo_latencias(latencias), duracao
@@ -0,0 +1,259 @@
+# app/chat/management/commands/teste_carga_chat.py
+
+import asyncio
+import json
+import random
+import time
+
+import msgpack
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test.utils import override_settings
+
+from apps.chat.consumers import ChatConsumer
+from apps.chat.management.medicao import ComandoMedicao
+from apps.chat.metricas import formatar_resumo, resumo_latencias
+from apps.chat.models import Conversa, Mensagem
+from apps.chat.protocolo import SUBPROTOCOLO_MSGPACK
+
+UsuarioSistema = get_user_model()
+
+PREFIXO_TEXTO = 'carga '
+
+CAMADA_EM_MEMORIA = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        # A capacidade padrão (100) descartaria mensagens dos sockets mais
+        # lentos e mascararia a latência real
+        'CONFIG': {'capacity': 10000},
+    }
+}
+
+
+class Command(ComandoMedicao):
+    help = (
+        'Teste de carga do ChatConsumer: abre muitos sockets simulados (WebsocketCommunicator, '
+        'camada de canais em memória, sem Redis) em várias conversas, envia mensagens a uma '
+        'taxa fixa e mede o tempo de conexão, o de carga do histórico e a latência de '
+        'transmissão (p50/p95/p99). Usa dados temporários, removidos ao final; a agenda de '
+        'envios vem de uma semente fixa, para comparar execuções entre versões. Só roda com '
+        'DEBUG ligado ou com --permitir-banco-real.'
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--salas', type=int, default=50, help='Conversas simultâneas.')
+        parser.add_argument('--usuarios-por-sala', type=int, default=10, help='Sockets conectados em cada conversa.')
+        parser.add_argument('--historico', type=int, default=50, help='Mensagens já existentes em cada conversa.')
+        parser.add_argument('--taxa', type=float, default=1.0, help='Mensagens por segundo em cada conversa.')
+        parser.add_argument('--duracao', type=float, default=10.0, help='Segundos de envio de mensagens.')
+        parser.add_argument(
+            '--conexoes-paralelas', type=int, default=100,
+            help='Conexões abertas ao mesmo tempo durante a fase de conexão.'
+        )
+        parser.add_argument(
+            '--protocolo', choices=('json', 'msgpack'), default='json',
+            help='Protocolo dos sockets simulados.'
+        )
+        parser.add_argument(
+            '--espera', type=float, default=30.0,
+            help='Tempo máximo (s) para cada conexão e para a entrega das últimas mensagens.'
+        )
+        parser.add_argument('--semente', type=int, default=42, help='Semente da agenda de envios.')
+
+    def handle(self, *args, **options):
+        # Os consumers leem e gravam pelo pool de threads do chat, com conexões
+        # próprias: os dados precisam estar gravados (não dá para desfazê-los
+        # com um rollback). Criação e remoção são atômicas, e a remoção roda
+        # mesmo se a medição falhar.
+        with transaction.atomic():
+            conversas, usuarios = self.criar_dados(options)
+        try:
+            with override_settings(CHANNEL_LAYERS=CAMADA_EM_MEMORIA):
+                resultado = asyncio.run(self.executar(conversas, options))
+        finally:
+            with transaction.atomic():
+                Conversa.objects.filter(pk__in=[conversa.pk for conversa in conversas]).delete()
+                UsuarioSistema.objects.filter(pk__in=[usuario.pk for usuario in usuarios]).delete()
+        self.relatar(resultado, options)
+        self.stdout.write(self.style.SUCCESS('Teste de carga concluído.'))
+
+    def criar_dados(self, options):
+        """
+        Usuários, conversas, participantes e histórico criados em lote.
+        Retorna (conversas, usuarios); cada conversa recebe o atributo
+        'membros' com os seus usuários.
+        """
+        marca = int(time.time())
+        por_sala = options['usuarios_por_sala']
+        usuarios = [
+            UsuarioSistema(username=f'carga_chat_{marca}_{indice}')
+            for indice in range(options['salas'] * por_sala)
+        ]
+        for usuario in usuarios:
+            usuario.set_unusable_password()
+        usuarios = UsuarioSistema.objects.bulk_create(usuarios)
+        # Nem todos os bancos devolvem as chaves no bulk_create
+        usuarios = list(UsuarioSistema.objects.filter(username__startswith=f'carga_chat_{marca}_').order_by('pk'))
+
+        conversas = [Conversa.objects.create() for _ in range(options['salas'])]
+        Participante = Conversa.participantes.through
+        participantes, historico = [], []
+        for numero, conversa in enumerate(conversas):
+            conversa.membros = usuarios[numero * por_sala:(numero + 1) * por_sala]
+            participantes.extend(
+                Participante(conversa_id=conversa.pk, usuariosistema_id=usuario.pk) for usuario in conversa.membros
+            )
+            historico.extend(
+                Mensagem(conversa=conversa, autor=conversa.membros[indice % por_sala], texto=f'histórico {indice}')
+                for indice in range(options['historico'])
+            )
+        Participante.objects.bulk_create(participantes)
+        Mensagem.objects.bulk_create(historico, batch_size=1000)
+        return conversas, usuarios
+
+    def agenda(self, conversas, options):
+        """
+        Envios de cada conversa: (instante relativo, índice do remetente),
+        espaçados de 1/taxa a partir de uma fase sorteada. Com a mesma
+        semente, duas execuções enviam exatamente as mesmas mensagens.
+        """
+        sorteio = random.Random(options['semente'])
+        intervalo = 1 / options['taxa']
+        quantidade = int(options['taxa'] * options['duracao'])
+        agendas = {}
+        for conversa in conversas:
+            fase = sorteio.random() * intervalo
+            agendas[conversa.pk] = [
+                (fase + envio * intervalo, sorteio.randrange(len(conversa.membros)))
+                for envio in range(quantidade)
+            ]
+        return agendas
+
+    async def executar(self, conversas, options):
+        binario = options['protocolo'] == 'msgpack'
+        espera = options['espera']
+        limite = asyncio.Semaphore(options['conexoes_paralelas'])
+        tempos_conexao, tempos_historico, latencias = [], [], []
+        falhas = 0
+
+        def ler_quadro(saida):
+            if 'bytes' in saida and saida['bytes'] is not None:
+                quadro = msgpack.unpackb(saida['bytes'], raw=False)
+                if quadro.get('type') == 'message':
+                    return quadro['message'][3]
+                return None
+            quadro = json.loads(saida['text'])
+            return quadro.get('message') if 'type' not in quadro else None
+
+        async def conectar(conversa, usuario):
+            nonlocal falhas
+            comunicador = WebsocketCommunicator(
+                ChatConsumer.as_asgi(), f'/ws/chat/{conversa.pk}/',
+                subprotocols=[SUBPROTOCOLO_MSGPACK] if binario else None
+            )
+            comunicador.scope['user'] = usuario
+            comunicador.scope['url_route'] = {'kwargs': {'conversa_id': str(conversa.pk)}}
+            async with limite:
+                inicio = time.perf_counter()
+                conectado, _ = await comunicador.connect(timeout=espera)
+                aceito = time.perf_counter()
+                if not conectado:
+                    falhas += 1
+                    return None
+                await comunicador.receive_output(timeout=espera)  # página inicial do histórico
+                tempos_conexao.append(aceito - inicio)
+                tempos_historico.append(time.perf_counter() - aceito)
+            return comunicador
+
+        inicio_conexoes = time.perf_counter()
+        conectados = await asyncio.gather(
+            *(conectar(conversa, usuario) for conversa in conversas for usuario in conversa.membros)
+        )
+        sockets, posicao = {}, 0
+        for conversa in conversas:
+            sockets[conversa.pk] = conectados[posicao:posicao + len(conversa.membros)]
+            posicao += len(conversa.membros)
+        duracao_conexoes = time.perf_counter() - inicio_conexoes
+
+        esperadas = 0
+        recebidas = 0
+        todas_entregues = asyncio.Event()
+
+        async def receber(comunicador):
+            nonlocal recebidas
+            while True:
+                texto = ler_quadro(await comunicador.receive_output(timeout=None))
+                if texto and texto.startswith(PREFIXO_TEXTO):
+                    latencias.append(time.perf_counter() - float(texto[len(PREFIXO_TEXTO):]))
+                    recebidas += 1
+                    if recebidas >= esperadas:
+                        todas_entregues.set()
+
+        async def enviar(conversa, agenda, inicio):
+            conectados = sockets[conversa.pk]
+            for instante, remetente in agenda:
+                await asyncio.sleep(max(0.0, inicio + instante - time.perf_counter()))
+                comunicador = conectados[remetente]
+                if comunicador is None:
+                    continue
+                quadro = {'message': f'{PREFIXO_TEXTO}{time.perf_counter():.6f}'}
+                if binario:
+                    await comunicador.send_to(bytes_data=msgpack.packb(quadro))
+                else:
+                    await comunicador.send_to(text_data=json.dumps(quadro))
+
+        agendas = self.agenda(conversas, options)
+        for conversa in conversas:
+            conectados = sum(1 for comunicador in sockets[conversa.pk] if comunicador is not None)
+            enviaveis = sum(1 for _, remetente in agendas[conversa.pk] if sockets[conversa.pk][remetente] is not None)
+            esperadas += enviaveis * conectados
+
+        ativos = [comunicador for lista in sockets.values() for comunicador in lista if comunicador is not None]
+        receptores = [asyncio.create_task(receber(comunicador)) for comunicador in ativos]
+        inicio = time.perf_counter()
+        await asyncio.gather(*(enviar(conversa, agendas[conversa.pk], inicio) for conversa in conversas))
+        if esperadas and recebidas < esperadas:
+            try:
+                await asyncio.wait_for(todas_entregues.wait(), espera)
+            except asyncio.TimeoutError:
+                pass
+
+        for receptor in receptores:
+            receptor.cancel()
+        await asyncio.gather(*receptores, return_exceptions=True)
+        await asyncio.gather(*(comunicador.disconnect() for comunicador in ativos), return_exceptions=True)
+
+        return {
+            'sockets': len(ativos),
+            'falhas': falhas,
+            'duracao_conexoes': duracao_conexoes,
+            'conexao': resumo_latencias(tempos_conexao),
+            'historico': resumo_latencias(tempos_historico),
+            'transmissao': resumo_latencias(latencias),
+            'esperadas': esperadas,
+            'recebidas': recebidas,
+        }
+
+    def relatar(self, resultado, options):
+        self.stdout.write(
+            f"salas={options['salas']} usuarios_por_sala={options['usuarios_por_sala']} "
+            f"historico={options['historico']} taxa={options['taxa']}/s duracao={options['duracao']}s "
+            f"protocolo={options['protocolo']} semente={options['semente']}"
+        )
+        self.stdout.write(
+            f"sockets={resultado['sockets']} recusados={resultado['falhas']} "
+            f"conexões/s={resultado['sockets'] / resultado['duracao_conexoes']:.1f}"
+        )
+        self.stdout.write(formatar_resumo('conexão', resultado['conexao']))
+        self.stdout.write(formatar_resumo('carga do histórico', resultado['historico']))
+        self.stdout.write(formatar_resumo('transmissão', resultado['transmissao']))
+        perdidas = resultado['esperadas'] - resultado['recebidas']
+        self.stdout.write(
+            f"entregas={resultado['recebidas']}/{resultado['esperadas']} perdidas={perdidas}"
+        )
+        if perdidas:
+            self.stdout.write(self.style.WARNING(
+                'Algumas entregas não chegaram dentro do tempo de espera (--espera).'
+            ))
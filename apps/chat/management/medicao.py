@@ -0,0 +1,26 @@
+# Em apps/chat/management/medicao.py
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class ComandoMedicao(BaseCommand):
+    """
+    Base dos comandos de medição do chat, que criam usuários, conversas e
+    mensagens no banco configurado. Só rodam com DEBUG ligado ou com
+    --permitir-banco-real, para não poluírem o banco de produção por engano.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--permitir-banco-real', action='store_true',
+            help='Roda mesmo com DEBUG desligado (os dados temporários são gravados no banco configurado).'
+        )
+
+    def execute(self, *args, **options):
+        if not settings.DEBUG and not options.get('permitir_banco_real'):
+            raise CommandError(
+                'Este comando grava dados temporários no banco configurado e só roda com DEBUG ligado. '
+                'Use --permitir-banco-real para rodá-lo mesmo assim.'
+            )
+        return super().execute(*args, **options)
@@ -0,0 +1,38 @@
+# Em apps/chat/metricas.py
+
+import statistics
+
+
+def percentil(valores, p):
+    """
+    Percentil 'p' (0-100) por interpolação linear; 0 para lista vazia.
+    """
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    posicao = (len(ordenados) - 1) * p / 100
+    inferior = int(posicao)
+    superior = min(inferior + 1, len(ordenados) - 1)
+    return ordenados[inferior] + (ordenados[superior] - ordenados[inferior]) * (posicao - inferior)
+
+
+def resumo_latencias(valores):
+    """
+    Resumo em milissegundos de uma lista de latências em segundos.
+    """
+    return {
+        'n': len(valores),
+        'media': statistics.fmean(valores) * 1000 if valores else 0.0,
+        'p50': percentil(valores, 50) * 1000,
+        'p95': percentil(valores, 95) * 1000,
+        'p99': percentil(valores, 99) * 1000,
+        'max': max(valores) * 1000 if valores else 0.0,
+    }
+
+
+def formatar_resumo(nome, resumo):
+    return (
+        f"{nome:<28} n={resumo['n']:<6} média={resumo['media']:8.2f}ms "
+        f"p50={resumo['p50']:8.2f}ms p95={resumo['p95']:8.2f}ms "
+        f"p99={resumo['p99']:8.2f}ms max={resumo['max']:8.2f}ms"
+    )
@@ -51,3 +51,7 @@ class Mensagem(models.Model):
         verbose_name = "Mensagem"
         verbose_name_plural = "Mensagens"
         ordering = ['timestamp']
+        indexes = [
+            # Páginas do histórico por (timestamp, id) dentro da conversa
+            models.Index(fields=['conversa', 'timestamp'], name='chat_msg_conversa_ts_idx'),
+        ]
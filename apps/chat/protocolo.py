@@ -0,0 +1,51 @@
+# Em apps/chat/protocolo.py
+
+import json
+
+import msgpack
+
+from .historico import nome_autor, serializar_mensagem
+
+# Subprotocolo WebSocket opcional: o cliente que o oferece recebe quadros
+# binários em MessagePack; os demais continuam recebendo JSON.
+SUBPROTOCOLO_MSGPACK = 'chat.msgpack'
+
+
+def mensagem_compacta(mensagem):
+    """
+    Mensagem no formato binário: [id, id do autor, nome do autor, texto,
+    timestamp em milissegundos desde a época]. O cliente formata a data no
+    próprio fuso e calcula 'is_me' comparando o id do autor com o seu.
+    """
+    return [
+        mensagem.id,
+        mensagem.autor_id,
+        nome_autor(mensagem.autor),
+        mensagem.texto,
+        int(mensagem.timestamp.timestamp() * 1000),
+    ]
+
+
+def empacotar(quadro):
+    return msgpack.packb(quadro, use_bin_type=True)
+
+
+def desempacotar(dados):
+    return msgpack.unpackb(dados, raw=False)
+
+
+def evento_de_transmissao(mensagem):
+    """
+    Evento de group_send para uma nova mensagem, com todas as codificações
+    prontas: o quadro MessagePack e as duas variantes JSON (para o autor e
+    para os demais, que só diferem em 'is_me'). Cada consumer apenas escolhe
+    qual enviar; nada é copiado nem serializado por destinatário.
+    """
+    dados = serializar_mensagem(mensagem)
+    return {
+        'type': 'chat_message',
+        'autor_id': mensagem.autor_id,
+        'json_autor': json.dumps({**dados, 'is_me': True}),
+        'json_demais': json.dumps({**dados, 'is_me': False}),
+        'msgpack': empacotar({'type': 'message', 'message': mensagem_compacta(mensagem)}),
+    }
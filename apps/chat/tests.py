@@ -1,3 +1,178 @@
-from django.test import TestCase
+import datetime
+import json
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from apps.users.models import UsuarioSistema
+
+from .consumers import ChatConsumer
+from .models import Conversa, Mensagem
+from .protocolo import SUBPROTOCOLO_MSGPACK
+
+CAMADA_EM_MEMORIA = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+# TransactionTestCase: o consumer acessa o banco pelo pool de threads do
+# chat (db.py), com conexões próprias que não enxergariam a transação do TestCase.
+@override_settings(
+    CHANNEL_LAYERS=CAMADA_EM_MEMORIA, CHAT_TAMANHO_PAGINA_HISTORICO=3, CHAT_LIMITE_RECUPERACAO=4
+)
+class ChatConsumerTests(TransactionTestCase):
+    """
+    Conexão, histórico paginado por (timestamp, id), recuperação após
+    reconexão, subprotocolo MessagePack e transmissão pré-codificada.
+    """
+    def setUp(self):
+        self.autor = UsuarioSistema.objects.create_user('12345', 'senha', email='autor@teste.com')
+        self.colega = UsuarioSistema.objects.create_user('67890', 'senha', email='colega@teste.com')
+        self.estranho = UsuarioSistema.objects.create_user('00000', 'senha', email='estranho@teste.com')
+        self.conversa = Conversa.objects.create()
+        self.conversa.participantes.add(self.autor, self.colega)
+
+        # Sete mensagens; as três primeiras (e as duas últimas) têm o mesmo timestamp.
+        # O cursor da segunda página cai no meio das primeiras: só o id desempata.
+        inicio = timezone.now() - datetime.timedelta(hours=1)
+        self.mensagens = [
+            Mensagem.objects.create(conversa=self.conversa, autor=self.autor, texto=f'mensagem {indice}')
+            for indice in range(7)
+        ]
+        for indice, mensagem in enumerate(self.mensagens):
+            instante = inicio + datetime.timedelta(minutes=min(max(indice, 2), 5))
+            Mensagem.objects.filter(pk=mensagem.pk).update(timestamp=instante)
+
+    def _comunicador(self, usuario, consulta='', binario=False):
+        comunicador = WebsocketCommunicator(
+            ChatConsumer.as_asgi(), f'/ws/chat/{self.conversa.pk}/{consulta}',
+            subprotocols=[SUBPROTOCOLO_MSGPACK] if binario else None
+        )
+        comunicador.scope['user'] = usuario
+        comunicador.scope['url_route'] = {'kwargs': {'conversa_id': str(self.conversa.pk)}}
+        return comunicador
+
+    async def _conectar(self, usuario, consulta='', binario=False):
+        comunicador = self._comunicador(usuario, consulta, binario)
+        conectado, subprotocolo = await comunicador.connect()
+        self.assertTrue(conectado)
+        self.assertEqual(subprotocolo, SUBPROTOCOLO_MSGPACK if binario else None)
+        return comunicador
+
+    def _ids(self, quadro):
+        return [mensagem['id'] for mensagem in quadro['history']]
+
+    async def test_historico_paginado_por_timestamp_e_id(self):
+        comunicador = await self._conectar(self.autor)
+        ids = [mensagem.pk for mensagem in self.mensagens]
+
+        pagina = await comunicador.receive_json_from()
+        self.assertEqual((pagina['type'], self._ids(pagina), pagina['has_more']), ('message_history', ids[4:], True))
+
+        await comunicador.send_json_to({'type': 'load_older', 'cursor': pagina['cursor']})
+        pagina = await comunicador.receive_json_from()
+        self.assertEqual((pagina['type'], self._ids(pagina), pagina['has_more']), ('older_messages', ids[1:4], True))
+
+        await comunicador.send_json_to({'type': 'load_older', 'cursor': pagina['cursor']})
+        pagina = await comunicador.receive_json_from()
+        self.assertEqual((self._ids(pagina), pagina['has_more'], pagina['cursor']), (ids[:1], False, None))
+
+        # Cursor inválido: nada é enviado
+        await comunicador.send_json_to({'type': 'load_older', 'cursor': 'invalido'})
+        self.assertTrue(await comunicador.receive_nothing())
+        await comunicador.disconnect()
+
+    async def test_reconexao_recebe_so_as_mensagens_posteriores(self):
+        ids = [mensagem.pk for mensagem in self.mensagens]
+        comunicador = await self._conectar(self.autor, f'?after={ids[3]}')
+        quadro = await comunicador.receive_json_from()
+        self.assertEqual((quadro['type'], self._ids(quadro)), ('catch_up', ids[4:]))
+        self.assertTrue(all(mensagem['is_me'] for mensagem in quadro['history']))
+        await comunicador.disconnect()
+
+        # Mais mensagens perdidas que CHAT_LIMITE_RECUPERACAO: o cliente deve recarregar
+        comunicador = await self._conectar(self.colega, f'?after={ids[0]}')
+        self.assertEqual(await comunicador.receive_json_from(), {'type': 'resync_required'})
+        await comunicador.disconnect()
+
+    async def test_nao_participante_e_recusado_na_conexao(self):
+        for usuario in (self.estranho, AnonymousUser()):
+            conectado, _ = await self._comunicador(usuario).connect()
+            self.assertFalse(conectado)
+
+    async def test_subprotocolo_msgpack(self):
+        comunicador = await self._conectar(self.colega, binario=True)
+        quadro = msgpack.unpackb(await comunicador.receive_from(), raw=False)
+        self.assertEqual(quadro['type'], 'message_history')
+        # Formato compacto: [id, id do autor, nome, texto, timestamp em ms]
+        ultima = self.mensagens[-1]
+        self.assertEqual(quadro['history'][-1][:4], [ultima.pk, self.autor.pk, '12345', 'mensagem 6'])
+
+        await comunicador.send_to(bytes_data=msgpack.packb({'type': 'load_older', 'cursor': quadro['cursor']}))
+        quadro = msgpack.unpackb(await comunicador.receive_from(), raw=False)
+        self.assertEqual(quadro['type'], 'older_messages')
+        await comunicador.disconnect()
+
+    async def test_transmissao_pre_codificada_para_cada_protocolo(self):
+        autor = await self._conectar(self.autor)
+        colega_json = await self._conectar(self.colega)
+        colega_msgpack = await self._conectar(self.colega, binario=True)
+        for comunicador in (autor, colega_json, colega_msgpack):
+            await comunicador.receive_output()  # histórico inicial
+
+        # Cada destinatário só escolhe um dos quadros do evento: nada é serializado por socket
+        nao_serializar = mock.Mock(side_effect=AssertionError('serialização por destinatário'))
+        with mock.patch('apps.chat.consumers.serializar_mensagem', nao_serializar), \
+                mock.patch('apps.chat.consumers.mensagem_compacta', nao_serializar):
+            await autor.send_json_to({'message': 'nova'})
+            para_autor = await autor.receive_json_from()
+            para_colega = await colega_json.receive_json_from()
+            binario = msgpack.unpackb(await colega_msgpack.receive_from(), raw=False)
+
+        self.assertEqual((para_autor['message'], para_autor['is_me']), ('nova', True))
+        self.assertEqual({**para_colega, 'is_me': True}, para_autor)
+        self.assertEqual(binario['type'], 'message')
+        self.assertEqual(binario['message'][:4], [para_autor['id'], self.autor.pk, '12345', 'nova'])
+        for comunicador in (autor, colega_json, colega_msgpack):
+            await comunicador.disconnect()
+
+    async def test_quadro_invalido_e_ignorado(self):
+        comunicador = await self._conectar(self.autor, binario=True)
+        await comunicador.receive_from()
+
+        await comunicador.send_to(bytes_data=msgpack.packb([1, 2, 3]))
+        await comunicador.send_to(bytes_data=msgpack.packb('texto'))
+        await comunicador.send_to(bytes_data=b'\xc1')  # código reservado do MessagePack
+        await comunicador.send_to(bytes_data=msgpack.packb({'message': 'x'}) + b'\x00')
+        await comunicador.send_to(bytes_data=msgpack.packb({'message': 123}))
+        await comunicador.send_to(bytes_data=msgpack.packb({'message': ['lista']}))
+        self.assertTrue(await comunicador.receive_nothing())
+
+        # A conexão continua funcionando
+        await comunicador.send_to(bytes_data=msgpack.packb({'message': 'depois'}))
+        quadro = msgpack.unpackb(await comunicador.receive_from(), raw=False)
+        self.assertEqual(quadro['message'][3], 'depois')
+        await comunicador.disconnect()
+
+        comunicador = await self._conectar(self.autor)
+        await comunicador.receive_from()
+        await comunicador.send_to(text_data=json.dumps([{'message': 'lista'}]))
+        await comunicador.send_to(text_data='{"message": ')
+        await comunicador.send_to(text_data=json.dumps({'message': None}))
+        self.assertTrue(await comunicador.receive_nothing())
+        await comunicador.disconnect()
+        self.assertFalse(await Mensagem.objects.filter(texto='lista').aexists())
+
+
+class ComandosMedicaoTests(SimpleTestCase):
+    """
+    Os comandos de medição gravam dados no banco configurado: com DEBUG
+    desligado, recusam rodar (antes de qualquer consulta) sem --permitir-banco-real.
+    """
+    def test_recusa_sem_debug(self):
+        for comando in ('teste_carga_chat', 'medir_executor_chat'):
+            with self.subTest(comando=comando), self.assertRaisesMessage(CommandError, '--permitir-banco-real'):
+                call_command(comando)
@@ -8,6 +8,8 @@ from django.db.models import Q
 from django.urls import reverse
 from django.http import JsonResponse
 
+from apps.core.permissoes import grupos_do_usuario
+from .historico import pagina_historico, serializar_mensagem
 from .models import Conversa
 
 UsuarioSistema = get_user_model()
@@ -19,7 +21,7 @@ class ChatHomeView(LoginRequiredMixin, View):
         conversas_existentes = Conversa.objects.filter(participantes=request.user).prefetch_related('participantes')
         user = request.user
         usuarios_contactaveis = UsuarioSistema.objects.none()
-        user_groups = [group.name for group in user.groups.all()]
+        user_groups = grupos_do_usuario(user)
 
         if 'Almoxarifes' in user_groups or 'Administradores' in user_groups or user.is_superuser:
             usuarios_contactaveis = UsuarioSistema.objects.exclude(pk=user.pk)
@@ -56,19 +58,21 @@ class IniciarConversaView(LoginRequiredMixin, View):
 
 # --- NOVA VIEW PARA O HISTÓRICO ---
 class ConversaHistoryView(LoginRequiredMixin, View):
+    """
+    Histórico paginado por chave: as últimas mensagens ou, com ?antes=<cursor>,
+    a página anterior ao cursor devolvido na resposta anterior.
+    """
     def get(self, request, *args, **kwargs):
         conversa_id = self.kwargs.get('conversa_id')
         conversa = get_object_or_404(Conversa, pk=conversa_id, participantes=request.user)
-        
-        mensagens = conversa.mensagens.order_by('timestamp').select_related('autor__funcionario')
-        
-        # Formata os dados para serem enviados como JSON
-        historico = []
-        for msg in mensagens:
-            historico.append({
-                'user': msg.autor.funcionario.nome if msg.autor.funcionario else msg.autor.username,
-                'message': msg.texto,
-                'timestamp': msg.timestamp.strftime('%d/%m/%Y %H:%M')
-            })
-            
-        return JsonResponse({'historico': historico})
\ No newline at end of file
+
+        try:
+            mensagens, tem_mais, cursor = pagina_historico(conversa.pk, request.GET.get('antes'))
+        except ValueError:
+            return JsonResponse({'erro': 'Cursor inválido.'}, status=400)
+
+        return JsonResponse({
+            'historico': [serializar_mensagem(msg, request.user) for msg in mensagens],
+            'tem_mais': tem_mais,
+            'cursor': cursor,
+        })
@@ -0,0 +1,149 @@
+# Em apps/core/cache_pdf.py
+
+import functools
+import hashlib
+import io
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.http import FileResponse
+from django.template.loader import get_template
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+TAMANHO_MAXIMO_PADRAO = 200 * 1024 * 1024  # bytes
+
+
+def _diretorio():
+    return settings.PDF_CACHE_DIR
+
+
+def _versao_template(nome_template):
+    # Hash do código-fonte do template: editar o template muda as chaves e
+    # os PDFs antigos deixam de ser usados (e saem na limpeza por tamanho).
+    return hashlib.sha256(get_template(nome_template).template.source.encode()).hexdigest()[:16]
+
+
+_versao_template_em_cache = functools.lru_cache(maxsize=None)(_versao_template)
+
+
+def versao_template(nome_template):
+    """
+    Versão do template, calculada uma vez por processo (a cada chamada em
+    DEBUG, quando os templates mudam sem reiniciar o servidor).
+    """
+    if settings.DEBUG:
+        return _versao_template(nome_template)
+    return _versao_template_em_cache(nome_template)
+
+
+def chave_pdf(nome_template, dados):
+    """
+    Chave do PDF no cache: hash da versão do template e dos dados que o
+    determinam ('dados' é texto: o HTML já renderizado ou uma assinatura
+    estável do objeto, quando ele não muda mais).
+    """
+    conteudo = f"{nome_template}\n{versao_template(nome_template)}\n{dados}"
+    return hashlib.sha256(conteudo.encode()).hexdigest()
+
+
+def _caminho(chave):
+    return os.path.join(_diretorio(), chave[:2], f'{chave}.pdf')
+
+
+def _abrir(chave):
+    """
+    Abre o PDF em cache e marca o acesso (atime, usado pela limpeza LRU),
+    preservando o mtime, que é a data de geração. Retorna (arquivo, mtime)
+    ou (None, None).
+    """
+    caminho = _caminho(chave)
+    try:
+        arquivo = open(caminho, 'rb')
+    except FileNotFoundError:
+        return None, None
+    modificado = os.fstat(arquivo.fileno()).st_mtime
+    try:
+        os.utime(caminho, (time.time(), modificado))
+    except OSError:
+        pass
+    return arquivo, modificado
+
+
+def _gravar(chave, pdf):
+    caminho = _caminho(chave)
+    os.makedirs(os.path.dirname(caminho), exist_ok=True)
+    # Grava em um arquivo temporário e renomeia: quem lê nunca vê um PDF pela metade
+    descritor, temporario = tempfile.mkstemp(dir=os.path.dirname(caminho), suffix='.tmp')
+    with os.fdopen(descritor, 'wb') as arquivo:
+        arquivo.write(pdf)
+    os.replace(temporario, caminho)
+    limpar_cache_pdf()
+
+
+def limpar_cache_pdf(tamanho_maximo=None):
+    """
+    Remove os PDFs acessados há mais tempo até o cache ficar abaixo de 90%
+    de PDF_CACHE_TAMANHO_MAXIMO bytes. Retorna o número de arquivos removidos.
+    """
+    if tamanho_maximo is None:
+        tamanho_maximo = getattr(settings, 'PDF_CACHE_TAMANHO_MAXIMO', TAMANHO_MAXIMO_PADRAO)
+    arquivos = []
+    for raiz, _, nomes in os.walk(_diretorio()):
+        for nome in nomes:
+            caminho = os.path.join(raiz, nome)
+            try:
+                info = os.stat(caminho)
+            except FileNotFoundError:
+                continue
+            arquivos.append((info.st_atime, info.st_size, caminho))
+
+    total = sum(tamanho for _, tamanho, _ in arquivos)
+    if total <= tamanho_maximo:
+        return 0
+
+    removidos = 0
+    for _, tamanho, caminho in sorted(arquivos):
+        if total <= tamanho_maximo * 0.9:
+            break
+        try:
+            os.remove(caminho)
+        except FileNotFoundError:
+            pass
+        total -= tamanho
+        removidos += 1
+    return removidos
+
+
+def resposta_pdf(request, chave, gerar, nome_arquivo):
+    """
+    Responde com o PDF da 'chave', servido do disco. Só chama gerar()
+    (que devolve os bytes do PDF) quando ele ainda não está em cache.
+    Envia ETag e Last-Modified e responde 304 quando o navegador já tem
+    essa versão; como a chave depende do conteúdo, um ETag igual garante
+    o mesmo PDF, mesmo que o arquivo já tenha saído do cache.
+    """
+    etag = f'"{chave}"'
+    if request.method in ('GET', 'HEAD'):
+        nao_modificado = get_conditional_response(request, etag=etag)
+        if nao_modificado is not None:
+            return nao_modificado
+
+    arquivo, modificado = _abrir(chave)
+    if arquivo is None:
+        pdf = gerar()
+        _gravar(chave, pdf)
+        arquivo, modificado = _abrir(chave)
+        if arquivo is None:
+            # Já removido pela limpeza (cache menor que o próprio PDF)
+            arquivo, modificado = io.BytesIO(pdf), time.time()
+
+    response = FileResponse(arquivo, content_type='application/pdf')
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(modificado)
+    # Documento de usuário autenticado: o navegador guarda, mas revalida
+    response['Cache-Control'] = 'private, no-cache'
+    response['Content-Disposition'] = f'inline; filename="{nome_arquivo}"'
+    return response
@@ -13,7 +13,8 @@ from apps.materiais.models import (
     MovimentoEstoque,
     PosicaoEstoqueMensal,
     Produto,
-    Requisicao
+    Requisicao,
+    SaldoProduto
 )
 
 class Command(BaseCommand):
@@ -44,6 +45,7 @@ class Command(BaseCommand):
 
             # Movimentações e Transações
             MovimentoEstoque,
+            SaldoProduto,
             ItemRequisicao,
             Requisicao,
             PosicaoEstoqueMensal,
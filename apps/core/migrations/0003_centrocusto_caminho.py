@@ -0,0 +1,54 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:34
+
+from django.db import migrations, models
+
+
+def preencher_caminhos(apps, schema_editor):
+    # Caminho e nível dos centros de custo já cadastrados, descendo a partir
+    # das raízes. Um centro que não seja alcançado (hierarquia circular
+    # gravada antes desta migração) vira raiz.
+    CentroCusto = apps.get_model('core', 'CentroCusto')
+    filhos = {}
+    for pk, parent_id in CentroCusto.objects.values_list('pk', 'parent_id'):
+        filhos.setdefault(parent_id, []).append(pk)
+
+    caminhos = {}
+    pendentes = [(pk, '/', 0) for pk in filhos.get(None, [])]
+    todos = {pk for lista in filhos.values() for pk in lista}
+    while pendentes or len(caminhos) < len(todos):
+        if not pendentes:
+            raiz = min(todos - caminhos.keys())
+            pendentes = [(raiz, '/', 0)]
+        pk, caminho_pai, profundidade = pendentes.pop()
+        if pk in caminhos:
+            continue
+        caminhos[pk] = (f'{caminho_pai}{pk}/', profundidade)
+        pendentes.extend((filho, caminhos[pk][0], profundidade + 1) for filho in filhos.get(pk, []))
+
+    centros = list(CentroCusto.objects.all())
+    for centro in centros:
+        centro.caminho, centro.profundidade = caminhos[centro.pk]
+        if centro.profundidade == 0:
+            centro.parent_id = None
+    CentroCusto.objects.bulk_update(centros, ['caminho', 'profundidade', 'parent'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_centrocusto'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='centrocusto',
+            name='caminho',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255, verbose_name='Caminho na Hierarquia'),
+        ),
+        migrations.AddField(
+            model_name='centrocusto',
+            name='profundidade',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Nível'),
+        ),
+        migrations.RunPython(preencher_caminhos, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,10 @@
-from django.db import models
+from functools import reduce
+import operator
+
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Q, Value
+from django.db.models.functions import Concat, Substr
 
 # Create your models here.
 
@@ -53,9 +59,29 @@ from django.db import models
 
 # --- ADICIONE O NOVO MODELO ABAIXO ---
 
+class CentroCustoQuerySet(models.QuerySet):
+    def com_subordinados(self):
+        """
+        Os centros de custo deste queryset e todos os que estão abaixo deles
+        na hierarquia: busca os caminhos dos selecionados e filtra pelo
+        prefixo, no índice de 'caminho', sem descer nível por nível. Pode ser
+        usado direto em filtros: centro_custo__in=....com_subordinados().
+        """
+        caminhos = [caminho for caminho in self.values_list('caminho', flat=True) if caminho]
+        if not caminhos:
+            return self.none()
+        filtro = reduce(operator.or_, (Q(caminho__startswith=caminho) for caminho in caminhos))
+        return CentroCusto.objects.filter(filtro)
+
+
 class CentroCusto(models.Model):
     """
     Representa uma unidade organizacional (Diretoria, Lotação, Divisão).
+
+    A hierarquia fica também materializada em 'caminho' ('/1/5/12/': os ids
+    da raiz até o próprio centro), mantido pelo save(). Assim, "tudo abaixo
+    da Diretoria X" é um filtro indexado por prefixo, sem percorrer os
+    níveis um a um (ver CentroCustoQuerySet.com_subordinados).
     """
     nome = models.CharField(max_length=255, unique=True, verbose_name="Nome da Unidade")
     
@@ -69,6 +95,12 @@ class CentroCusto(models.Model):
         related_name='children',
         verbose_name="Unidade Superior (Pai)"
     )
+    caminho = models.CharField(
+        "Caminho na Hierarquia", max_length=255, db_index=True, editable=False, default=''
+    )
+    profundidade = models.PositiveSmallIntegerField("Nível", default=0, editable=False)
+
+    objects = CentroCustoQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Centro de Custo"
@@ -77,3 +109,44 @@ class CentroCusto(models.Model):
 
     def __str__(self):
         return self.nome
+
+    def clean(self):
+        super().clean()
+        if self.pk and self.parent_id and self._eh_subordinado(self.parent_id):
+            raise ValidationError({'parent': "A unidade superior não pode ser a própria unidade nem uma unidade abaixo dela."})
+
+    def _eh_subordinado(self, outro_id):
+        caminho_do_outro = CentroCusto.objects.filter(pk=outro_id).values_list('caminho', flat=True).first() or ''
+        return f"/{self.pk}/" in caminho_do_outro or outro_id == self.pk
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            antigo = None
+            if self.pk:
+                antigo = CentroCusto.objects.filter(pk=self.pk).values_list('caminho', 'profundidade').first()
+                if self.parent_id and self._eh_subordinado(self.parent_id):
+                    raise ValueError("Hierarquia circular: a unidade superior está abaixo desta unidade.")
+            super().save(*args, **kwargs)
+
+            caminho_pai, profundidade = '/', 0
+            if self.parent_id:
+                caminho_pai, nivel_pai = CentroCusto.objects.values_list('caminho', 'profundidade').get(pk=self.parent_id)
+                profundidade = nivel_pai + 1
+            caminho = f"{caminho_pai}{self.pk}/"
+            if antigo == (caminho, profundidade):
+                return
+
+            CentroCusto.objects.filter(pk=self.pk).update(caminho=caminho, profundidade=profundidade)
+            if antigo and antigo[0]:
+                CentroCusto._mover_subordinados(antigo[0], caminho, profundidade - antigo[1])
+            self.caminho, self.profundidade = caminho, profundidade
+
+    @staticmethod
+    def _mover_subordinados(caminho_antigo, caminho_novo, variacao_nivel):
+        """
+        Troca o prefixo do caminho de toda a subárvore em um único UPDATE.
+        """
+        CentroCusto.objects.filter(caminho__startswith=caminho_antigo).exclude(caminho=caminho_antigo).update(
+            caminho=Concat(Value(caminho_novo), Substr('caminho', len(caminho_antigo) + 1)),
+            profundidade=models.F('profundidade') + variacao_nivel,
+        )
@@ -0,0 +1,200 @@
+# Em apps/core/pdf.py
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+PROCESSOS_PADRAO = 2
+CONCORRENCIA_PADRAO = 4
+TIMEOUT_PADRAO = 30  # segundos
+
+_pool = None
+_trava = threading.Lock()
+_vagas = None
+
+# Só existe dentro dos processos do pool (ver _iniciar_processo)
+_HTML = None
+
+
+class RenderizacaoPDFError(RuntimeError):
+    """
+    O PDF não pôde ser gerado: fila cheia, tempo esgotado ou falha no
+    processo de renderização.
+    """
+
+
+def _carregar_weasyprint():
+    # O WeasyPrint (e as fontes) é carregado aqui, e não nos processos web.
+    global _HTML
+    from weasyprint import HTML
+    HTML(string='<p></p>').write_pdf()
+    _HTML = HTML
+
+
+def _iniciar_processo(fila_pids):
+    # Roda uma vez em cada processo do pool: avisa o processo web de que
+    # existe (ver _PoolPDF) e pré-carrega o WeasyPrint.
+    fila_pids.put(os.getpid())
+    _carregar_weasyprint()
+
+
+def _renderizar(html, base_url):
+    if _HTML is None:
+        _carregar_weasyprint()
+    return _HTML(string=html, base_url=base_url).write_pdf()
+
+
+class _Aposentadoria:
+    """
+    Controle das renderizações em andamento de um pool. Um pool aposentado
+    (com uma renderização presa ou quebrado) deixa de receber PDFs novos,
+    mas só é encerrado quando as únicas tarefas que restam nele são as
+    presas: os PDFs dos outros usuários em andamento terminam normalmente.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._trava_tarefas = threading.Lock()
+        self.tarefas = set()
+        self.presas = set()
+        self.aposentado = False
+        self.encerrado = False
+
+    def registrar(self, futuro):
+        with self._trava_tarefas:
+            self.tarefas.add(futuro)
+
+    def aposentar(self, preso=None):
+        with self._trava_tarefas:
+            self.aposentado = True
+            if preso is not None:
+                self.presas.add(preso)
+        self._encerrar_se_ocioso()
+
+    def liberar(self, futuro):
+        with self._trava_tarefas:
+            if futuro not in self.presas:
+                self.tarefas.discard(futuro)
+        self._encerrar_se_ocioso()
+
+    def _encerrar_se_ocioso(self):
+        with self._trava_tarefas:
+            if self.encerrado or not self.aposentado or not self.tarefas <= self.presas:
+                return
+            self.encerrado = True
+        # O ProcessPoolExecutor não interrompe tarefas em andamento: os
+        # processos (agora só os presos ou ociosos) são terminados.
+        for processo in self.processos():
+            processo.terminate()
+        self.shutdown(wait=False, cancel_futures=True)
+
+
+class _PoolPDF(_Aposentadoria, ProcessPoolExecutor):
+    """
+    Pool de processos que sabe quais são os seus processos: cada um informa
+    o próprio PID ao iniciar, e processos() os cruza com os filhos vivos
+    (multiprocessing.active_children), sem depender de atributos internos
+    do ProcessPoolExecutor.
+    """
+
+    def __init__(self, max_workers):
+        # 'spawn': os processos do pool não herdam conexões nem threads
+        # do processo web, e o comportamento é o mesmo no Windows.
+        contexto = multiprocessing.get_context('spawn')
+        self.fila_pids = contexto.SimpleQueue()
+        self.pids = set()
+        super().__init__(
+            max_workers=max_workers,
+            mp_context=contexto,
+            initializer=_iniciar_processo,
+            initargs=(self.fila_pids,),
+        )
+
+    def processos(self):
+        while not self.fila_pids.empty():
+            self.pids.add(self.fila_pids.get())
+        return [processo for processo in multiprocessing.active_children() if processo.pid in self.pids]
+
+
+def _processos():
+    return getattr(settings, 'PDF_PROCESSOS', PROCESSOS_PADRAO)
+
+
+def _obter_vagas():
+    global _vagas
+    with _trava:
+        if _vagas is None:
+            _vagas = threading.BoundedSemaphore(getattr(settings, 'PDF_CONCORRENCIA', CONCORRENCIA_PADRAO))
+        return _vagas
+
+
+def _submeter(html, base_url):
+    """
+    Envia a renderização ao pool vigente (criando-o se preciso). Feito sob
+    a trava, para que nenhuma tarefa chegue a um pool já aposentado.
+    """
+    global _pool
+    with _trava:
+        if _pool is None:
+            _pool = _PoolPDF(max_workers=_processos())
+        pool = _pool
+        try:
+            futuro = pool.submit(_renderizar, html, base_url)
+        except BrokenProcessPool:
+            _pool = None
+            pool.aposentar()
+            raise
+        pool.registrar(futuro)
+        return pool, futuro
+
+
+def _aposentar_pool(pool, preso=None):
+    """
+    Tira um pool travado ou quebrado de uso (o próximo PDF cria outro); ele
+    é encerrado quando as renderizações que ainda estão nele terminarem.
+    """
+    global _pool
+    with _trava:
+        if _pool is pool:
+            _pool = None
+    pool.aposentar(preso)
+
+
+def renderizar_pdf(html, base_url=None):
+    """
+    Converte o HTML (já renderizado pelo template) em PDF em um dos
+    processos do pool, com WeasyPrint pré-carregado. No máximo
+    PDF_CONCORRENCIA PDFs ficam em andamento ou na fila; quem passar disso,
+    ou esperar mais que PDF_TIMEOUT segundos, recebe RenderizacaoPDFError.
+
+    Com PDF_PROCESSOS = 0 a renderização é feita no próprio processo (útil
+    em desenvolvimento), mas o WeasyPrint continua sendo importado só aqui.
+    """
+    if _processos() == 0:
+        return _renderizar(html, base_url)
+
+    timeout = getattr(settings, 'PDF_TIMEOUT', TIMEOUT_PADRAO)
+    vagas = _obter_vagas()
+    if not vagas.acquire(blocking=False):
+        raise RenderizacaoPDFError("Há muitos PDFs sendo gerados no momento. Tente novamente em instantes.")
+    pool = futuro = None
+    try:
+        pool, futuro = _submeter(html, base_url)
+        return futuro.result(timeout=timeout)
+    except FuturesTimeoutError:
+        if not futuro.cancel():
+            _aposentar_pool(pool, preso=futuro)
+        raise RenderizacaoPDFError(f"A geração do PDF excedeu {timeout} segundos.")
+    except BrokenProcessPool:
+        if pool is not None:
+            _aposentar_pool(pool)
+        raise RenderizacaoPDFError("O processo de geração de PDF falhou. Tente novamente.")
+    finally:
+        if futuro is not None:
+            pool.liberar(futuro)
+        vagas.release()
@@ -0,0 +1,58 @@
+# Em apps/core/permissoes.py
+
+from django.contrib.auth.mixins import UserPassesTestMixin
+
+GRUPO_ADMINISTRADORES = 'Administradores'
+GRUPO_ALMOXARIFES = 'Almoxarifes'
+GRUPO_REQUISITANTES = 'Requisitantes'
+
+# Quem opera o estoque: atendimentos, entradas, relatórios
+GRUPOS_GESTAO = (GRUPO_ADMINISTRADORES, GRUPO_ALMOXARIFES)
+
+ATRIBUTO_CACHE = '_nomes_grupos'
+
+
+def grupos_do_usuario(user):
+    """
+    Nomes dos grupos do usuário, buscados uma única vez e guardados no
+    próprio objeto. Como o request.user é carregado a cada requisição, o
+    cache vale para a requisição inteira: test_func, views e templates
+    compartilham a mesma consulta.
+    """
+    if not user.is_authenticated:
+        return frozenset()
+    grupos = getattr(user, ATRIBUTO_CACHE, None)
+    if grupos is None:
+        grupos = frozenset(user.groups.values_list('name', flat=True))
+        setattr(user, ATRIBUTO_CACHE, grupos)
+    return grupos
+
+
+def pertence_a(user, *nomes_grupos):
+    """
+    Indica se o usuário pertence a pelo menos um dos grupos informados.
+    """
+    return not grupos_do_usuario(user).isdisjoint(nomes_grupos)
+
+
+def eh_gestor(user):
+    """
+    Superusuário, administrador ou almoxarife.
+    """
+    return user.is_superuser or pertence_a(user, *GRUPOS_GESTAO)
+
+
+class GrupoRequeridoMixin(UserPassesTestMixin):
+    """
+    Libera a view para os usuários de algum dos 'grupos_permitidos'
+    (e para superusuários, se 'permitir_superusuario').
+    Views com regras extras podem sobrescrever test_func e chamar super().
+    """
+    grupos_permitidos = GRUPOS_GESTAO
+    permitir_superusuario = True
+
+    def test_func(self):
+        user = self.request.user
+        if self.permitir_superusuario and user.is_superuser:
+            return True
+        return pertence_a(user, *self.grupos_permitidos)
@@ -0,0 +1,15 @@
+# Em apps/core/signals.py
+
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from .models import CentroCusto
+
+
+@receiver(pre_delete, sender=CentroCusto)
+def centro_custo_excluido(sender, instance, **kwargs):
+    # Os filhos ficam sem unidade superior (on_delete=SET_NULL): viram raízes
+    # antes da exclusão, para que o caminho deles e da subárvore seja refeito
+    for filho in instance.children.all():
+        filho.parent = None
+        filho.save(update_fields=['parent'])
@@ -1,5 +1,7 @@
 from django import template
 
+from apps.core.permissoes import eh_gestor, pertence_a
+
 # Cria uma instância da biblioteca de templates onde nossos filtros serão registrados
 register = template.Library()
 
@@ -9,5 +11,21 @@ def has_group(user, group_name):
     Verifica se um usuário pertence a um grupo específico.
     Uso no template: {% if user|has_group:'NomeDoGrupo' %}
     """
-    # Retorna True se o usuário tiver um grupo com o nome passado, senão False
-    return user.groups.filter(name=group_name).exists()
\ No newline at end of file
+    # Os grupos do usuário são lidos uma vez por requisição (apps.core.permissoes)
+    return pertence_a(user, group_name)
+
+@register.filter(name='has_any_group')
+def has_any_group(user, group_names):
+    """
+    Verifica se um usuário pertence a algum dos grupos separados por vírgula.
+    Uso no template: {% if user|has_any_group:'Almoxarifes,Administradores' %}
+    """
+    return pertence_a(user, *(nome.strip() for nome in group_names.split(',')))
+
+@register.filter(name='is_gestor')
+def is_gestor(user):
+    """
+    Superusuário, administrador ou almoxarife.
+    Uso no template: {% if user|is_gestor %}
+    """
+    return eh_gestor(user)
@@ -1,3 +1,269 @@
-from django.test import TestCase
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.core.exceptions import ValidationError
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from apps.users.models import UsuarioSistema
+
+from . import cache_pdf, pdf
+from .models import CentroCusto
+
+
+class CentroCustoHierarquiaTests(TestCase):
+    """
+    O caminho materializado acompanha criação, mudança de unidade superior
+    e exclusão, e com_subordinados() devolve subárvores inteiras.
+    """
+
+    def setUp(self):
+        self.diretoria = CentroCusto.objects.create(nome='Diretoria')
+        self.lotacao = CentroCusto.objects.create(nome='Lotação', parent=self.diretoria)
+        self.divisao = CentroCusto.objects.create(nome='Divisão', parent=self.lotacao)
+        self.outra = CentroCusto.objects.create(nome='Outra Diretoria')
+
+    def _caminho(self, centro):
+        centro.refresh_from_db()
+        return centro.caminho, centro.profundidade
+
+    def test_caminho_na_criacao(self):
+        d, l, v = self.diretoria.pk, self.lotacao.pk, self.divisao.pk
+        self.assertEqual(self._caminho(self.divisao), (f'/{d}/{l}/{v}/', 2))
+        self.assertEqual(self._caminho(self.outra), (f'/{self.outra.pk}/', 0))
+
+    def test_mover_reescreve_a_subarvore(self):
+        self.lotacao.parent = self.outra
+        self.lotacao.save()
+        o, l, v = self.outra.pk, self.lotacao.pk, self.divisao.pk
+        self.assertEqual(self._caminho(self.divisao), (f'/{o}/{l}/{v}/', 2))
+
+        self.lotacao.parent = None
+        self.lotacao.save()
+        self.assertEqual(self._caminho(self.divisao), (f'/{l}/{v}/', 1))
+
+    def test_hierarquia_circular_e_recusada(self):
+        self.diretoria.parent = self.divisao
+        with self.assertRaises(ValidationError):
+            self.diretoria.full_clean()
+        with self.assertRaises(ValueError):
+            self.diretoria.save()
+
+    def test_exclusao_transforma_filhos_em_raizes(self):
+        self.lotacao.delete()
+        self.assertEqual(self._caminho(self.divisao), (f'/{self.divisao.pk}/', 0))
+        self.assertIsNone(self.divisao.parent_id)
+
+    def test_com_subordinados(self):
+        centros = CentroCusto.objects.filter(pk__in=[self.lotacao.pk, self.outra.pk]).com_subordinados()
+        self.assertEqual(
+            set(centros.values_list('nome', flat=True)), {'Lotação', 'Divisão', 'Outra Diretoria'}
+        )
+        self.assertFalse(CentroCusto.objects.none().com_subordinados().exists())
+
+    def test_filhos_sob_demanda(self):
+        self.client.force_login(UsuarioSistema.objects.create_user('12345', 'senha', email='usuario@teste.com'))
+        url = reverse('core:centros_custo_filhos')
+
+        raizes = self.client.get(url).json()['centros']
+        self.assertEqual(
+            raizes,
+            [
+                {'id': self.diretoria.pk, 'nome': 'Diretoria', 'tem_filhos': True},
+                {'id': self.outra.pk, 'nome': 'Outra Diretoria', 'tem_filhos': False},
+            ]
+        )
+        filhos = self.client.get(url, {'parent': self.diretoria.pk}).json()['centros']
+        self.assertEqual([centro['nome'] for centro in filhos], ['Lotação'])
+        self.assertEqual(self.client.get(url, {'parent': 'x'}).status_code, 400)
+
+
+def _weasyprint_disponivel():
+    try:
+        import weasyprint  # noqa: F401
+    except (ImportError, OSError):
+        return False
+    return True
+
+
+class _PoolFalso(pdf._Aposentadoria):
+    """Substitui o pool de processos: as tarefas ficam pendentes até o teste resolvê-las."""
+
+    def __init__(self, em_andamento=False):
+        super().__init__()
+        self.em_andamento = em_andamento
+        self.futuros = []
+        self.processo = mock.Mock()
+        self.desligado = False
+
+    def submit(self, funcao, *args):
+        futuro = Future()
+        if self.em_andamento:
+            futuro.set_running_or_notify_cancel()
+        self.futuros.append(futuro)
+        return futuro
+
+    def processos(self):
+        return [self.processo]
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.desligado = True
+
+
+@override_settings(PDF_PROCESSOS=2, PDF_CONCORRENCIA=1, PDF_TIMEOUT=0.05)
+class RenderizacaoPDFTests(SimpleTestCase):
+    """
+    Fila limitada e tempo máximo da renderização de PDFs, com o pool de
+    processos (e o WeasyPrint) substituído.
+    """
+
+    def _usar_pool(self, pool):
+        estado = mock.patch.multiple(pdf, _pool=None, _vagas=None)
+        estado.start()
+        self.addCleanup(estado.stop)
+        fabrica = mock.patch.object(pdf, '_PoolPDF', return_value=pool)
+        fabrica.start()
+        self.addCleanup(fabrica.stop)
+
+    def test_tempo_esgotado_com_tarefa_na_fila(self):
+        pool = _PoolFalso()
+        self._usar_pool(pool)
+        with self.assertRaisesMessage(pdf.RenderizacaoPDFError, 'excedeu'):
+            pdf.renderizar_pdf('<p></p>')
+        # A tarefa que nem começou é só cancelada; o pool continua em uso
+        self.assertTrue(pool.futuros[0].cancelled())
+        self.assertFalse(pool.desligado)
+        self.assertIs(pdf._pool, pool)
+
+    def test_tempo_esgotado_com_renderizacao_presa(self):
+        pool = _PoolFalso(em_andamento=True)
+        self._usar_pool(pool)
+        with self.assertRaisesMessage(pdf.RenderizacaoPDFError, 'excedeu'):
+            pdf.renderizar_pdf('<p></p>')
+        # A renderização presa derruba o pool: processos terminados e um novo pool no próximo PDF
+        pool.processo.terminate.assert_called_once_with()
+        self.assertTrue(pool.desligado)
+        self.assertIsNone(pdf._pool)
+
+    @override_settings(PDF_CONCORRENCIA=2)
+    def test_renderizacao_presa_nao_derruba_as_dos_outros(self):
+        pool = _PoolFalso(em_andamento=True)
+        self._usar_pool(pool)
+        resultado = []
+        with self.settings(PDF_TIMEOUT=5):
+            outro = threading.Thread(target=lambda: resultado.append(pdf.renderizar_pdf('<p>1</p>')))
+            outro.start()
+            while not pool.futuros:
+                time.sleep(0.01)
+
+        with self.assertRaisesMessage(pdf.RenderizacaoPDFError, 'excedeu'):
+            pdf.renderizar_pdf('<p>2</p>')
+        # Pool aposentado (o próximo PDF vai para outro), mas o PDF em andamento continua
+        self.assertIsNone(pdf._pool)
+        pool.processo.terminate.assert_not_called()
+        self.assertFalse(pool.desligado)
+
+        pool.futuros[0].set_result(b'%PDF-1')
+        outro.join()
+        self.assertEqual(resultado, [b'%PDF-1'])
+        # Só restou a renderização presa: agora o pool é encerrado
+        pool.processo.terminate.assert_called_once_with()
+        self.assertTrue(pool.desligado)
+
+    @override_settings(PDF_TIMEOUT=5)
+    def test_fila_cheia_recusa_sem_esperar(self):
+        pool = _PoolFalso()
+        self._usar_pool(pool)
+        resultado = []
+        primeiro = threading.Thread(target=lambda: resultado.append(pdf.renderizar_pdf('<p>1</p>')))
+        primeiro.start()
+        while not pool.futuros:
+            time.sleep(0.01)
+
+        with self.assertRaisesMessage(pdf.RenderizacaoPDFError, 'muitos PDFs'):
+            pdf.renderizar_pdf('<p>2</p>')
+        self.assertEqual(len(pool.futuros), 1)
+
+        pool.futuros[0].set_result(b'%PDF-1')
+        primeiro.join()
+        self.assertEqual(resultado, [b'%PDF-1'])
+        # A vaga foi devolvida
+        self.assertTrue(pdf._vagas.acquire(blocking=False))
+        pdf._vagas.release()
+
+    @skipUnless(_weasyprint_disponivel(), "WeasyPrint (ou as bibliotecas nativas dele) não está disponível")
+    def test_pool_conhece_os_proprios_processos(self):
+        pool = pdf._PoolPDF(max_workers=1)
+        try:
+            pid = pool.submit(os.getpid).result(timeout=30)
+            processos = pool.processos()
+            self.assertEqual([processo.pid for processo in processos], [pid])
+        finally:
+            pool.aposentar()
+        processos[0].join(timeout=10)
+        self.assertFalse(processos[0].is_alive())
+
+
+class CachePDFTests(SimpleTestCase):
+    """
+    Cache de PDFs em disco: gera uma vez, responde 304 ao ETag conhecido e
+    a limpeza por tamanho remove primeiro os acessados há mais tempo.
+    """
+
+    def setUp(self):
+        diretorio = tempfile.TemporaryDirectory()
+        self.addCleanup(diretorio.cleanup)
+        configuracao = self.settings(PDF_CACHE_DIR=diretorio.name, PDF_CACHE_TAMANHO_MAXIMO=10 * 1024 * 1024)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+        self.fabrica = RequestFactory()
+
+    def _responder(self, chave, gerar, **cabecalhos):
+        return cache_pdf.resposta_pdf(self.fabrica.get('/pdf/', **cabecalhos), chave, gerar, 'teste.pdf')
+
+    def test_gera_uma_vez_e_serve_do_disco(self):
+        chave = cache_pdf.chave_pdf('materiais/requisicao_pdf.html', '1:ATENDIDA')
+        self.assertEqual(chave, cache_pdf.chave_pdf('materiais/requisicao_pdf.html', '1:ATENDIDA'))
+        self.assertNotEqual(chave, cache_pdf.chave_pdf('materiais/requisicao_pdf.html', '1:CANCELADA'))
+
+        gerar = mock.Mock(return_value=b'%PDF-1')
+        for _ in range(2):
+            resposta = self._responder(chave, gerar)
+            self.assertEqual(resposta.status_code, 200)
+            self.assertEqual(b''.join(resposta.streaming_content), b'%PDF-1')
+            self.assertEqual(resposta['ETag'], f'"{chave}"')
+            self.assertEqual(resposta['Cache-Control'], 'private, no-cache')
+        gerar.assert_called_once_with()
+
+    def test_etag_conhecido_responde_304_sem_gerar(self):
+        chave = 'ab' * 32
+        gerar = mock.Mock(return_value=b'%PDF-1')
+        resposta = self._responder(chave, gerar, HTTP_IF_NONE_MATCH=f'"{chave}"')
+        self.assertEqual(resposta.status_code, 304)
+        gerar.assert_not_called()
+
+        resposta = self._responder(chave, gerar, HTTP_IF_NONE_MATCH='"outra"')
+        self.assertEqual(resposta.status_code, 200)
+        gerar.assert_called_once_with()
+
+    def test_limpeza_remove_os_acessados_ha_mais_tempo(self):
+        chaves = {nome: nome * 64 for nome in 'abc'}
+        for chave in chaves.values():
+            cache_pdf._gravar(chave, b'x' * 100)
+        # Acessos antigos: 'a' é o mais velho, depois 'b', depois 'c'
+        for segundos, chave in enumerate(chaves.values(), start=1):
+            os.utime(cache_pdf._caminho(chave), (segundos * 1000, segundos * 1000))
+
+        # Servir 'a' atualiza o atime (e preserva o mtime, a data de geração)
+        resposta = self._responder(chaves['a'], mock.Mock())
+        resposta.close()
+        self.assertEqual(os.stat(cache_pdf._caminho(chaves['a'])).st_mtime, 1000)
+
+        self.assertEqual(cache_pdf.limpar_cache_pdf(tamanho_maximo=300), 0)
+        self.assertEqual(cache_pdf.limpar_cache_pdf(tamanho_maximo=250), 1)
+        existentes = {nome for nome, chave in chaves.items() if os.path.exists(cache_pdf._caminho(chave))}
+        self.assertEqual(existentes, {'a', 'c'})
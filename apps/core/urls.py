@@ -8,4 +8,5 @@ app_name = 'core'
 urlpatterns = [
 
     path('', views.dashboard_view, name='dashboard'),
+    path('centros-custo/filhos/', views.centros_custo_filhos_view, name='centros_custo_filhos'),
 ]
\ No newline at end of file
@@ -1,10 +1,14 @@
 # apps/core/views.py
 
-from django.db.models import Prefetch
+from django.db.models import Exists, OuterRef, Prefetch
+from django.http import JsonResponse
 from django.shortcuts import render
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
 
+from .models import CentroCusto
+from .permissoes import grupos_do_usuario
+
 User = get_user_model()
 
 @login_required
@@ -21,7 +25,7 @@ def dashboard_view(request):
     conversas_ativas = request.user.conversas.prefetch_related('participantes').all()
 
     # 2. Buscar usuários para iniciar novas conversas.
-    user_groups = request.user.groups.values_list('name', flat=True)
+    user_groups = grupos_do_usuario(request.user)
     
     if "Requisitantes" in user_groups:
         usuarios_para_chat = User.objects.filter(groups__name__in=["Almoxarifes", "Administradores"])
@@ -45,4 +49,20 @@ def dashboard_view(request):
         'usuarios_para_chat': usuarios_para_chat,
     }
 
-    return render(request, 'core/home.html', context)
\ No newline at end of file
+    return render(request, 'core/home.html', context)
+
+
+@login_required
+def centros_custo_filhos_view(request):
+    """
+    Filhos diretos de um centro de custo (?parent=<id>; sem o parâmetro, as
+    raízes), para o seletor em árvore que expande um nível por vez.
+    """
+    parent_id = request.GET.get('parent') or None
+    if parent_id is not None and not parent_id.isdigit():
+        return JsonResponse({'erro': 'Parâmetro "parent" inválido.'}, status=400)
+
+    centros = CentroCusto.objects.filter(parent_id=parent_id).annotate(
+        tem_filhos=Exists(CentroCusto.objects.filter(parent_id=OuterRef('pk')))
+    ).values('id', 'nome', 'tem_filhos')
+    return JsonResponse({'centros': list(centros)})
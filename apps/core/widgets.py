@@ -0,0 +1,50 @@
+# Em apps/core/widgets.py
+
+from django import forms
+from django.urls import reverse_lazy
+
+from .models import CentroCusto
+
+
+class ArvoreCentroCustoWidget(forms.Widget):
+    """
+    Seletor de centros de custo em árvore para um ModelMultipleChoiceField.
+    Só os centros já selecionados vêm na página; os níveis da árvore são
+    buscados sob demanda (core:centros_custo_filhos) ao expandir cada nó,
+    em vez de carregar todos os centros em um <select>.
+    """
+    template_name = 'core/widgets/arvore_centro_custo.html'
+    url_filhos = reverse_lazy('core:centros_custo_filhos')
+
+    class Media:
+        js = ('js/arvore_centro_custo.js',)
+
+    def format_value(self, value):
+        if value is None:
+            return []
+        if not isinstance(value, (list, tuple)):
+            value = [value]
+        return [str(valor) for valor in value if valor not in (None, '')]
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        selecionados = [pk for pk in context['widget']['value'] if pk.isdigit()]
+        context['widget']['selecionados'] = (
+            CentroCusto.objects.filter(pk__in=selecionados).values('id', 'nome') if selecionados else []
+        )
+        context['widget']['url_filhos'] = self.url_filhos
+        return context
+
+    def use_required_attribute(self, initial):
+        # 'required' não se aplica ao <div> do widget
+        return False
+
+    def value_from_datadict(self, data, files, name):
+        try:
+            return data.getlist(name)
+        except AttributeError:
+            return data.get(name)
+
+    def value_omitted_from_data(self, data, files, name):
+        # Nenhum centro marcado não envia o campo, mas é um valor válido (vazio)
+        return False
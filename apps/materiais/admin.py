@@ -1,10 +1,12 @@
 # Em apps/materiais/admin.py
 
 from django.contrib import admin
+from django.db import transaction
 from .models import (
-    Produto, Categoria, Almoxarifado, Lote, MovimentoEstoque, 
+    Produto, Categoria, Almoxarifado, Lote, MovimentoEstoque, SaldoProduto, ConsumoDiario,
     Requisicao, ItemRequisicao, Classe, PDM, NaturezaDespesa
 )
+from .services.reserva import liberar_reserva_requisicao
 
 @admin.register(Categoria)
 class CategoriaAdmin(admin.ModelAdmin):
@@ -18,25 +20,34 @@ class AlmoxarifadoAdmin(admin.ModelAdmin):
 
 @admin.register(Produto)
 class ProdutoAdmin(admin.ModelAdmin):
-    list_display = ('codigo_produto', 'nome_produto', 'categoria', 'saldo_total', 'estoque_minimo', 'ativo')
+    list_display = ('codigo_produto', 'nome_produto', 'categoria', 'get_saldo_total', 'estoque_minimo', 'ativo')
     list_filter = ('ativo', 'categoria')
     search_fields = ('codigo_produto', 'nome_produto', 'categoria__nome')
     readonly_fields = ('saldo_total',)
+    list_select_related = ('categoria',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_estoque()
+
+    @admin.display(description='Saldo Total', ordering='estoque_quantidade')
+    def get_saldo_total(self, obj):
+        return obj.saldo_total
 
 # --- NOVO ADMIN PARA O MODELO LOTE ---
 @admin.register(Lote)
 class LoteAdmin(admin.ModelAdmin):
-    list_display = ('__str__', 'produto', 'data_validade', 'quantidade_atual', 'codigo_lote')
+    list_display = ('__str__', 'produto', 'data_validade', 'quantidade_atual', 'custo_unitario', 'codigo_lote')
     list_filter = ('produto', 'data_validade')
     search_fields = ('produto__nome_produto', 'codigo_lote')
-    readonly_fields = ('quantidade_atual',) # A quantidade é atualizada por movimentos
+    readonly_fields = ('quantidade_atual', 'custo_unitario') # Atualizados pelas entradas e saídas
 
 # --- CLASSE MOVIMENTOESTOQUEADMIN CORRIGIDA ---
 @admin.register(MovimentoEstoque)
 class MovimentoEstoqueAdmin(admin.ModelAdmin):
-    list_display = ('data', 'get_produto', 'lote', 'tipo', 'quantidade', 'valor_unitario', 'usuario')
+    list_display = ('data', 'get_produto', 'lote', 'tipo', 'quantidade', 'valor_unitario', 'valor_total', 'usuario')
     list_filter = ('tipo', 'almoxarifado', 'data')
-    search_fields = ('lote__produto__nome_produto', 'observacao', 'usuario__username')
+    search_fields = ('produto__nome_produto', 'observacao', 'usuario__username')
+    list_select_related = ('produto', 'lote__produto', 'usuario')
     
     #list_editable = ('quantidade', 'valor_unitario') # Desativado temporariamente durante a refatoração
 
@@ -44,9 +55,37 @@ class MovimentoEstoqueAdmin(admin.ModelAdmin):
         # Movimentos devem ser criados pelos fluxos do sistema, não manualmente
         return False
 
-    @admin.display(description='Produto', ordering='lote__produto__nome_produto')
+    @admin.display(description='Produto', ordering='produto__nome_produto')
     def get_produto(self, obj):
-        return obj.lote.produto.nome_produto
+        return obj.produto.nome_produto if obj.produto_id else '-'
+
+@admin.register(SaldoProduto)
+class SaldoProdutoAdmin(admin.ModelAdmin):
+    list_display = ('produto', 'quantidade', 'quantidade_reservada', 'custo_medio', 'valor_total', 'data_atualizacao')
+    search_fields = ('produto__nome_produto', 'produto__codigo_produto')
+    list_select_related = ('produto',)
+
+    def has_add_permission(self, request):
+        # O saldo é mantido pelos movimentos ou pelo comando 'recalcular_saldos'
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(ConsumoDiario)
+class ConsumoDiarioAdmin(admin.ModelAdmin):
+    list_display = ('data', 'centro_custo', 'produto', 'quantidade', 'valor')
+    list_filter = ('centro_custo',)
+    date_hierarchy = 'data'
+    search_fields = ('produto__nome_produto', 'produto__codigo_produto')
+    list_select_related = ('centro_custo', 'produto')
+
+    def has_add_permission(self, request):
+        # O consumo é acumulado nos atendimentos ou pelo comando 'reconstruir_consumo'
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 # Admins para o fluxo de requisição (para visualização e depuração)
 @admin.register(Requisicao)
@@ -55,6 +94,19 @@ class RequisicaoAdmin(admin.ModelAdmin):
     list_filter = ('status', 'centro_custo')
     search_fields = ('solicitante__username', 'centro_custo__nome')
 
+    # Requisições finalizadas reservam saldo; ao excluí-las, a reserva é devolvida.
+    @transaction.atomic
+    def delete_model(self, request, obj):
+        if obj.status == 'FINALIZADA':
+            liberar_reserva_requisicao(obj)
+        super().delete_model(request, obj)
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        for requisicao in queryset.filter(status='FINALIZADA'):
+            liberar_reserva_requisicao(requisicao)
+        super().delete_queryset(request, queryset)
+
 @admin.register(ItemRequisicao)
 class ItemRequisicaoAdmin(admin.ModelAdmin):
     list_display = ('requisicao', 'produto', 'quantidade', 'quantidade_atendida')
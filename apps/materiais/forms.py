@@ -3,13 +3,12 @@
 from django import forms
 from django.forms import modelformset_factory
 from .models import Produto, ItemRequisicao
-from django.utils import timezone 
-from .models import Produto, ItemRequisicao, FechamentoMensal
+from .services.periodo import PeriodoFechadoError, garantir_periodo_aberto
 
 # ... (seu RequisicaoForm e AtendimentoFormSet existentes) ...
 class RequisicaoForm(forms.Form):
     produto = forms.ModelChoiceField(
-        queryset=Produto.objects.filter(ativo=True).order_by('nome_produto'),
+        queryset=Produto.objects.filter(ativo=True).with_estoque().order_by('nome_produto'),
         label="Produto",
         widget=forms.Select(attrs={'class': 'form-select'}),
         empty_label="--- Selecione um produto ---"
@@ -24,10 +23,11 @@ class RequisicaoForm(forms.Form):
         quantidade_pedida = self.cleaned_data.get('quantidade')
         produto_selecionado = self.cleaned_data.get('produto')
         if produto_selecionado and quantidade_pedida:
-            saldo_disponivel = produto_selecionado.saldo_total
+            # Desconta o que já está reservado para requisições finalizadas
+            saldo_disponivel = produto_selecionado.saldo_disponivel
             if quantidade_pedida > saldo_disponivel:
                 raise forms.ValidationError(
-                    f"Saldo insuficiente. Saldo atual: {saldo_disponivel}. Você pediu {quantidade_pedida}."
+                    f"Saldo insuficiente. Saldo disponível: {saldo_disponivel}. Você pediu {quantidade_pedida}."
                 )
         return quantidade_pedida
 
@@ -103,16 +103,12 @@ class EntradaForm(forms.Form):
     def clean(self):
         cleaned_data = super().clean()
         
-        # Usamos a data atual para determinar o período da movimentação
-        data_movimentacao = timezone.now()
-        mes = data_movimentacao.month
-        ano = data_movimentacao.year
-        
-        # Verifica no banco de dados se existe um registro de fechamento ATIVO para este mês/ano
-        if FechamentoMensal.objects.filter(mes=mes, ano=ano, status='ATIVO').exists():
-            # Se existir, levanta um erro de validação que será exibido para o usuário
-            raise forms.ValidationError(
-                f"Não é possível registrar novas entradas no período de {mes:02d}/{ano}, pois ele já foi fechado."
-            )
+        # O período da movimentação é o da data atual; a consulta aos períodos
+        # fechados vem do cache em memória (services.periodo), sem ir ao banco
+        try:
+            garantir_periodo_aberto(operacao="registrar novas entradas")
+        except PeriodoFechadoError as erro:
+            # Erro de validação exibido para o usuário
+            raise forms.ValidationError(str(erro))
             
         return cleaned_data
\ No newline at end of file
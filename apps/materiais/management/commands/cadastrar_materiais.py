@@ -83,7 +83,8 @@ def handle(self, *args, **options):
                     lote = Lote.objects.create(
                         produto=produto,
                         data_validade=validade_obj,
-                        quantidade_atual=dados_material['saldo_inicial']
+                        quantidade_atual=dados_material['saldo_inicial'],
+                        custo_unitario=dados_material['custo_unitario']
                     )
                     self.stdout.write(f"    -> [LOTE CRIADO] Validade: {lote.data_validade.strftime('%d/%m/%Y')}")
                     MovimentoEstoque.objects.create(
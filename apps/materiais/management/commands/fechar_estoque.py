@@ -1,10 +1,9 @@
 # app/materiais/management/commands/fechar_estoque.py
 
-import calendar
 from django.core.management.base import BaseCommand
 from django.db import transaction
-from django.utils import timezone
-from apps.materiais.models import Produto, FechamentoMensal, PosicaoEstoqueMensal
+from apps.materiais.models import FechamentoMensal
+from apps.materiais.services import executar_fechamento
 from apps.users.models import UsuarioSistema
 
 class Command(BaseCommand):
@@ -33,24 +32,10 @@ class Command(BaseCommand):
 
         self.stdout.write(f'Iniciando o fechamento de {mes:02d}/{ano} por {responsavel.username}...')
 
-        # Cria o registro principal do fechamento
-        fechamento = FechamentoMensal.objects.create(mes=mes, ano=ano, responsavel=responsavel)
+        # Cria o registro principal do fechamento e a fotografia do estoque no fim do período
+        resultado = executar_fechamento(mes, ano, responsavel)
 
-        # Define o momento exato do "fim do mês"
-        _, ultimo_dia = calendar.monthrange(ano, mes)
-        fim_do_periodo = timezone.datetime(ano, mes, ultimo_dia, 23, 59, 59, tzinfo=timezone.get_current_timezone())
-
-        produtos = Produto.objects.filter(ativo=True)
-        for produto in produtos:
-            saldo_final = produto.calcular_saldo_ate(fim_do_periodo)
-            custo_medio_final = produto.calcular_custo_medio_ate(fim_do_periodo)
-
-            PosicaoEstoqueMensal.objects.create(
-                fechamento=fechamento,
-                produto=produto,
-                quantidade_final=saldo_final,
-                custo_medio_final=custo_medio_final,
-                valor_total_final=saldo_final * custo_medio_final
-            )
-
-        self.stdout.write(self.style.SUCCESS(f'Fechamento de {mes:02d}/{ano} concluído com sucesso para {produtos.count()} produtos.'))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS(
+            f'Fechamento de {mes:02d}/{ano} concluído com sucesso: '
+            f'{resultado.total_posicoes} posições gravadas em {resultado.duracao:.2f}s.'
+        ))
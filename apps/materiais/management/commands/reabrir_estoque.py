@@ -1,8 +1,7 @@
 # app/materiais/management/commands/reabrir_estoque.py
 
 from django.core.management.base import BaseCommand, CommandError
-from django.utils import timezone
-from apps.materiais.models import FechamentoMensal
+from apps.materiais.services import reabrir_ultimo_fechamento
 from apps.users.models import UsuarioSistema
 
 class Command(BaseCommand):
@@ -18,16 +17,11 @@ class Command(BaseCommand):
         except UsuarioSistema.DoesNotExist:
             raise CommandError(f'Usuário com ID {usuario_id} não encontrado.')
 
-        ultimo_fechamento = FechamentoMensal.objects.filter(status='ATIVO').order_by('-ano', '-mes').first()
+        ultimo_fechamento = reabrir_ultimo_fechamento(responsavel_reabertura)
 
         if not ultimo_fechamento:
             raise CommandError('Nenhum período ativo encontrado para reabrir.')
 
         mes, ano = ultimo_fechamento.mes, ultimo_fechamento.ano
 
-        ultimo_fechamento.status = 'CANCELADO'
-        ultimo_fechamento.cancelado_por = responsavel_reabertura
-        ultimo_fechamento.data_cancelamento = timezone.now()
-        ultimo_fechamento.save()
-
         self.stdout.write(self.style.SUCCESS(f'O período {mes:02d}/{ano} foi reaberto com sucesso.'))
\ No newline at end of file
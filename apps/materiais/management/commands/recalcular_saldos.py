@@ -0,0 +1,78 @@
+# app/materiais/management/commands/recalcular_saldos.py
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q, Sum
+from apps.materiais.models import ItemRequisicao, MovimentoEstoque, SaldoProduto
+
+TAMANHO_PAGINA = 2000
+
+class Command(BaseCommand):
+    help = (
+        'Reconstrói a tabela de saldos consolidados (SaldoProduto) a partir dos movimentos de estoque '
+        'e regrava em cada movimento o produto, o custo médio vigente e o valor total, além das '
+        'reservas das requisições finalizadas.'
+    )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        self.stdout.write('Reprocessando os movimentos de estoque em ordem cronológica...')
+
+        # Os movimentos são reaplicados na ordem em que ocorreram, pois o custo
+        # médio ponderado depende da sequência de entradas e saídas. São lidos
+        # em páginas de (data, id) e cada página é gravada antes da próxima:
+        # a memória não cresce com o razão, e nenhum cursor fica aberto
+        # durante os UPDATEs (no SQLite, o iterator() os enxergaria).
+        movimentos = (
+            MovimentoEstoque.objects
+            .filter(lote__isnull=False)
+            .order_by('data', 'id')
+            .values_list('data', 'id', 'lote__produto_id', 'quantidade', 'valor_unitario')
+        )
+
+        saldos = {}
+        total_movimentos = 0
+        pagina = list(movimentos[:TAMANHO_PAGINA])
+        while pagina:
+            custos_vigentes = []
+            for _, movimento_id, produto_id, quantidade, valor_unitario in pagina:
+                saldo = saldos.get(produto_id)
+                if saldo is None:
+                    saldo = saldos[produto_id] = SaldoProduto(produto_id=produto_id)
+                movimento = MovimentoEstoque(
+                    id=movimento_id, produto_id=produto_id, quantidade=quantidade, valor_unitario=valor_unitario,
+                    custo_medio=saldo.aplicar(quantidade, valor_unitario)
+                )
+                movimento.valor_total = movimento.calcular_valor_total()
+                custos_vigentes.append(movimento)
+
+            # bulk_update não passa pelo save(), então não reaplica os movimentos ao saldo.
+            MovimentoEstoque.objects.bulk_update(
+                custos_vigentes, ['produto', 'custo_medio', 'valor_total'], batch_size=1000
+            )
+            total_movimentos += len(pagina)
+
+            data, movimento_id = pagina[-1][:2]
+            pagina = list(
+                movimentos.filter(Q(data__gt=data) | Q(data=data, id__gt=movimento_id))[:TAMANHO_PAGINA]
+            )
+
+        # Reservas: itens de requisições finalizadas que ainda aguardam atendimento.
+        reservas = (
+            ItemRequisicao.objects.filter(requisicao__status='FINALIZADA')
+            .values('produto_id')
+            .annotate(total=Sum('quantidade'))
+            .values_list('produto_id', 'total')
+        )
+        for produto_id, total in reservas:
+            saldo = saldos.get(produto_id)
+            if saldo is None:
+                saldo = saldos[produto_id] = SaldoProduto(produto_id=produto_id)
+            saldo.quantidade_reservada = total
+
+        SaldoProduto.objects.all().delete()
+        SaldoProduto.objects.bulk_create(saldos.values(), batch_size=1000)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Saldos recalculados para {len(saldos)} produtos a partir de {total_movimentos} movimentos.'
+        ))
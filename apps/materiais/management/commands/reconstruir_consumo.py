@@ -0,0 +1,34 @@
+# app/materiais/management/commands/reconstruir_consumo.py
+
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.materiais.services import reconstruir_consumo
+
+
+def _data(texto):
+    try:
+        return datetime.date.fromisoformat(texto)
+    except ValueError:
+        raise CommandError(f"Data inválida: '{texto}'. Use o formato AAAA-MM-DD.")
+
+
+class Command(BaseCommand):
+    help = (
+        'Reconstrói a tabela de consumo diário por centro de custo e produto (ConsumoDiario) '
+        'a partir das saídas de atendimento de requisições. Sem datas, refaz a tabela inteira.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inicio', help='Primeiro dia a reconstruir (AAAA-MM-DD).')
+        parser.add_argument('--fim', help='Último dia a reconstruir (AAAA-MM-DD).')
+
+    def handle(self, *args, **options):
+        data_inicio = _data(options['inicio']) if options['inicio'] else None
+        data_fim = _data(options['fim']) if options['fim'] else None
+        if data_inicio and data_fim and data_inicio > data_fim:
+            raise CommandError('A data inicial é posterior à data final.')
+
+        linhas = reconstruir_consumo(data_inicio, data_fim)
+        self.stdout.write(self.style.SUCCESS(f'Consumo diário reconstruído: {linhas} linhas gravadas.'))
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.3 on 2026-10-18 18:59
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def preencher_saldos(apps, schema_editor):
+    # Reprocessa o razão em ordem cronológica com o mesmo cálculo de
+    # SaldoProduto.aplicar (custo médio ponderado móvel), para que a tabela
+    # já nasça com os saldos corretos e os próximos movimentos partam deles.
+    MovimentoEstoque = apps.get_model('materiais', 'MovimentoEstoque')
+    SaldoProduto = apps.get_model('materiais', 'SaldoProduto')
+    movimentos = (
+        MovimentoEstoque.objects.filter(lote__isnull=False)
+        .order_by('data', 'id')
+        .values_list('lote__produto_id', 'quantidade', 'valor_unitario')
+    )
+    saldos = {}
+    for produto_id, quantidade, valor_unitario in movimentos.iterator(chunk_size=2000):
+        saldo = saldos.get(produto_id)
+        if saldo is None:
+            saldo = saldos[produto_id] = SaldoProduto(
+                produto_id=produto_id, quantidade=0, valor_total=Decimal('0'), custo_medio=Decimal('0')
+            )
+        if quantidade > 0 and valor_unitario is not None:
+            saldo.valor_total += quantidade * valor_unitario
+        else:
+            saldo.valor_total += quantidade * saldo.custo_medio
+        saldo.quantidade += quantidade
+        if saldo.quantidade > 0:
+            saldo.custo_medio = (saldo.valor_total / saldo.quantidade).quantize(Decimal('0.0001'))
+        else:
+            saldo.valor_total = Decimal('0')
+        saldo.valor_total = saldo.valor_total.quantize(Decimal('0.01'))
+    SaldoProduto.objects.bulk_create(saldos.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materiais', '0007_classe_naturezadespesa_pdm_produto_classe_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaldoProduto',
+            fields=[
+                ('produto', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='saldo', serialize=False, to='materiais.produto', verbose_name='Produto')),
+                ('quantidade', models.IntegerField(default=0, verbose_name='Quantidade em Estoque')),
+                ('valor_total', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Valor Total (R$)')),
+                ('custo_medio', models.DecimalField(decimal_places=4, default=0, max_digits=12, verbose_name='Custo Médio (R$)')),
+                ('data_atualizacao', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+            ],
+            options={
+                'verbose_name': 'Saldo de Produto',
+                'verbose_name_plural': 'Saldos de Produtos',
+            },
+        ),
+        migrations.RunPython(preencher_saldos, migrations.RunPython.noop),
+    ]
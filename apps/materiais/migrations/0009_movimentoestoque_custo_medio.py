@@ -0,0 +1,59 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:00
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def carimbar_custo_medio(apps, schema_editor):
+    # Reprocessa o razão em ordem cronológica com o mesmo cálculo de 0008
+    # (custo médio ponderado móvel) e grava em cada movimento o custo médio
+    # vigente depois dele: sem isso, as saídas antigas ficariam sem custo.
+    MovimentoEstoque = apps.get_model('materiais', 'MovimentoEstoque')
+    movimentos = (
+        MovimentoEstoque.objects.filter(lote__isnull=False)
+        .order_by('data', 'id')
+        .values_list('id', 'lote__produto_id', 'quantidade', 'valor_unitario')
+    )
+    saldos = {}
+    pendentes = []
+    for movimento_id, produto_id, quantidade, valor_unitario in movimentos.iterator(chunk_size=2000):
+        quantidade_atual, valor_total, custo_medio = saldos.get(produto_id, (0, Decimal('0'), Decimal('0')))
+        if quantidade > 0 and valor_unitario is not None:
+            valor_total += quantidade * valor_unitario
+        else:
+            valor_total += quantidade * custo_medio
+        quantidade_atual += quantidade
+        if quantidade_atual > 0:
+            custo_medio = (valor_total / quantidade_atual).quantize(Decimal('0.0001'))
+        else:
+            valor_total = Decimal('0')
+        saldos[produto_id] = (quantidade_atual, valor_total.quantize(Decimal('0.01')), custo_medio)
+
+        pendentes.append(MovimentoEstoque(id=movimento_id, custo_medio=custo_medio))
+        if len(pendentes) >= 1000:
+            MovimentoEstoque.objects.bulk_update(pendentes, ['custo_medio'])
+            pendentes = []
+    MovimentoEstoque.objects.bulk_update(pendentes, ['custo_medio'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materiais', '0008_saldoproduto'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movimentoestoque',
+            name='custo_medio',
+            field=models.DecimalField(blank=True, decimal_places=4, help_text='Custo médio ponderado do produto em vigor após este movimento (saídas são valorizadas por ele).', max_digits=12, null=True, verbose_name='Custo Médio Vigente'),
+        ),
+        migrations.RunPython(carimbar_custo_medio, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='movimentoestoque',
+            index=models.Index(fields=['lote', 'data'], name='materiais_mov_lote_data_idx'),
+        ),
+    ]
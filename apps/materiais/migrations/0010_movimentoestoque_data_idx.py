@@ -0,0 +1,19 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materiais', '0009_movimentoestoque_custo_medio'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movimentoestoque',
+            index=models.Index(fields=['data'], name='materiais_mov_data_idx'),
+        ),
+    ]
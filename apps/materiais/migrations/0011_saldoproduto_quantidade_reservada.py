@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materiais', '0010_movimentoestoque_data_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='saldoproduto',
+            name='quantidade_reservada',
+            field=models.PositiveIntegerField(default=0, help_text='Soma dos itens de requisições finalizadas que ainda aguardam atendimento.', verbose_name='Quantidade Reservada'),
+        ),
+    ]
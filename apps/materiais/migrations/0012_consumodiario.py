@@ -0,0 +1,80 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:31
+
+import re
+from collections import defaultdict
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+# Observação gravada nas saídas de atendimento nesta versão do esquema
+_ID_DA_REQUISICAO = re.compile(r'Atendimento da Requisição #(\d+)$')
+
+
+def preencher_consumo(apps, schema_editor):
+    # Agrega as saídas de atendimento já existentes (dia do atendimento x
+    # centro de custo x produto), valorizadas pelo custo médio vigente em
+    # cada movimento, para que o relatório de consumo não comece vazio.
+    Requisicao = apps.get_model('materiais', 'Requisicao')
+    MovimentoEstoque = apps.get_model('materiais', 'MovimentoEstoque')
+    ConsumoDiario = apps.get_model('materiais', 'ConsumoDiario')
+
+    destino = {
+        requisicao_id: (timezone.localdate(data_atendimento), centro_custo_id)
+        for requisicao_id, data_atendimento, centro_custo_id in Requisicao.objects.filter(
+            status='ATENDIDA', data_atendimento__isnull=False
+        ).values_list('id', 'data_atendimento', 'centro_custo_id').iterator(chunk_size=2000)
+    }
+    movimentos = MovimentoEstoque.objects.filter(
+        tipo='SAIDA', lote__isnull=False, observacao__startswith='Atendimento da Requisição #'
+    ).values_list('observacao', 'lote__produto_id', 'quantidade', 'custo_medio')
+
+    consumo = defaultdict(lambda: [0, Decimal('0')])
+    for observacao, produto_id, quantidade, custo_medio in movimentos.iterator(chunk_size=2000):
+        encontrado = _ID_DA_REQUISICAO.match(observacao)
+        chave = destino.get(int(encontrado.group(1))) if encontrado else None
+        if chave is None:
+            continue
+        totais = consumo[(*chave, produto_id)]
+        totais[0] += -quantidade
+        totais[1] += -quantidade * (custo_medio or Decimal('0'))
+
+    ConsumoDiario.objects.bulk_create(
+        [
+            ConsumoDiario(
+                data=data, centro_custo_id=centro_custo_id, produto_id=produto_id,
+                quantidade=quantidade, valor=valor.quantize(Decimal('0.01'))
+            )
+            for (data, centro_custo_id, produto_id), (quantidade, valor) in consumo.items()
+        ],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_centrocusto'),
+        ('materiais', '0011_saldoproduto_quantidade_reservada'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsumoDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('data', models.DateField(verbose_name='Data do Atendimento')),
+                ('quantidade', models.PositiveIntegerField(default=0, verbose_name='Quantidade Consumida')),
+                ('valor', models.DecimalField(decimal_places=2, default=0, help_text='Saídas valorizadas pelo custo médio vigente em cada movimento.', max_digits=14, verbose_name='Valor Consumido (R$)')),
+                ('centro_custo', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='consumos_diarios', to='core.centrocusto', verbose_name='Centro de Custo')),
+                ('produto', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='consumos_diarios', to='materiais.produto')),
+            ],
+            options={
+                'verbose_name': 'Consumo Diário',
+                'verbose_name_plural': 'Consumos Diários',
+                'indexes': [models.Index(fields=['data', 'centro_custo', 'produto'], name='consumo_data_cc_produto_idx'), models.Index(fields=['centro_custo', 'data'], name='consumo_cc_data_idx')],
+            },
+        ),
+        migrations.RunPython(preencher_consumo, migrations.RunPython.noop),
+    ]
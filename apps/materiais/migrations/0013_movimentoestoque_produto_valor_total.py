@@ -0,0 +1,80 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:37
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def preencher_produto_e_valor(apps, schema_editor):
+    # O produto vem do lote, em um único UPDATE. O valor total é calculado
+    # reprocessando o razão de cada produto em ordem cronológica (custo
+    # médio ponderado móvel), e não lido de custo_medio, que pode estar
+    # vazio nos movimentos antigos; os dois são regravados juntos.
+    MovimentoEstoque = apps.get_model('materiais', 'MovimentoEstoque')
+    Lote = apps.get_model('materiais', 'Lote')
+
+    MovimentoEstoque.objects.filter(lote__isnull=False).update(
+        produto_id=Subquery(Lote.objects.filter(pk=OuterRef('lote_id')).values('produto_id')[:1])
+    )
+
+    movimentos = (
+        MovimentoEstoque.objects.filter(produto__isnull=False)
+        .order_by('data', 'id')
+        .values_list('id', 'produto_id', 'quantidade', 'valor_unitario')
+    )
+    saldos = {}
+    pendentes = []
+    for movimento_id, produto_id, quantidade, valor_unitario in movimentos.iterator(chunk_size=2000):
+        quantidade_atual, valor_atual, custo_medio = saldos.get(produto_id, (0, Decimal('0'), Decimal('0')))
+        # Mesmo critério de MovimentoEstoque.calcular_valor_total nesta versão
+        if quantidade > 0 and valor_unitario is not None:
+            valor_total = (quantidade * valor_unitario).quantize(Decimal('0.01'))
+            valor_atual += quantidade * valor_unitario
+        else:
+            valor_total = (quantidade * custo_medio).quantize(Decimal('0.01'))
+            valor_atual += quantidade * custo_medio
+        quantidade_atual += quantidade
+        if quantidade_atual > 0:
+            custo_medio = (valor_atual / quantidade_atual).quantize(Decimal('0.0001'))
+        else:
+            valor_atual = Decimal('0')
+        saldos[produto_id] = (quantidade_atual, valor_atual.quantize(Decimal('0.01')), custo_medio)
+
+        pendentes.append(MovimentoEstoque(id=movimento_id, custo_medio=custo_medio, valor_total=valor_total))
+        if len(pendentes) >= 1000:
+            MovimentoEstoque.objects.bulk_update(pendentes, ['custo_medio', 'valor_total'])
+            pendentes = []
+    MovimentoEstoque.objects.bulk_update(pendentes, ['custo_medio', 'valor_total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materiais', '0012_consumodiario'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movimentoestoque',
+            name='produto',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='movimentos', to='materiais.produto'),
+        ),
+        migrations.AddField(
+            model_name='movimentoestoque',
+            name='valor_total',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, help_text='Quantidade × custo do movimento, com o mesmo sinal da quantidade (negativo nas saídas).', max_digits=14, null=True, verbose_name='Valor Total'),
+        ),
+        migrations.RunPython(preencher_produto_e_valor, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='movimentoestoque',
+            index=models.Index(fields=['produto', 'tipo', 'data'], name='materiais_mov_prod_tipo_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movimentoestoque',
+            index=models.Index(fields=['produto', 'data'], name='materiais_mov_prod_data_idx'),
+        ),
+    ]
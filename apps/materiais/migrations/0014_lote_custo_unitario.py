@@ -0,0 +1,64 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:39
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def preencher_custo_dos_lotes(apps, schema_editor):
+    # Refaz, lote a lote e em ordem cronológica, a média ponderada que
+    # registrar_entrada passa a manter: cada entrada com valor pondera com o
+    # que restava no lote. Lotes sem entrada valorizada ficam sem custo.
+    Lote = apps.get_model('materiais', 'Lote')
+    MovimentoEstoque = apps.get_model('materiais', 'MovimentoEstoque')
+    movimentos = (
+        MovimentoEstoque.objects.filter(lote__isnull=False)
+        .order_by('lote_id', 'data', 'id')
+        .values_list('lote_id', 'quantidade', 'valor_unitario')
+    )
+    custos = {}
+    quantidade_no_lote = {}
+    for lote_id, quantidade, valor_unitario in movimentos.iterator(chunk_size=2000):
+        restante = quantidade_no_lote.get(lote_id, 0)
+        custo = custos.get(lote_id)
+        if quantidade > 0 and valor_unitario is not None:
+            if custo is None or restante <= 0:
+                custo = valor_unitario
+            else:
+                custo = (restante * custo + quantidade * valor_unitario) / (restante + quantidade)
+            custos[lote_id] = custo.quantize(Decimal('0.0001'))
+        quantidade_no_lote[lote_id] = max(restante + quantidade, 0)
+
+    lotes = [Lote(pk=lote_id, custo_unitario=custo) for lote_id, custo in custos.items()]
+    Lote.objects.bulk_update(lotes, ['custo_unitario'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materiais', '0013_movimentoestoque_produto_valor_total'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lote',
+            name='custo_unitario',
+            field=models.DecimalField(blank=True, decimal_places=4, help_text='Custo de aquisição do lote, ponderado entre as entradas (as saídas do lote são valorizadas por ele).', max_digits=12, null=True, verbose_name='Custo Unitário'),
+        ),
+        migrations.AlterField(
+            model_name='movimentoestoque',
+            name='valor_unitario',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=12, null=True),
+        ),
+        migrations.AlterField(
+            model_name='movimentoestoque',
+            name='custo_medio',
+            field=models.DecimalField(blank=True, decimal_places=4, help_text='Custo médio ponderado do produto em vigor após este movimento (saídas sem custo de lote são valorizadas por ele).', max_digits=12, null=True, verbose_name='Custo Médio Vigente'),
+        ),
+        migrations.AlterField(
+            model_name='consumodiario',
+            name='valor',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Soma do valor total das saídas (custo do lote de cada retirada).', max_digits=14, verbose_name='Valor Consumido (R$)'),
+        ),
+        migrations.RunPython(preencher_custo_dos_lotes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materiais', '0014_lote_custo_unitario'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='posicaoestoquemensal',
+            name='custo_medio_final',
+            field=models.DecimalField(decimal_places=4, help_text='Custo médio do produto no momento do fechamento.', max_digits=12, verbose_name='Custo Médio Final'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.3 on 2026-10-18 19:56
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Até aqui, a requisição de origem de uma saída só constava da observação
+_ID_DA_REQUISICAO = re.compile(r'Atendimento da Requisição #(\d+)$')
+
+
+def preencher_requisicao(apps, schema_editor):
+    MovimentoEstoque = apps.get_model('materiais', 'MovimentoEstoque')
+    Requisicao = apps.get_model('materiais', 'Requisicao')
+    existentes = set(Requisicao.objects.values_list('pk', flat=True))
+    movimentos = MovimentoEstoque.objects.filter(
+        tipo='SAIDA', observacao__startswith='Atendimento da Requisição #'
+    ).values_list('pk', 'observacao')
+
+    atualizar = []
+    for movimento_id, observacao in movimentos.iterator(chunk_size=2000):
+        encontrado = _ID_DA_REQUISICAO.match(observacao)
+        if encontrado and int(encontrado.group(1)) in existentes:
+            atualizar.append(MovimentoEstoque(pk=movimento_id, requisicao_id=int(encontrado.group(1))))
+    MovimentoEstoque.objects.bulk_update(atualizar, ['requisicao'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materiais', '0015_posicaoestoquemensal_custo_4_casas'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movimentoestoque',
+            name='requisicao',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='movimentos', to='materiais.requisicao', verbose_name='Requisição'),
+        ),
+        migrations.RunPython(preencher_requisicao, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.3 on 2026-10-18 20:07
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def unir_linhas_repetidas(apps, schema_editor):
+    # Atendimentos simultâneos podiam criar mais de uma linha para o mesmo
+    # dia/centro/produto: os totais vão para a primeira e as demais saem.
+    ConsumoDiario = apps.get_model('materiais', 'ConsumoDiario')
+    repetidas = (
+        ConsumoDiario.objects.values('data', 'centro_custo', 'produto')
+        .annotate(linhas=Count('id'))
+        .filter(linhas__gt=1)
+    )
+    for chave in repetidas.iterator():
+        linhas = ConsumoDiario.objects.filter(
+            data=chave['data'], centro_custo=chave['centro_custo'], produto=chave['produto']
+        ).order_by('pk')
+        totais = linhas.aggregate(quantidade=Sum('quantidade'), valor=Sum('valor'))
+        primeira = linhas.first()
+        linhas.exclude(pk=primeira.pk).delete()
+        ConsumoDiario.objects.filter(pk=primeira.pk).update(**totais)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_centrocusto_caminho'),
+        ('materiais', '0016_movimentoestoque_requisicao'),
+    ]
+
+    operations = [
+        migrations.RunPython(unir_linhas_repetidas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='consumodiario',
+            constraint=models.UniqueConstraint(models.F('data'), django.db.models.functions.comparison.Coalesce('centro_custo', models.Value(0)), models.F('produto'), name='consumo_dia_cc_produto_unico'),
+        ),
+    ]
@@ -1,5 +1,5 @@
 # Em apps/materiais/models/__init__.py
 
 from .catalogo import Categoria, Almoxarifado, Produto, Classe, PDM, NaturezaDespesa
-from .transacao import Lote, MovimentoEstoque, FechamentoMensal, PosicaoEstoqueMensal
+from .transacao import Lote, MovimentoEstoque, SaldoProduto, FechamentoMensal, PosicaoEstoqueMensal, ConsumoDiario
 from .requisicao import Requisicao, ItemRequisicao
@@ -1,7 +1,9 @@
 # Em apps/materiais/models/catalogo.py
 
+from decimal import Decimal
+from django.core.exceptions import ObjectDoesNotExist
 from django.db import models
-from django.db.models import Sum, Case, When, F, DecimalField
+from django.db.models import F, Value
 from django.db.models.functions import Coalesce
 from django.utils import timezone
 
@@ -74,6 +76,28 @@ class NaturezaDespesa(models.Model):
         return f"{self.codigo} - {self.descricao}"        
 
 
+class ProdutoQuerySet(models.QuerySet):
+    def with_estoque(self):
+        """
+        Anota saldo, reservado, custo médio e valor em estoque de cada produto
+        com um LEFT JOIN em SaldoProduto, na mesma consulta da listagem.
+        As propriedades saldo_total, custo_medio etc. usam essas anotações
+        quando presentes.
+        """
+        return self.annotate(
+            estoque_quantidade=Coalesce(F('saldo__quantidade'), Value(0)),
+            estoque_reservado=Coalesce(F('saldo__quantidade_reservada'), Value(0)),
+            estoque_custo_medio=Coalesce(
+                F('saldo__custo_medio'), Value(Decimal('0')),
+                output_field=models.DecimalField(max_digits=12, decimal_places=4)
+            ),
+            estoque_valor=Coalesce(
+                F('saldo__valor_total'), Value(Decimal('0')),
+                output_field=models.DecimalField(max_digits=14, decimal_places=2)
+            ),
+        )
+
+
 class Produto(models.Model):
     categoria = models.ForeignKey(Categoria, on_delete=models.PROTECT, related_name='produtos', verbose_name="Categoria")
     codigo_produto = models.CharField(max_length=50, unique=True, verbose_name="Código do Produto")
@@ -108,86 +132,99 @@ class Produto(models.Model):
         null=True,
         blank=True
     )
+
+    objects = ProdutoQuerySet.as_manager()
     
     def calcular_saldo_ate(self, data_limite):
         """
-        Calcula o saldo total de um produto somando todas as ENTRADAS
-        e subtraindo todas as SAÍDAS até uma data e hora específicas.
+        Calcula o saldo total de um produto até uma data e hora específicas.
+        Parte da última fotografia de fechamento válida e soma apenas os
+        movimentos posteriores a ela (ver services.fechamento.calcular_posicoes).
         """
-        from .transacao import MovimentoEstoque
+        from ..services.fechamento import calcular_posicoes
 
         if not timezone.is_aware(data_limite):
             data_limite = timezone.make_aware(data_limite)
 
-        # --- CORREÇÃO APLICADA AQUI ---
-        # O nome do campo foi corrigido de 'data_movimento' para 'data'.
-        movimentos = MovimentoEstoque.objects.filter(
-            lote__produto=self, 
-            data__lte=data_limite  # <-- CAMPO CORRIGIDO
-        )
+        quantidade, _ = calcular_posicoes(data_limite, produtos=[self.pk]).get(self.pk, (0, 0))
+        return quantidade
 
-        resultado = movimentos.aggregate(
-            saldo=Sum(
-                Case(
-                    When(tipo='ENTRADA', then=F('quantidade')),
-                    When(tipo='SAIDA', then=-F('quantidade')),
-                    default=0,
-                    output_field=DecimalField()
-                )
-            )
-        )
+    def calcular_custo_medio_ate(self, data_limite):
+        """
+        Retorna o custo médio ponderado do produto vigente em uma data específica.
+        Cada movimento guarda o custo médio em vigor após ele, então basta ler
+        o último movimento até a data_limite, sem reprocessar o histórico.
+        """
+        from .transacao import MovimentoEstoque
 
-        return resultado['saldo'] or 0
+        if not timezone.is_aware(data_limite):
+            data_limite = timezone.make_aware(data_limite)
 
-    def calcular_custo_medio_ate(self, data_limite):
+        custo = MovimentoEstoque.objects.filter(
+            produto=self,
+            data__lte=data_limite,
+            custo_medio__isnull=False
+        ).order_by('-data', '-id').values_list('custo_medio', flat=True).first()
+
+        return custo if custo is not None else Decimal('0')
+
+    def _saldo_consolidado(self):
         """
-        Calcula o custo médio de um produto até uma data específica.
-        Para este exemplo, retornaremos o custo médio atual do produto,
-        mas esta lógica pode ser expandida para um cálculo histórico mais preciso.
+        Retorna a linha de SaldoProduto do produto, ou None se ele ainda
+        não teve movimentos. Em listagens, prefira Produto.objects.with_estoque().
         """
-        # Lógica simplificada: retorna o custo médio atual.
-        # Uma implementação mais complexa calcularia o custo médio ponderado
-        # com base em todos os movimentos de ENTRADA até a data_limite.
-        return self.custo_medio
+        try:
+            return self.saldo
+        except ObjectDoesNotExist:
+            return None
 
     @property
     def saldo_total(self):
         """
-        Calcula o saldo total do produto somando a quantidade de todos os seus lotes.
+        Retorna o saldo total do produto a partir da tabela consolidada SaldoProduto.
+        """
+        if 'estoque_quantidade' in self.__dict__:
+            return self.estoque_quantidade
+        saldo = self._saldo_consolidado()
+        return saldo.quantidade if saldo else 0
+
+    @property
+    def quantidade_reservada(self):
+        """
+        Quantidade já comprometida com requisições finalizadas e não atendidas.
+        """
+        if 'estoque_reservado' in self.__dict__:
+            return self.estoque_reservado
+        saldo = self._saldo_consolidado()
+        return saldo.quantidade_reservada if saldo else 0
+
+    @property
+    def saldo_disponivel(self):
+        """
+        Saldo que ainda pode ser requisitado: saldo atual menos o reservado.
         """
-        saldo = self.lotes.aggregate(total=Sum('quantidade_atual'))['total']
-        return saldo if saldo is not None else 0
+        return self.saldo_total - self.quantidade_reservada
 
     # --- PROPRIEDADES DE CUSTO ADICIONADAS ---
     @property
     def custo_medio(self):
         """
-        Calcula o Custo Médio Ponderado do produto.
+        Retorna o Custo Médio Ponderado do produto, mantido em SaldoProduto.
         """
-        # Importação local para evitar dependência circular
-        from .transacao import MovimentoEstoque
-        
-        entradas = MovimentoEstoque.objects.filter(lote__produto=self, tipo='ENTRADA')
-        
-        agregado = entradas.aggregate(
-            valor_total=Coalesce(Sum(F('quantidade') * F('valor_unitario')), 0, output_field=models.DecimalField()),
-            quantidade_total=Coalesce(Sum('quantidade'), 0, output_field=models.DecimalField())
-        )
-        
-        valor_total_entradas = agregado['valor_total']
-        quantidade_total_entradas = agregado['quantidade_total']
-
-        if quantidade_total_entradas == 0:
-            return 0.00
-        
-        return valor_total_entradas / quantidade_total_entradas
+        if 'estoque_custo_medio' in self.__dict__:
+            return self.estoque_custo_medio
+        saldo = self._saldo_consolidado()
+        return saldo.custo_medio if saldo else Decimal('0')
 
     @property
     def valor_total_em_estoque(self):
         """
-        Calcula o valor financeiro total do produto em estoque.
+        Retorna o valor financeiro total do produto em estoque.
         """
-        return self.saldo_total * self.custo_medio
+        if 'estoque_valor' in self.__dict__:
+            return self.estoque_valor
+        saldo = self._saldo_consolidado()
+        return saldo.valor_total if saldo else Decimal('0')
     # --- FIM DAS PROPRIEDADES DE CUSTO ---
 
     def __str__(self):
@@ -202,12 +239,34 @@ class Lote(models.Model):
     codigo_lote = models.CharField(max_length=100, blank=True, null=True, verbose_name="Código do Lote/Referência")
     data_validade = models.DateField(verbose_name="Data de Validade")
     quantidade_atual = models.PositiveIntegerField(default=0, verbose_name="Quantidade Atual no Lote")
+    custo_unitario = models.DecimalField(
+        "Custo Unitário",
+        max_digits=12,
+        decimal_places=4,
+        null=True,
+        blank=True,
+        help_text="Custo de aquisição do lote, ponderado entre as entradas (as saídas do lote são valorizadas por ele)."
+    )
     data_entrada = models.DateTimeField(default=timezone.now, verbose_name="Data de Entrada do Lote")
 
     def __str__(self):
         validade_formatada = self.data_validade.strftime('%d/%m/%Y')
         return f"Lote de {self.produto.nome_produto} (Val: {validade_formatada})"
 
+    def custo_apos_entrada(self, quantidade, valor_unitario):
+        """
+        Custo unitário do lote depois de receber 'quantidade' unidades a
+        'valor_unitario': média ponderada entre o que ainda resta no lote,
+        ao custo atual, e o que está entrando.
+        """
+        if valor_unitario is None:
+            return self.custo_unitario
+        valor_unitario = Decimal(str(valor_unitario))
+        if self.custo_unitario is None or self.quantidade_atual <= 0:
+            return valor_unitario.quantize(Decimal('0.0001'))
+        valor_total = self.quantidade_atual * self.custo_unitario + quantidade * valor_unitario
+        return (valor_total / (self.quantidade_atual + quantidade)).quantize(Decimal('0.0001'))
+
     class Meta:
         unique_together = ('produto', 'data_validade')
         verbose_name = "Lote de Produto"
@@ -3,12 +3,109 @@
 from django.db import models
 from django.conf import settings
 from django.utils import timezone
-from django.db.models import Sum
+from decimal import Decimal
+from django.db.models import DecimalField, F, OuterRef, Prefetch, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 
 # Importações relativas para aceder a modelos em outros ficheiros do mesmo pacote
 from .catalogo import Produto
+from .transacao import MovimentoEstoque
 from apps.core.models import CentroCusto
 
+CUSTO_UNITARIO = Coalesce(
+    F('produto__saldo__custo_medio'), Value(Decimal('0')),
+    output_field=DecimalField(max_digits=12, decimal_places=4)
+)
+
+
+def _valor_dos_itens(campo_quantidade):
+    """
+    Subconsulta correlacionada com a soma de quantidade x custo médio dos
+    itens da requisição externa (evita o GROUP BY sobre a consulta principal).
+    """
+    itens = (
+        ItemRequisicao.objects.filter(requisicao=OuterRef('pk'))
+        .order_by()
+        .values('requisicao')
+        .annotate(total=Sum(F(campo_quantidade) * CUSTO_UNITARIO))
+        .values('total')
+    )
+    return Coalesce(
+        Subquery(itens), Value(Decimal('0')),
+        output_field=DecimalField(max_digits=16, decimal_places=4)
+    )
+
+
+def _valor_baixado(**filtros):
+    """
+    Subconsulta com o valor efetivamente baixado pelas saídas do
+    atendimento (soma de valor_total, com o sinal invertido). Ao contrário
+    do custo médio vigente, não muda mais depois do atendimento.
+    """
+    saidas = (
+        MovimentoEstoque.objects.filter(tipo='SAIDA', **filtros)
+        .order_by()
+        .values('requisicao')
+        .annotate(total=-Sum('valor_total'))
+        .values('total')
+    )
+    return Coalesce(
+        Subquery(saidas), Value(Decimal('0')),
+        output_field=DecimalField(max_digits=14, decimal_places=2)
+    )
+
+
+class ItemRequisicaoQuerySet(models.QuerySet):
+    def com_custo(self):
+        """
+        Traz o produto junto (select_related) e anota o custo médio vigente
+        de cada item, lido de SaldoProduto na mesma consulta.
+        """
+        return self.select_related('produto').annotate(produto_custo_medio=CUSTO_UNITARIO)
+
+    def com_valor_baixado(self):
+        """
+        Traz o produto junto e anota o valor baixado de cada item pelas
+        saídas do atendimento; custo_unitario e valor_atendido passam a
+        usá-lo (ver _valor_baixado).
+        """
+        return self.select_related('produto').annotate(
+            valor_baixado=_valor_baixado(requisicao=OuterRef('requisicao'), produto=OuterRef('produto'))
+        )
+
+
+class RequisicaoQuerySet(models.QuerySet):
+    def com_totais(self):
+        """
+        Anota os valores totais solicitado e atendido de cada requisição,
+        calculados no banco a partir do custo médio de SaldoProduto.
+        """
+        return self.annotate(
+            total_solicitado=_valor_dos_itens('quantidade'),
+            total_atendido=_valor_dos_itens('quantidade_atendida'),
+        )
+
+    def com_itens(self):
+        """
+        Pré-carrega os itens com produto e custo unitário (ver com_custo).
+        """
+        return self.prefetch_related(
+            Prefetch('itens', queryset=ItemRequisicao.objects.com_custo().order_by('pk'))
+        )
+
+    def com_valores_baixados(self):
+        """
+        Para requisições encerradas: total atendido e itens valorizados
+        pelo que foi de fato baixado do estoque, e não pelo custo médio
+        vigente, que continua mudando depois do atendimento.
+        """
+        return self.annotate(
+            total_atendido=_valor_baixado(requisicao=OuterRef('pk'))
+        ).prefetch_related(
+            Prefetch('itens', queryset=ItemRequisicao.objects.com_valor_baixado().order_by('pk'))
+        )
+
+
 class Requisicao(models.Model):
     # ... (seus campos existentes, como solicitante, status, etc.) ...
     STATUS_CHOICES = (
@@ -28,15 +125,27 @@ class Requisicao(models.Model):
     data_estorno = models.DateTimeField(null=True, blank=True, verbose_name="Data do Estorno")
     motivo_estorno = models.TextField(null=True, blank=True, verbose_name="Motivo do Estorno")
 
+    objects = RequisicaoQuerySet.as_manager()
+
+    def _total(self, campo):
+        """
+        Lê a anotação `campo` (total_solicitado ou total_atendido) quando a
+        instância veio de com_totais()/com_valores_baixados(); senão calcula
+        só esse total no banco, sem sobrescrever o outro.
+        """
+        if campo not in self.__dict__:
+            setattr(self, campo, Requisicao.objects.filter(pk=self.pk).com_totais().values_list(campo, flat=True).get())
+        return self.__dict__[campo]
+
     @property
     def valor_total_solicitado(self):
-        """ Soma o valor solicitado de todos os itens da requisição. """
-        return sum(item.valor_solicitado for item in self.itens.all())
+        """ Soma o valor solicitado de todos os itens da requisição (calculado no banco). """
+        return self._total('total_solicitado')
 
     @property
     def valor_total_atendido(self):
-        """ Soma o valor efetivamente atendido de todos os itens da requisição. """
-        return sum(item.valor_atendido for item in self.itens.all())
+        """ Soma o valor efetivamente atendido de todos os itens da requisição (calculado no banco). """
+        return self._total('total_atendido')
 
     def __str__(self):
         return f"Requisição #{self.id} por {self.solicitante.username} ({self.get_status_display()})"
@@ -51,17 +160,35 @@ class ItemRequisicao(models.Model):
     produto = models.ForeignKey(Produto, on_delete=models.PROTECT)
     quantidade = models.PositiveIntegerField(verbose_name="Quantidade Solicitada")
     quantidade_atendida = models.PositiveIntegerField(null=True, blank=True, verbose_name="Quantidade Atendida")
-    
+
+    objects = ItemRequisicaoQuerySet.as_manager()
+
+    @property
+    def custo_unitario(self):
+        """
+        Custo médio vigente do produto; usa a anotação de com_custo() quando
+        presente. Com com_valor_baixado(), é o custo médio do que foi baixado.
+        """
+        if 'valor_baixado' in self.__dict__:
+            if not self.quantidade_atendida:
+                return Decimal('0')
+            return (self.valor_baixado / self.quantidade_atendida).quantize(Decimal('0.0001'))
+        if 'produto_custo_medio' in self.__dict__:
+            return self.produto_custo_medio
+        return self.produto.custo_medio
+
     @property
     def valor_solicitado(self):
         """ Calcula o valor da quantidade solicitada com base no custo médio do produto. """
-        return self.quantidade * self.produto.custo_medio
+        return self.quantidade * self.custo_unitario
 
     @property
     def valor_atendido(self):
-        """ Calcula o valor da quantidade atendida com base no custo médio do produto. """
+        """ Calcula o valor da quantidade atendida com base no custo médio do produto (ou no valor baixado). """
+        if 'valor_baixado' in self.__dict__:
+            return self.valor_baixado
         if self.quantidade_atendida is not None:
-            return self.quantidade_atendida * self.produto.custo_medio
+            return self.quantidade_atendida * self.custo_unitario
         return 0 # Retorna 0 se a quantidade atendida ainda não foi definida
 
     def __str__(self):
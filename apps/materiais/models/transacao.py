@@ -1,11 +1,16 @@
 # Em apps/materiais/models/transacao.py
 
-from django.db import models
+from decimal import Decimal
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Coalesce, Greatest
 from django.conf import settings
+from django.utils import timezone
 from .catalogo import Produto
 from django.urls import reverse
 # Importações relativas
 from .catalogo import Almoxarifado, Lote
+from apps.core.models import CentroCusto
 
 class MovimentoEstoque(models.Model):
     TIPO_MOVIMENTO = (
@@ -24,28 +29,241 @@ class MovimentoEstoque(models.Model):
         blank=True
     )
     
+    # Cópia de lote.produto, para agregar o razão por produto sem o join com Lote
+    produto = models.ForeignKey(
+        Produto,
+        on_delete=models.PROTECT,
+        related_name='movimentos',
+        null=True,
+        blank=True,
+        editable=False
+    )
     almoxarifado = models.ForeignKey(Almoxarifado, on_delete=models.PROTECT, related_name="movimentos")
     quantidade = models.IntegerField(help_text="Para SAÍDAS, insira um valor positivo. O sistema o tornará negativo.")
-    valor_unitario = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    # Nas entradas, o valor pago; nas saídas, o custo do lote no momento da retirada
+    valor_unitario = models.DecimalField(max_digits=12, decimal_places=4, null=True, blank=True)
+    custo_medio = models.DecimalField(
+        "Custo Médio Vigente",
+        max_digits=12,
+        decimal_places=4,
+        null=True,
+        blank=True,
+        help_text="Custo médio ponderado do produto em vigor após este movimento (saídas sem custo de lote são valorizadas por ele)."
+    )
+    valor_total = models.DecimalField(
+        "Valor Total",
+        max_digits=14,
+        decimal_places=2,
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Quantidade × custo do movimento, com o mesmo sinal da quantidade (negativo nas saídas)."
+    )
     tipo = models.CharField(max_length=7, choices=TIPO_MOVIMENTO)
     usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Usuário Responsável")
     data = models.DateTimeField(auto_now_add=True, verbose_name="Data do Movimento")
     observacao = models.TextField(blank=True, null=True, help_text="Ex: NF 1234, Requisição, Carga Inicial etc.")
+    # Requisição atendida por esta saída (vazio nos demais movimentos)
+    requisicao = models.ForeignKey(
+        'materiais.Requisicao',
+        on_delete=models.SET_NULL,
+        related_name='movimentos',
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Requisição"
+    )
     
     def save(self, *args, **kwargs):
         if self.tipo == 'SAIDA' and self.quantidade > 0:
             self.quantidade = -self.quantidade
-        super().save(*args, **kwargs)
+        # O saldo consolidado é atualizado na mesma transação do movimento,
+        # que guarda o custo médio vigente calculado por ele.
+        if self._state.adding:
+            # Vale para todos os caminhos de gravação: views, serviços e importações
+            from ..services.periodo import garantir_periodo_aberto
+            # data (auto_now_add) só é preenchida pelo super().save()
+            garantir_periodo_aberto(self.data or timezone.now())
+        with transaction.atomic():
+            if self._state.adding and self.lote_id:
+                SaldoProduto.objects.registrar_movimento(self)
+            self.atualizar_campos_derivados()
+            super().save(*args, **kwargs)
+
+    def calcular_valor_total(self):
+        """
+        Valor do movimento, com o mesmo critério de SaldoProduto.aplicar:
+        pelo valor unitário (o pago nas entradas, o custo do lote nas saídas)
+        ou, sem ele, pelo custo médio vigente. None quando não há custo conhecido.
+        """
+        if self.valor_unitario is not None:
+            custo = Decimal(str(self.valor_unitario))
+        elif self.custo_medio is not None:
+            custo = Decimal(str(self.custo_medio))
+        else:
+            return None
+        return (self.quantidade * custo).quantize(Decimal('0.01'))
+
+    def atualizar_campos_derivados(self):
+        """
+        Preenche os campos desnormalizados (produto e valor_total). O save()
+        chama sozinho; quem grava com bulk_create passa por
+        SaldoProduto.objects.registrar_movimentos, que também chama.
+        """
+        self.produto_id = self.lote.produto_id if self.lote_id else None
+        self.valor_total = self.calcular_valor_total()
 
     def __str__(self):
-        if self.lote:
-            return f"{self.get_tipo_display()} de {self.lote.produto.nome_produto}"
+        if self.produto_id:
+            return f"{self.get_tipo_display()} de {self.produto.nome_produto}"
         return f"Movimento #{self.id} (sem lote)"
 
     class Meta:
         verbose_name = "Movimento de Estoque"
         verbose_name_plural = "Movimentos de Estoque"
         ordering = ['-data']
+        indexes = [
+            # Consultas de custo/saldo "até uma data" por lote
+            models.Index(fields=['lote', 'data'], name='materiais_mov_lote_data_idx'),
+            # Movimentos posteriores a uma fotografia de fechamento
+            models.Index(fields=['data'], name='materiais_mov_data_idx'),
+            # Agregados do razão por produto (saldo, custo, entradas/saídas), sem o join com Lote
+            models.Index(fields=['produto', 'tipo', 'data'], name='materiais_mov_prod_tipo_idx'),
+            models.Index(fields=['produto', 'data'], name='materiais_mov_prod_data_idx'),
+        ]
+
+# =====================================================================
+# SALDO CONSOLIDADO POR PRODUTO
+# =====================================================================
+
+class SaldoProdutoManager(models.Manager):
+    def registrar_movimento(self, movimento):
+        """
+        Aplica um MovimentoEstoque novo ao saldo do seu produto e grava no
+        movimento o custo médio vigente. A linha do saldo é bloqueada
+        (select_for_update) até o fim da transação.
+        """
+        saldo, _ = self.select_for_update().get_or_create(produto_id=movimento.lote.produto_id)
+        movimento.custo_medio = saldo.aplicar(movimento.quantidade, movimento.valor_unitario)
+        saldo.save(update_fields=['quantidade', 'valor_total', 'custo_medio', 'data_atualizacao'])
+        return saldo
+
+    def registrar_movimentos(self, movimentos):
+        """
+        Versão em lote de registrar_movimento, para movimentos que serão
+        gravados com bulk_create (que não passa pelo save()); também preenche
+        produto e valor_total de cada movimento. Bloqueia os
+        saldos envolvidos em uma única consulta e os grava com bulk_update.
+        Como o save(), recusa movimentos em período fechado.
+        """
+        from ..services.periodo import garantir_periodo_aberto
+        for movimento in movimentos:
+            garantir_periodo_aberto(movimento.data)
+
+        produto_ids = {movimento.lote.produto_id for movimento in movimentos}
+        saldos = {
+            saldo.produto_id: saldo
+            for saldo in self.select_for_update().filter(produto_id__in=produto_ids).order_by('produto_id')
+        }
+        novos = {produto_id: self.model(produto_id=produto_id) for produto_id in produto_ids - saldos.keys()}
+
+        for movimento in movimentos:
+            produto_id = movimento.lote.produto_id
+            saldo = saldos.get(produto_id) or novos[produto_id]
+            movimento.custo_medio = saldo.aplicar(movimento.quantidade, movimento.valor_unitario)
+            movimento.atualizar_campos_derivados()
+
+        agora = timezone.now()
+        for saldo in saldos.values():
+            saldo.data_atualizacao = agora
+        self.bulk_update(saldos.values(), ['quantidade', 'valor_total', 'custo_medio', 'data_atualizacao'])
+        self.bulk_create(novos.values())
+
+    def ajustar_reservas(self, quantidades):
+        """
+        Soma (ou, com valores negativos, subtrai) quantidades reservadas por
+        produto: {produto_id: variacao}. Usa um único UPDATE com F(), sem
+        deixar a reserva ficar negativa.
+        """
+        quantidades = {produto_id: variacao for produto_id, variacao in quantidades.items() if variacao}
+        if not quantidades:
+            return
+        # Garante a linha de saldo de produtos que ainda não tiveram movimento.
+        self.bulk_create([self.model(produto_id=produto_id) for produto_id in quantidades], ignore_conflicts=True)
+        variacao = Case(
+            *[When(produto_id=produto_id, then=Value(valor)) for produto_id, valor in quantidades.items()],
+            default=Value(0),
+            output_field=models.IntegerField()
+        )
+        self.filter(produto_id__in=quantidades).update(
+            quantidade_reservada=Greatest(F('quantidade_reservada') + variacao, Value(0))
+        )
+
+
+class SaldoProduto(models.Model):
+    """
+    Saldo consolidado (desnormalizado) de um produto: quantidade, valor total
+    e custo médio ponderado. É mantido pelo próprio razão de estoque, pois cada
+    MovimentoEstoque criado atualiza esta linha na mesma transação.
+    Também guarda a quantidade reservada por requisições finalizadas.
+    Pode ser reconstruído a partir dos movimentos com 'recalcular_saldos'.
+    """
+    produto = models.OneToOneField(
+        Produto,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='saldo',
+        verbose_name="Produto"
+    )
+    quantidade = models.IntegerField("Quantidade em Estoque", default=0)
+    valor_total = models.DecimalField("Valor Total (R$)", max_digits=14, decimal_places=2, default=0)
+    custo_medio = models.DecimalField("Custo Médio (R$)", max_digits=12, decimal_places=4, default=0)
+    quantidade_reservada = models.PositiveIntegerField(
+        "Quantidade Reservada",
+        default=0,
+        help_text="Soma dos itens de requisições finalizadas que ainda aguardam atendimento."
+    )
+    data_atualizacao = models.DateTimeField("Atualizado em", auto_now=True)
+
+    objects = SaldoProdutoManager()
+
+    class Meta:
+        verbose_name = "Saldo de Produto"
+        verbose_name_plural = "Saldos de Produtos"
+
+    def __str__(self):
+        return f"Saldo de {self.produto.nome_produto}: {self.quantidade}"
+
+    @property
+    def quantidade_disponivel(self):
+        """Saldo físico menos o que já está reservado para requisições pendentes."""
+        return self.quantidade - self.quantidade_reservada
+
+    def aplicar(self, quantidade, valor_unitario=None):
+        """
+        Aplica uma variação de quantidade ao saldo (custo médio ponderado móvel)
+        em O(1) e retorna o custo médio vigente após o movimento.
+        Movimentos com valor unitário (entradas e saídas valorizadas pelo custo
+        do lote) entram no valor total por ele; ajustes e saídas antigas, sem
+        valor, pelo custo médio vigente. Assim o valor em estoque acompanha o
+        custo dos lotes que restaram.
+        """
+        if valor_unitario is not None:
+            self.valor_total += quantidade * Decimal(str(valor_unitario))
+        else:
+            self.valor_total += quantidade * self.custo_medio
+        self.quantidade += quantidade
+        # Saídas antigas, valorizadas pela média, podem descasar do custo dos lotes
+        self.valor_total = max(self.valor_total, Decimal('0'))
+
+        if self.quantidade > 0:
+            self.custo_medio = (self.valor_total / self.quantidade).quantize(Decimal('0.0001'))
+        else:
+            # Estoque zerado: não sobra valor, mas mantém o último custo conhecido.
+            self.valor_total = Decimal('0')
+        self.valor_total = Decimal(self.valor_total).quantize(Decimal('0.01'))
+        return self.custo_medio
+
 
 # =====================================================================
 # NOVOS MODELOS PARA O FECHAMENTO MENSAL
@@ -108,10 +326,12 @@ class PosicaoEstoqueMensal(models.Model):
         decimal_places=2,
         help_text="Saldo do produto no momento exato do fechamento."
     )
+    # Mesma precisão de SaldoProduto.custo_medio: o custo é o ponto de partida
+    # do fechamento seguinte e não pode perder casas a cada mês
     custo_medio_final = models.DecimalField(
         "Custo Médio Final", 
-        max_digits=10, 
-        decimal_places=2,
+        max_digits=12, 
+        decimal_places=4,
         help_text="Custo médio do produto no momento do fechamento."
     )
     valor_total_final = models.DecimalField(
@@ -128,4 +348,51 @@ class PosicaoEstoqueMensal(models.Model):
         unique_together = ('fechamento', 'produto')
 
     def __str__(self):
-        return f"{self.produto.nome_produto} em {self.fechamento}"        
\ No newline at end of file
+        return f"{self.produto.nome_produto} em {self.fechamento}"
+
+
+class ConsumoDiario(models.Model):
+    """
+    Consumo já agregado por dia, centro de custo e produto (quantidade e
+    valor das saídas de requisições atendidas). É acumulado no atendimento,
+    na mesma transação da baixa, e pode ser reconstruído a partir dos
+    movimentos com o comando 'reconstruir_consumo'.
+
+    Há uma linha por dia/centro/produto (restrição única, com o centro de
+    custo vazio contado como um valor); ver services.consumo.registrar_consumo.
+    """
+    data = models.DateField("Data do Atendimento")
+    centro_custo = models.ForeignKey(
+        CentroCusto,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='consumos_diarios',
+        verbose_name="Centro de Custo"
+    )
+    produto = models.ForeignKey(Produto, on_delete=models.PROTECT, related_name='consumos_diarios')
+    quantidade = models.PositiveIntegerField("Quantidade Consumida", default=0)
+    valor = models.DecimalField(
+        "Valor Consumido (R$)",
+        max_digits=14,
+        decimal_places=2,
+        default=0,
+        help_text="Soma do valor total das saídas (custo do lote de cada retirada)."
+    )
+
+    class Meta:
+        verbose_name = "Consumo Diário"
+        verbose_name_plural = "Consumos Diários"
+        indexes = [
+            models.Index(fields=['data', 'centro_custo', 'produto'], name='consumo_data_cc_produto_idx'),
+            models.Index(fields=['centro_custo', 'data'], name='consumo_cc_data_idx'),
+        ]
+        constraints = [
+            # Expressão, e não só os campos: NULL em centro_custo não repetiria a chave no banco
+            models.UniqueConstraint(
+                F('data'), Coalesce('centro_custo', Value(0)), F('produto'), name='consumo_dia_cc_produto_unico'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.produto.nome_produto} em {self.data:%d/%m/%Y}: {self.quantidade}"        
\ No newline at end of file
@@ -0,0 +1,11 @@
+# Em apps/materiais/services/__init__.py
+
+# Regras de negócio do estoque que são compartilhadas entre views,
+# comandos de gestão e o admin.
+from .consumo import registrar_consumo, reconstruir_consumo
+from .fechamento import (
+    ResultadoFechamento, executar_fechamento, fim_do_periodo, reabrir_ultimo_fechamento
+)
+from .periodo import (
+    PeriodoFechadoError, garantir_periodo_aberto, invalidar_periodos_fechados, periodo_fechado
+)
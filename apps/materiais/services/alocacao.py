@@ -0,0 +1,90 @@
+# Em apps/materiais/services/alocacao.py
+
+from collections import defaultdict
+
+from django.db.models import F
+
+from ..models import Lote, MovimentoEstoque, SaldoProduto
+from .concorrencia import repetir_em_conflito
+
+# Observação das saídas de atendimento (a requisição de origem fica no campo 'requisicao')
+OBSERVACAO_ATENDIMENTO = "Atendimento da Requisição #{}"
+
+
+def alocar_fefo(itens, lotes):
+    """
+    Distribui a quantidade atendida de cada item pelos lotes do seu produto,
+    do que vence primeiro para o que vence por último (FEFO), em memória.
+    'lotes' deve vir ordenado por data de validade. As quantidades dos lotes
+    são decrementadas nos próprios objetos.
+    Retorna a lista de (item, lote, quantidade_retirada).
+    """
+    lotes_por_produto = defaultdict(list)
+    for lote in lotes:
+        lotes_por_produto[lote.produto_id].append(lote)
+
+    retiradas = []
+    for item in itens:
+        quantidade_a_atender = item.quantidade_atendida
+        if not quantidade_a_atender or quantidade_a_atender <= 0:
+            continue
+
+        for lote in lotes_por_produto[item.produto_id]:
+            if quantidade_a_atender <= 0:
+                break
+            if lote.quantidade_atual <= 0:
+                continue
+
+            quantidade_a_retirar = min(lote.quantidade_atual, quantidade_a_atender)
+            lote.quantidade_atual -= quantidade_a_retirar
+            quantidade_a_atender -= quantidade_a_retirar
+            retiradas.append((item, lote, quantidade_a_retirar))
+
+    return retiradas
+
+
+@repetir_em_conflito
+def baixar_itens_requisicao(requisicao, itens, almoxarifado, usuario):
+    """
+    Dá baixa no estoque dos itens atendidos de uma requisição.
+
+    Todos os lotes candidatos são lidos e bloqueados em uma única consulta
+    (select_for_update); as saídas são gravadas com bulk_create e os lotes
+    com um único bulk_update, que subtrai no banco (F()) o total retirado de
+    cada lote. Retorna os movimentos de SAÍDA criados.
+    """
+    itens = list(itens)
+    lotes = list(
+        Lote.objects.select_for_update()
+        .filter(produto_id__in={item.produto_id for item in itens}, quantidade_atual__gt=0)
+        .order_by('produto_id', 'data_validade')
+    )
+
+    retiradas = alocar_fefo(itens, lotes)
+    movimentos = [
+        MovimentoEstoque(
+            lote=lote,
+            almoxarifado=almoxarifado,
+            quantidade=-quantidade,  # bulk_create não passa pelo save(), que inverte o sinal das saídas
+            # A saída é valorizada pelo custo do lote de onde o material saiu
+            valor_unitario=lote.custo_unitario,
+            tipo='SAIDA',
+            usuario=usuario,
+            requisicao=requisicao,
+            observacao=OBSERVACAO_ATENDIMENTO.format(requisicao.id)
+        )
+        for item, lote, quantidade in retiradas
+    ]
+    if not movimentos:
+        return []
+
+    SaldoProduto.objects.registrar_movimentos(movimentos)
+    MovimentoEstoque.objects.bulk_create(movimentos)
+
+    retirado_por_lote = defaultdict(int)
+    for _, lote, quantidade in retiradas:
+        retirado_por_lote[lote] += quantidade
+    for lote, quantidade in retirado_por_lote.items():
+        lote.quantidade_atual = F('quantidade_atual') - quantidade
+    Lote.objects.bulk_update(retirado_por_lote.keys(), ['quantidade_atual'])
+    return movimentos
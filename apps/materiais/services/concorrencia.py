@@ -0,0 +1,47 @@
+# Em apps/materiais/services/concorrencia.py
+
+import functools
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+
+TENTATIVAS_PADRAO = 3
+
+
+def repetir_em_conflito(func=None, *, tentativas=None):
+    """
+    Executa a função dentro de transaction.atomic() e, se o banco abortar a
+    transação por conflito de bloqueio (deadlock, tempo de espera do lock
+    esgotado, banco ocupado), a repete do início com uma pequena espera.
+
+    Se a chamada já estiver dentro de uma transação, não há como repetir só
+    um pedaço dela: a função roda uma única vez e o erro sobe para quem abriu
+    a transação externa.
+
+    O número de tentativas pode ser ajustado por ESTOQUE_TENTATIVAS_CONFLITO.
+    """
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def envoltorio(*args, **kwargs):
+            if transaction.get_connection().in_atomic_block:
+                with transaction.atomic():
+                    return funcao(*args, **kwargs)
+
+            total = tentativas or getattr(settings, 'ESTOQUE_TENTATIVAS_CONFLITO', TENTATIVAS_PADRAO)
+            for tentativa in range(1, total + 1):
+                try:
+                    with transaction.atomic():
+                        return funcao(*args, **kwargs)
+                except OperationalError:
+                    if tentativa == total:
+                        raise
+                    # Espera crescente com um pouco de aleatoriedade para não
+                    # colidir de novo com a mesma transação concorrente.
+                    time.sleep(0.05 * tentativa + random.uniform(0, 0.05))
+        return envoltorio
+
+    if func is not None:
+        return decorador(func)
+    return decorador
@@ -0,0 +1,109 @@
+# Em apps/materiais/services/consumo.py
+
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import ConsumoDiario, MovimentoEstoque, Requisicao
+
+
+def _valor_da_saida(valor_total):
+    # Saídas são gravadas com quantidade (e valor total) negativos
+    return -(valor_total or Decimal('0'))
+
+
+def _somar_consumo(data, centro_custo_id, produto_id, quantidade, valor):
+    """
+    Soma na linha do dia/centro/produto com F(); se ela ainda não existe,
+    cria. Se outra transação criar a mesma linha entre o UPDATE e o INSERT,
+    a restrição única recusa o INSERT e a soma é refeita por UPDATE.
+    """
+    linha = ConsumoDiario.objects.filter(data=data, centro_custo_id=centro_custo_id, produto_id=produto_id)
+    somar = {'quantidade': F('quantidade') + quantidade, 'valor': F('valor') + valor}
+    if linha.update(**somar):
+        return
+    try:
+        with transaction.atomic():
+            ConsumoDiario.objects.create(
+                data=data, centro_custo_id=centro_custo_id, produto_id=produto_id,
+                quantidade=quantidade, valor=valor
+            )
+    except IntegrityError:
+        linha.update(**somar)
+
+
+def registrar_consumo(requisicao, movimentos):
+    """
+    Acumula as saídas de um atendimento na tabela ConsumoDiario (dia do
+    atendimento × centro de custo × produto). Deve ser chamada na transação
+    do atendimento, depois de gravados os movimentos (que já trazem o
+    produto e o valor total).
+    """
+    consumo = defaultdict(lambda: [0, Decimal('0')])
+    for movimento in movimentos:
+        totais = consumo[movimento.produto_id]
+        totais[0] += -movimento.quantidade
+        totais[1] += _valor_da_saida(movimento.valor_total)
+
+    data = timezone.localdate(requisicao.data_atendimento)
+    for produto_id, (quantidade, valor) in consumo.items():
+        _somar_consumo(data, requisicao.centro_custo_id, produto_id, quantidade, valor.quantize(Decimal('0.01')))
+
+
+@transaction.atomic
+def reconstruir_consumo(data_inicio=None, data_fim=None):
+    """
+    Recalcula a tabela ConsumoDiario (toda ou só entre as datas informadas)
+    a partir das saídas de atendimento do razão de estoque. Retorna o
+    número de linhas gravadas.
+    """
+    requisicoes = Requisicao.objects.filter(status='ATENDIDA', data_atendimento__isnull=False)
+    consumos = ConsumoDiario.objects.all()
+    movimentos = MovimentoEstoque.objects.filter(
+        tipo='SAIDA', produto__isnull=False, requisicao__isnull=False
+    )
+    # A saída é gravada instantes antes da data de atendimento: um dia de
+    # folga nos extremos e o filtro exato é feito pela requisição
+    if data_inicio:
+        inicio = timezone.make_aware(datetime.datetime.combine(data_inicio, datetime.time.min))
+        requisicoes = requisicoes.filter(data_atendimento__gte=inicio)
+        consumos = consumos.filter(data__gte=data_inicio)
+        movimentos = movimentos.filter(data__gte=inicio - datetime.timedelta(days=1))
+    if data_fim:
+        fim = timezone.make_aware(datetime.datetime.combine(data_fim + datetime.timedelta(days=1), datetime.time.min))
+        requisicoes = requisicoes.filter(data_atendimento__lt=fim)
+        consumos = consumos.filter(data__lte=data_fim)
+        movimentos = movimentos.filter(data__lt=fim + datetime.timedelta(days=1))
+
+    destino = {
+        requisicao_id: (timezone.localdate(data_atendimento), centro_custo_id)
+        for requisicao_id, data_atendimento, centro_custo_id in requisicoes.values_list(
+            'id', 'data_atendimento', 'centro_custo_id'
+        ).iterator(chunk_size=2000)
+    }
+
+    consumo = defaultdict(lambda: [0, Decimal('0')])
+    for requisicao_id, produto_id, quantidade, valor_total in movimentos.values_list(
+        'requisicao_id', 'produto_id', 'quantidade', 'valor_total'
+    ).iterator(chunk_size=2000):
+        chave = destino.get(requisicao_id)
+        if chave is None:
+            continue
+        totais = consumo[(*chave, produto_id)]
+        totais[0] += -quantidade
+        totais[1] += _valor_da_saida(valor_total)
+
+    consumos.delete()
+    linhas = [
+        ConsumoDiario(
+            data=data, centro_custo_id=centro_custo_id, produto_id=produto_id,
+            quantidade=quantidade, valor=valor.quantize(Decimal('0.01'))
+        )
+        for (data, centro_custo_id, produto_id), (quantidade, valor) in consumo.items()
+    ]
+    ConsumoDiario.objects.bulk_create(linhas, batch_size=1000)
+    return len(linhas)
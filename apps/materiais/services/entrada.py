@@ -0,0 +1,67 @@
+# Em apps/materiais/services/entrada.py
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from ..models import Lote, MovimentoEstoque
+from .concorrencia import repetir_em_conflito
+
+
+def _bloquear_lote(produto, data_validade, codigo_lote):
+    """
+    Lê o lote com select_for_update ou o cria. Se outra entrada criar o
+    mesmo lote entre a leitura e o INSERT, a restrição única recusa o
+    INSERT (IntegrityError, que não é repetido por repetir_em_conflito):
+    desfeito o savepoint, o lote criado pela outra é lido e bloqueado.
+    """
+    lotes = Lote.objects.select_for_update()
+    try:
+        return lotes.get(produto=produto, data_validade=data_validade), False
+    except Lote.DoesNotExist:
+        pass
+    try:
+        with transaction.atomic():
+            return Lote.objects.create(
+                produto=produto,
+                data_validade=data_validade,
+                codigo_lote=codigo_lote,
+                quantidade_atual=0  # A quantidade será adicionada a seguir
+            ), True
+    except IntegrityError:
+        return lotes.get(produto=produto, data_validade=data_validade), False
+
+
+@repetir_em_conflito
+def registrar_entrada(produto, quantidade, valor_unitario, data_validade, almoxarifado, usuario,
+                      codigo_lote=None, observacao=None):
+    """
+    Registra a entrada de material em um lote (criado se ainda não existir)
+    e o MovimentoEstoque correspondente.
+
+    O lote é lido com select_for_update e a quantidade é somada no próprio
+    banco com F(), para que duas entradas (ou uma entrada e um atendimento)
+    simultâneas no mesmo lote não percam atualizações. O custo unitário do
+    lote passa a ser a média ponderada entre o saldo do lote e a entrada.
+    """
+    lote, created = _bloquear_lote(produto, data_validade, codigo_lote)
+
+    # Com a linha bloqueada, a quantidade lida é a atual: o custo pode ser calculado aqui
+    atualizacao = {
+        'quantidade_atual': F('quantidade_atual') + quantidade,
+        'custo_unitario': lote.custo_apos_entrada(quantidade, valor_unitario),
+    }
+    # Se o lote já existia, podemos atualizar o código dele se um novo foi fornecido.
+    if not created and codigo_lote:
+        atualizacao['codigo_lote'] = codigo_lote
+    Lote.objects.filter(pk=lote.pk).update(**atualizacao)
+    lote.refresh_from_db(fields=['quantidade_atual', 'custo_unitario', 'codigo_lote'])
+
+    return MovimentoEstoque.objects.create(
+        lote=lote,
+        almoxarifado=almoxarifado,
+        quantidade=quantidade,
+        valor_unitario=valor_unitario,
+        tipo='ENTRADA',
+        usuario=usuario,
+        observacao=observacao
+    )
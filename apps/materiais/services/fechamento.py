@@ -0,0 +1,171 @@
+# Em apps/materiais/services/fechamento.py
+
+import calendar
+import time
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Max, Q, Sum
+from django.utils import timezone
+
+from ..models import FechamentoMensal, MovimentoEstoque, PosicaoEstoqueMensal, Produto
+from .periodo import invalidar_periodos_fechados
+
+TAMANHO_LOTE_GRAVACAO = 1000
+
+
+@dataclass
+class ResultadoFechamento:
+    fechamento: FechamentoMensal
+    total_posicoes: int
+    duracao: float
+
+
+def fim_do_periodo(mes, ano):
+    """Retorna o último instante (com fuso horário) do mês informado."""
+    _, ultimo_dia = calendar.monthrange(ano, mes)
+    return timezone.make_aware(timezone.datetime(ano, mes, ultimo_dia, 23, 59, 59, 999999))
+
+
+def fechamento_base(data_limite):
+    """
+    Retorna o FechamentoMensal ATIVO mais recente cujo período termina até
+    data_limite e que ainda pode servir de ponto de partida, ou None.
+
+    Uma fotografia deixa de valer se algum movimento foi gravado dentro do seu
+    período depois de ela ter sido tirada (ex.: período reaberto e movimentado).
+    """
+    data_local = timezone.localtime(data_limite)
+    ano, mes = data_local.year, data_local.month
+    if data_limite < fim_do_periodo(mes, ano):
+        # O mês de data_limite ainda não terminou: a base é o mês anterior.
+        mes, ano = (12, ano - 1) if mes == 1 else (mes - 1, ano)
+
+    fechamento = FechamentoMensal.objects.filter(
+        Q(ano__lt=ano) | Q(ano=ano, mes__lte=mes),
+        status='ATIVO'
+    ).order_by('-ano', '-mes').first()
+    if fechamento is None:
+        return None
+
+    movimentado_depois = MovimentoEstoque.objects.filter(
+        data__gt=fechamento.data_fechamento,
+        data__lte=fim_do_periodo(fechamento.mes, fechamento.ano)
+    ).exists()
+    return None if movimentado_depois else fechamento
+
+
+def calcular_posicoes(data_limite, produtos=None):
+    """
+    Calcula a posição (quantidade, custo médio) dos produtos em data_limite.
+
+    Parte da última fotografia válida (PosicaoEstoqueMensal) e aplica apenas
+    os movimentos posteriores a ela, com consultas agrupadas; sem fotografia,
+    percorre todo o histórico. 'produtos' restringe o cálculo a alguns ids.
+    Retorna um dicionário {produto_id: (quantidade, custo_medio)}.
+    """
+    movimentos = MovimentoEstoque.objects.filter(produto__isnull=False, data__lte=data_limite).order_by()
+    if produtos is not None:
+        movimentos = movimentos.filter(produto_id__in=produtos)
+
+    posicoes = {}
+    base = fechamento_base(data_limite)
+    if base is not None:
+        fotografia = base.posicoes.all()
+        if produtos is not None:
+            fotografia = fotografia.filter(produto_id__in=produtos)
+        posicoes = {
+            produto_id: (quantidade, custo_medio)
+            for produto_id, quantidade, custo_medio in fotografia.values_list(
+                'produto_id', 'quantidade_final', 'custo_medio_final'
+            )
+        }
+        movimentos = movimentos.filter(data__gt=fim_do_periodo(base.mes, base.ano))
+
+    # 1. Variação do saldo: as saídas já são gravadas com quantidade negativa.
+    variacoes = (
+        movimentos.values('produto_id')
+        .annotate(variacao=Sum('quantidade'))
+        .values_list('produto_id', 'variacao')
+    )
+
+    # 2. Custo: o custo médio vigente é o do último movimento de cada produto.
+    ultimos_movimentos = (
+        movimentos.filter(custo_medio__isnull=False)
+        .values('produto_id')
+        .annotate(ultimo_id=Max('id'))
+        .values_list('ultimo_id', flat=True)
+    )
+    custos = dict(
+        MovimentoEstoque.objects.filter(id__in=list(ultimos_movimentos))
+        .values_list('produto_id', 'custo_medio')
+    )
+
+    for produto_id, variacao in variacoes:
+        quantidade, custo_medio = posicoes.get(produto_id, (0, Decimal('0')))
+        posicoes[produto_id] = (quantidade + variacao, custos.get(produto_id, custo_medio))
+
+    return posicoes
+
+
+@transaction.atomic
+def executar_fechamento(mes, ano, responsavel):
+    """
+    Cria o FechamentoMensal do período e grava a 'fotografia' do estoque
+    (PosicaoEstoqueMensal) em lotes de bulk_create: todos os produtos ativos,
+    inclusive os de saldo zero, que aparecem no relatório de inventário.
+    Produtos inativos com saldo também entram, pois a fotografia serve de
+    ponto de partida para os fechamentos seguintes.
+    """
+    inicio = time.monotonic()
+
+    # As posições são calculadas antes de criar o fechamento, para que ele
+    # próprio não seja escolhido como fotografia de partida.
+    posicoes = calcular_posicoes(fim_do_periodo(mes, ano))
+    ativos = set(Produto.objects.filter(ativo=True).values_list('pk', flat=True))
+    for produto_id in ativos - posicoes.keys():
+        posicoes[produto_id] = (0, Decimal('0'))
+
+    fechamento = FechamentoMensal.objects.create(mes=mes, ano=ano, responsavel=responsavel)
+    invalidar_periodos_fechados()
+
+    novas_posicoes = [
+        PosicaoEstoqueMensal(
+            fechamento=fechamento,
+            produto_id=produto_id,
+            quantidade_final=quantidade,
+            custo_medio_final=Decimal(custo_medio).quantize(Decimal('0.0001')),
+            valor_total_final=(quantidade * custo_medio).quantize(Decimal('0.01'))
+        )
+        for produto_id, (quantidade, custo_medio) in posicoes.items()
+        if quantidade > 0 or produto_id in ativos
+    ]
+    PosicaoEstoqueMensal.objects.bulk_create(novas_posicoes, batch_size=TAMANHO_LOTE_GRAVACAO)
+
+    return ResultadoFechamento(
+        fechamento=fechamento,
+        total_posicoes=len(novas_posicoes),
+        duracao=time.monotonic() - inicio
+    )
+
+
+@transaction.atomic
+def reabrir_ultimo_fechamento(responsavel):
+    """
+    Cancela o fechamento ATIVO mais recente, reabrindo o período para
+    movimentações. Retorna o fechamento cancelado, ou None se não houver.
+    """
+    fechamento = (
+        FechamentoMensal.objects.select_for_update()
+        .filter(status='ATIVO').order_by('-ano', '-mes').first()
+    )
+    if fechamento is None:
+        return None
+
+    fechamento.status = 'CANCELADO'
+    fechamento.cancelado_por = responsavel
+    fechamento.data_cancelamento = timezone.now()
+    fechamento.save()
+    invalidar_periodos_fechados()
+    return fechamento
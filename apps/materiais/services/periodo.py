@@ -0,0 +1,93 @@
+# Em apps/materiais/services/periodo.py
+
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import FechamentoMensal
+
+TTL_PADRAO = 300  # segundos
+CHAVE_VERSAO = 'materiais:periodos_fechados:versao'
+
+_trava = threading.Lock()
+_cache_local = {'periodos': None, 'versao': None, 'carregado_em': 0.0}
+
+
+class PeriodoFechadoError(ValueError):
+    """
+    Tentativa de movimentar o estoque em um período com fechamento ATIVO.
+    """
+
+
+def _versao_compartilhada():
+    # A versão fica no cache do Django: com um backend compartilhado
+    # (Redis/Memcached) a invalidação chega a todos os processos na hora;
+    # com o LocMemCache padrão, os outros processos dependem do TTL.
+    return cache.get(CHAVE_VERSAO, 0)
+
+
+def periodos_fechados():
+    """
+    Conjunto de (ano, mes) com fechamento ATIVO, mantido em memória no
+    processo. É recarregado do banco quando invalidado, quando a versão
+    compartilhada muda ou após ESTOQUE_CACHE_PERIODOS_TTL segundos.
+    """
+    versao = _versao_compartilhada()
+    ttl = getattr(settings, 'ESTOQUE_CACHE_PERIODOS_TTL', TTL_PADRAO)
+    with _trava:
+        periodos = _cache_local['periodos']
+        if (
+            periodos is not None
+            and _cache_local['versao'] == versao
+            and time.monotonic() - _cache_local['carregado_em'] < ttl
+        ):
+            return periodos
+
+    periodos = frozenset(FechamentoMensal.objects.filter(status='ATIVO').values_list('ano', 'mes'))
+    with _trava:
+        _cache_local.update(periodos=periodos, versao=versao, carregado_em=time.monotonic())
+    return periodos
+
+
+def periodo_fechado(data=None):
+    """
+    Indica se a data (por padrão, agora) cai em um período já fechado.
+    Não consulta o banco enquanto o cache estiver válido.
+    """
+    data = timezone.localtime(data) if data else timezone.localtime()
+    return (data.year, data.month) in periodos_fechados()
+
+
+def garantir_periodo_aberto(data=None, operacao="movimentar o estoque"):
+    """
+    Levanta PeriodoFechadoError se a data cair em um período fechado.
+    """
+    data = timezone.localtime(data) if data else timezone.localtime()
+    if (data.year, data.month) in periodos_fechados():
+        raise PeriodoFechadoError(
+            f"Não é possível {operacao} no período de {data.month:02d}/{data.year}, pois ele já foi fechado."
+        )
+
+
+def _descartar_cache():
+    with _trava:
+        _cache_local['periodos'] = None
+    try:
+        cache.incr(CHAVE_VERSAO)
+    except ValueError:
+        cache.set(CHAVE_VERSAO, 1, None)
+
+
+def invalidar_periodos_fechados():
+    """
+    Descarta o cache de períodos fechados. Deve ser chamada sempre que um
+    FechamentoMensal for criado ou cancelado; dentro de uma transação, o
+    cache é descartado de novo após o commit, para que nenhuma leitura
+    concorrente guarde o estado anterior.
+    """
+    _descartar_cache()
+    transaction.on_commit(_descartar_cache)
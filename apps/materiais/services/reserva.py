@@ -0,0 +1,27 @@
+# Em apps/materiais/services/reserva.py
+
+from ..models import SaldoProduto
+
+
+def _quantidades_por_produto(requisicao):
+    # unique_together ('requisicao', 'produto'): cada produto aparece uma vez
+    return dict(requisicao.itens.values_list('produto_id', 'quantidade'))
+
+
+def reservar_requisicao(requisicao):
+    """
+    Reserva o saldo dos itens de uma requisição que acabou de ser finalizada.
+    """
+    SaldoProduto.objects.ajustar_reservas(_quantidades_por_produto(requisicao))
+
+
+def liberar_reserva_requisicao(requisicao):
+    """
+    Libera a reserva de uma requisição finalizada que foi atendida, estornada
+    ou excluída. A quantidade solicitada é liberada integralmente, mesmo que
+    o atendimento tenha sido parcial.
+    """
+    quantidades = _quantidades_por_produto(requisicao)
+    SaldoProduto.objects.ajustar_reservas({
+        produto_id: -quantidade for produto_id, quantidade in quantidades.items()
+    })
@@ -1,3 +1,775 @@
-from django.test import TestCase
+import datetime
+from decimal import Decimal
+import io
+import tempfile
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import QuerySet, Sum
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from apps.core.models import CentroCusto
+from apps.users.models import UsuarioSistema
+
+from .models import (
+    Almoxarifado, Categoria, ConsumoDiario, FechamentoMensal, ItemRequisicao, Lote, MovimentoEstoque,
+    Produto, Requisicao, SaldoProduto
+)
+from .services import (
+    PeriodoFechadoError, executar_fechamento, invalidar_periodos_fechados, periodo_fechado,
+    reabrir_ultimo_fechamento, reconstruir_consumo, registrar_consumo
+)
+from .services.alocacao import baixar_itens_requisicao
+from .services.entrada import registrar_entrada
+from .services.fechamento import fechamento_base, fim_do_periodo
+
+
+@override_settings(ESTOQUE_TENTATIVAS_CONFLITO=50)
+class ConcorrenciaLotesTests(TransactionTestCase):
+    """
+    Teste de estresse: entradas e atendimentos simultâneos nos mesmos lotes
+    não podem perder atualizações; ao final, os lotes e o saldo consolidado
+    precisam bater com o razão (MovimentoEstoque).
+    """
+    THREADS_ENTRADA = 4
+    THREADS_ATENDIMENTO = 4
+    OPERACOES_POR_THREAD = 5
+
+    def setUp(self):
+        self.usuario = UsuarioSistema.objects.create_user('almoxarife', 'senha', email='almoxarife@teste.com')
+        self.almoxarifado = Almoxarifado.objects.create(nome='Almoxarifado Central')
+        categoria = Categoria.objects.create(nome='Material de Escritório')
+        self.produto = Produto.objects.create(
+            categoria=categoria, codigo_produto='131342001',
+            nome_produto='ENVELOPE PLÁSTICO', unidade_medida='Unidade'
+        )
+        self.validades = [datetime.date(2030, 1, 1), datetime.date(2031, 1, 1)]
+        for validade in self.validades:
+            registrar_entrada(self.produto, 100, '2.00', validade, self.almoxarifado, self.usuario)
+
+        centro_custo = CentroCusto.objects.create(nome='Diretoria')
+        self.requisicoes = []
+        for _ in range(self.THREADS_ATENDIMENTO * self.OPERACOES_POR_THREAD):
+            requisicao = Requisicao.objects.create(
+                solicitante=self.usuario, centro_custo=centro_custo, status='FINALIZADA'
+            )
+            ItemRequisicao.objects.create(
+                requisicao=requisicao, produto=self.produto, quantidade=7, quantidade_atendida=7
+            )
+            self.requisicoes.append(requisicao)
+
+    def _executar_em_paralelo(self, tarefas):
+        erros = []
+        barreira = threading.Barrier(len(tarefas))
+
+        def executar(tarefa):
+            try:
+                barreira.wait()
+                tarefa()
+            except Exception as erro:  # pragma: no cover - reportado abaixo
+                erros.append(erro)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=executar, args=(tarefa,)) for tarefa in tarefas]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(erros, [])
+
+    def test_entradas_e_atendimentos_simultaneos_batem_com_o_razao(self):
+        def entradas(indice):
+            def tarefa():
+                for _ in range(self.OPERACOES_POR_THREAD):
+                    validade = self.validades[indice % len(self.validades)]
+                    registrar_entrada(self.produto, 3, '4.00', validade, self.almoxarifado, self.usuario)
+            return tarefa
+
+        def atendimentos(indice):
+            def tarefa():
+                inicio = indice * self.OPERACOES_POR_THREAD
+                for requisicao in self.requisicoes[inicio:inicio + self.OPERACOES_POR_THREAD]:
+                    baixar_itens_requisicao(
+                        requisicao, requisicao.itens.all(), self.almoxarifado, self.usuario
+                    )
+            return tarefa
+
+        tarefas = [entradas(i) for i in range(self.THREADS_ENTRADA)]
+        tarefas += [atendimentos(i) for i in range(self.THREADS_ATENDIMENTO)]
+        self._executar_em_paralelo(tarefas)
+
+        total_entradas = 200 + self.THREADS_ENTRADA * self.OPERACOES_POR_THREAD * 3
+        total_saidas = self.THREADS_ATENDIMENTO * self.OPERACOES_POR_THREAD * 7
+        esperado = total_entradas - total_saidas
+
+        for lote in Lote.objects.all():
+            razao_do_lote = lote.movimentos.aggregate(total=Sum('quantidade'))['total']
+            self.assertEqual(lote.quantidade_atual, razao_do_lote)
+
+        self.assertEqual(MovimentoEstoque.objects.aggregate(total=Sum('quantidade'))['total'], esperado)
+        self.assertEqual(Lote.objects.aggregate(total=Sum('quantidade_atual'))['total'], esperado)
+        self.assertEqual(SaldoProduto.objects.get(produto=self.produto).quantidade, esperado)
+
+    def test_lote_criado_por_entrada_simultanea_recebe_a_soma(self):
+        # Outra entrada cria o lote entre a leitura (que não o achou) e o INSERT
+        obter = QuerySet.get
+        chamadas = []
+
+        def get_sem_ver_o_lote(queryset, *args, **kwargs):
+            chamadas.append(kwargs)
+            if queryset.model is Lote and len(chamadas) == 1:
+                raise Lote.DoesNotExist
+            return obter(queryset, *args, **kwargs)
+
+        with mock.patch.object(QuerySet, 'get', get_sem_ver_o_lote):
+            registrar_entrada(self.produto, 3, '2.00', self.validades[0], self.almoxarifado, self.usuario)
+        lote = Lote.objects.get(produto=self.produto, data_validade=self.validades[0])
+        self.assertEqual(lote.quantidade_atual, 103)
+        self.assertEqual(Lote.objects.filter(produto=self.produto).count(), 2)
+
+
+class AlocacaoFefoTests(TestCase):
+    """
+    A baixa em lote (alocar_fefo + bulk_create/bulk_update) escolhe os mesmos
+    lotes, nas mesmas quantidades, e grava os mesmos movimentos e saldos que
+    o laço antigo, item a item.
+    """
+    def setUp(self):
+        self.usuario = UsuarioSistema.objects.create_user('almoxarife', 'senha', email='almoxarife@teste.com')
+        self.almoxarifado = Almoxarifado.objects.create(nome='Almoxarifado Central')
+        categoria = Categoria.objects.create(nome='Material de Escritório')
+        self.envelope, self.caneta, self.pasta = [
+            Produto.objects.create(
+                categoria=categoria, codigo_produto=codigo, nome_produto=nome, unidade_medida='Unidade'
+            )
+            for codigo, nome in (('1', 'ENVELOPE'), ('2', 'CANETA'), ('3', 'PASTA'))
+        ]
+        # Lotes de produtos diferentes empatam na validade (no mesmo produto a validade é única)
+        for produto, quantidade, valor, validade in (
+            (self.envelope, 5, '2.00', datetime.date(2031, 1, 1)),
+            (self.envelope, 10, '3.00', datetime.date(2030, 1, 1)),
+            (self.envelope, 4, '5.00', datetime.date(2032, 1, 1)),
+            (self.caneta, 3, '4.00', datetime.date(2030, 1, 1)),
+            (self.caneta, 2, '1.50', datetime.date(2031, 1, 1)),
+        ):
+            registrar_entrada(produto, quantidade, valor, validade, self.almoxarifado, self.usuario)
+
+        self.requisicao = Requisicao.objects.create(
+            solicitante=self.usuario, centro_custo=CentroCusto.objects.create(nome='Diretoria')
+        )
+        # Vários itens do mesmo produto intercalados (a baixa não depende da
+        # unicidade produto/requisição, então os itens nem precisam ser gravados);
+        # a caneta esgota os lotes e a pasta não tem lote nenhum
+        self.itens = [
+            ItemRequisicao(
+                requisicao=self.requisicao, produto=produto, quantidade=quantidade,
+                quantidade_atendida=quantidade
+            )
+            for produto, quantidade in (
+                (self.envelope, 8), (self.caneta, 4), (self.envelope, 6), (self.pasta, 2),
+                (self.caneta, 3), (self.envelope, 0), (self.envelope, 3),
+            )
+        ]
+
+    def _baixar_item_a_item(self, requisicao, itens, almoxarifado, usuario):
+        """O laço anterior do atendimento: uma consulta e um save() por lote."""
+        for item in itens:
+            quantidade_a_atender = item.quantidade_atendida
+            if not quantidade_a_atender or quantidade_a_atender <= 0:
+                continue
+
+            lotes_disponiveis = Lote.objects.filter(
+                produto=item.produto, quantidade_atual__gt=0
+            ).order_by('data_validade')
+
+            for lote in lotes_disponiveis:
+                if quantidade_a_atender <= 0:
+                    break
+
+                quantidade_a_retirar = min(lote.quantidade_atual, quantidade_a_atender)
+                MovimentoEstoque.objects.create(
+                    lote=lote, almoxarifado=almoxarifado, quantidade=quantidade_a_retirar,
+                    valor_unitario=lote.custo_unitario, tipo='SAIDA', usuario=usuario,
+                    observacao=f"Atendimento da Requisição #{requisicao.id}"
+                )
+                lote.quantidade_atual -= quantidade_a_retirar
+                lote.save()
+                quantidade_a_atender -= quantidade_a_retirar
+
+    def _resultado(self, baixar):
+        """Executa a baixa, fotografa o estado e desfaz tudo."""
+        with transaction.atomic():
+            baixar(self.requisicao, self.itens, self.almoxarifado, self.usuario)
+            resultado = (
+                list(
+                    MovimentoEstoque.objects.filter(tipo='SAIDA').order_by('pk').values_list(
+                        'lote', 'produto', 'quantidade', 'valor_unitario', 'valor_total',
+                        'custo_medio', 'observacao'
+                    )
+                ),
+                list(Lote.objects.order_by('pk').values_list('pk', 'quantidade_atual')),
+                list(
+                    SaldoProduto.objects.order_by('produto').values_list(
+                        'produto', 'quantidade', 'valor_total', 'custo_medio'
+                    )
+                ),
+            )
+            transaction.set_rollback(True)
+        return resultado
+
+    def test_baixa_em_lote_equivale_ao_laco_item_a_item(self):
+        antigo = self._resultado(self._baixar_item_a_item)
+        novo = self._resultado(baixar_itens_requisicao)
+        self.assertEqual(novo, antigo)
+
+        movimentos, lotes, _ = novo
+        self.assertEqual(
+            [(produto, quantidade) for _, produto, quantidade, *_ in movimentos],
+            [
+                (self.envelope.pk, -8),
+                (self.caneta.pk, -3), (self.caneta.pk, -1),
+                (self.envelope.pk, -2), (self.envelope.pk, -4),
+                (self.caneta.pk, -1),
+                (self.envelope.pk, -1), (self.envelope.pk, -2),
+            ]
+        )
+        # Caneta esgotada com 2 unidades pendentes; envelope com 2 no último lote
+        self.assertEqual([quantidade for _, quantidade in lotes], [0, 0, 2, 0, 0])
+
+
+class ProdutoComEstoqueTests(TestCase):
+    """
+    Produto.objects.with_estoque() traz saldo e custo anotados, e a listagem
+    de produtos não faz consultas extras por linha.
+    """
+
+    def setUp(self):
+        self.usuario = UsuarioSistema.objects.create_user('almoxarife', 'senha', email='almoxarife@teste.com')
+        self.almoxarifado = Almoxarifado.objects.create(nome='Almoxarifado Central')
+        self.categoria = Categoria.objects.create(nome='Material de Escritório')
+
+    def _criar_produtos(self, quantidade, inicio=0):
+        for indice in range(inicio, inicio + quantidade):
+            produto = Produto.objects.create(
+                categoria=self.categoria, codigo_produto=f'P{indice:04d}',
+                nome_produto=f'PRODUTO {indice:04d}', unidade_medida='Unidade'
+            )
+            registrar_entrada(
+                produto, 10, '2.50', datetime.date(2030, 1, 1), self.almoxarifado, self.usuario
+            )
+
+    def test_anotacoes_coincidem_com_o_saldo_consolidado(self):
+        self._criar_produtos(1)
+        Produto.objects.create(
+            categoria=self.categoria, codigo_produto='SEM-MOV',
+            nome_produto='SEM MOVIMENTO', unidade_medida='Unidade'
+        )
+        for produto in Produto.objects.with_estoque():
+            consolidado = Produto.objects.get(pk=produto.pk)
+            self.assertEqual(produto.saldo_total, consolidado.saldo_total)
+            self.assertEqual(produto.custo_medio, consolidado.custo_medio)
+            self.assertEqual(produto.valor_total_em_estoque, consolidado.valor_total_em_estoque)
+            self.assertEqual(produto.saldo_disponivel, consolidado.saldo_disponivel)
+
+    def test_listagem_de_produtos_com_numero_constante_de_consultas(self):
+        self.client.force_login(self.usuario)
+        url = reverse('materiais:lista_produtos')
+        self.client.get(url)  # carrega o usuário no cache
+
+        self._criar_produtos(1)
+        with CaptureQueriesContext(connection) as poucos:
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        self._criar_produtos(10, inicio=1)
+        with CaptureQueriesContext(connection) as muitos:
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+        self.assertEqual(len(poucos), len(muitos))
+
+
+class RequisicaoConsultasTests(TestCase):
+    """
+    Detalhe e lista de pendentes carregam itens, custos e totais em um número
+    fixo de consultas, seja qual for o tamanho da requisição.
+    """
+    # Sessão + requisição (com totais) + itens; sessão + contagem + página.
+    # O usuário da sessão vem do cache de UsuarioSistemaBackend.get_user.
+    CONSULTAS_DETALHE = 3
+    CONSULTAS_PENDENTES = 3
+
+    def setUp(self):
+        self.usuario = UsuarioSistema.objects.create_user(
+            'almoxarife', 'senha', email='almoxarife@teste.com', is_superuser=True
+        )
+        self.almoxarifado = Almoxarifado.objects.create(nome='Almoxarifado Central')
+        self.categoria = Categoria.objects.create(nome='Material de Escritório')
+        self.requisicao = Requisicao.objects.create(
+            solicitante=self.usuario, centro_custo=CentroCusto.objects.create(nome='Diretoria'),
+            status='FINALIZADA'
+        )
+        self.client.force_login(self.usuario)
+
+    def _adicionar_itens(self, quantidade):
+        inicio = self.requisicao.itens.count()
+        for indice in range(inicio, inicio + quantidade):
+            produto = Produto.objects.create(
+                categoria=self.categoria, codigo_produto=f'P{indice:04d}',
+                nome_produto=f'PRODUTO {indice:04d}', unidade_medida='Unidade'
+            )
+            registrar_entrada(
+                produto, 10, '2.50', datetime.date(2030, 1, 1), self.almoxarifado, self.usuario
+            )
+            ItemRequisicao.objects.create(requisicao=self.requisicao, produto=produto, quantidade=2)
+
+    def test_detalhe_com_numero_fixo_de_consultas(self):
+        url = reverse('materiais:detalhe_requisicao', kwargs={'pk': self.requisicao.pk})
+        self.client.get(url)  # carrega o usuário no cache
+        for quantidade in (1, 20):
+            self._adicionar_itens(quantidade)
+            with self.assertNumQueries(self.CONSULTAS_DETALHE):
+                resposta = self.client.get(url)
+            self.assertEqual(resposta.status_code, 200)
+
+        requisicao = resposta.context['requisicao']
+        self.assertEqual(requisicao.valor_total_solicitado, 21 * 2 * Decimal('2.50'))
+        self.assertEqual(
+            requisicao.valor_total_solicitado,
+            sum(item.valor_solicitado for item in requisicao.itens.all())
+        )
+
+    def test_pendentes_com_numero_fixo_de_consultas(self):
+        url = reverse('materiais:lista_requisicoes_pendentes')
+        self.client.get(url)  # carrega o usuário no cache
+        for quantidade in (1, 20):
+            self._adicionar_itens(quantidade)
+            with self.assertNumQueries(self.CONSULTAS_PENDENTES):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class ReservaRequisicaoTests(TestCase):
+    """
+    Finalizar uma requisição reserva o saldo dos itens; o atendimento e o
+    estorno devolvem a reserva, e recalcular_saldos a reconstrói.
+    """
+    def setUp(self):
+        self.solicitante = UsuarioSistema.objects.create_user('12345', 'senha', email='usuario@teste.com')
+        self.almoxarife = UsuarioSistema.objects.create_user(
+            'almoxarife', 'senha', email='almoxarife@teste.com', is_superuser=True
+        )
+        almoxarifado = Almoxarifado.objects.create(nome='Almoxarifado Central')
+        categoria = Categoria.objects.create(nome='Material de Escritório')
+        self.envelope, self.caneta = [
+            Produto.objects.create(
+                categoria=categoria, codigo_produto=codigo, nome_produto=nome, unidade_medida='Unidade'
+            )
+            for codigo, nome in (('1', 'ENVELOPE'), ('2', 'CANETA'))
+        ]
+        for produto in (self.envelope, self.caneta):
+            registrar_entrada(produto, 20, '1.00', datetime.date(2030, 1, 1), almoxarifado, self.almoxarife)
+        self.centro_custo = CentroCusto.objects.create(nome='Diretoria')
+
+    def _finalizada(self, envelopes, canetas):
+        requisicao = Requisicao.objects.create(solicitante=self.solicitante, centro_custo=self.centro_custo)
+        ItemRequisicao.objects.create(requisicao=requisicao, produto=self.envelope, quantidade=envelopes)
+        ItemRequisicao.objects.create(requisicao=requisicao, produto=self.caneta, quantidade=canetas)
+        self.client.force_login(self.solicitante)
+        self.client.post(reverse('materiais:finalizar_requisicao', kwargs={'pk': requisicao.pk}))
+        requisicao.refresh_from_db()
+        self.assertEqual(requisicao.status, 'FINALIZADA')
+        return requisicao
+
+    def _reservado(self):
+        return dict(SaldoProduto.objects.values_list('produto', 'quantidade_reservada'))
+
+    def test_finalizar_reserva_e_estorno_libera(self):
+        requisicao = self._finalizada(5, 3)
+        self._finalizada(2, 1)
+        self.assertEqual(self._reservado(), {self.envelope.pk: 7, self.caneta.pk: 4})
+        self.assertEqual(Produto.objects.get(pk=self.envelope.pk).saldo_disponivel, 13)
+
+        self.client.force_login(self.almoxarife)
+        self.client.post(reverse('materiais:estornar_requisicao', kwargs={'pk': requisicao.pk}))
+        requisicao.refresh_from_db()
+        self.assertEqual(requisicao.status, 'CANCELADA')
+        self.assertEqual(self._reservado(), {self.envelope.pk: 2, self.caneta.pk: 1})
+
+        # Um segundo estorno é recusado e não mexe na reserva
+        self.client.post(reverse('materiais:estornar_requisicao', kwargs={'pk': requisicao.pk}))
+        self.assertEqual(self._reservado(), {self.envelope.pk: 2, self.caneta.pk: 1})
+
+    def test_atendimento_parcial_libera_a_reserva_inteira(self):
+        requisicao = self._finalizada(5, 3)
+        itens = list(requisicao.itens.order_by('pk'))
+        self.client.force_login(self.almoxarife)
+        self.client.post(reverse('materiais:atendimento_requisicao', kwargs={'pk': requisicao.pk}), {
+            'form-TOTAL_FORMS': 2, 'form-INITIAL_FORMS': 2,
+            'form-0-id': itens[0].pk, 'form-0-quantidade_atendida': 2,
+            'form-1-id': itens[1].pk, 'form-1-quantidade_atendida': 3,
+        })
+        requisicao.refresh_from_db()
+        self.assertEqual(requisicao.status, 'ATENDIDA')
+        self.assertEqual(self._reservado(), {self.envelope.pk: 0, self.caneta.pk: 0})
+        self.assertEqual(Produto.objects.get(pk=self.envelope.pk).saldo_disponivel, 18)
+
+    def test_exclusao_de_requisicao_aberta_nao_mexe_na_reserva(self):
+        self._finalizada(5, 3)
+        aberta = Requisicao.objects.create(solicitante=self.solicitante, centro_custo=self.centro_custo)
+        ItemRequisicao.objects.create(requisicao=aberta, produto=self.envelope, quantidade=4)
+        self.client.force_login(self.solicitante)
+        self.client.post(reverse('materiais:cancelar_requisicao', kwargs={'pk': aberta.pk}))
+        self.assertFalse(Requisicao.objects.filter(pk=aberta.pk).exists())
+        self.assertEqual(self._reservado(), {self.envelope.pk: 5, self.caneta.pk: 3})
+
+    def test_recalcular_saldos_reconstroi_as_reservas(self):
+        self._finalizada(5, 3)
+        atendida = self._finalizada(2, 1)
+        Requisicao.objects.filter(pk=atendida.pk).update(status='ATENDIDA')
+        SaldoProduto.objects.update(quantidade_reservada=99)
+
+        call_command('recalcular_saldos', stdout=io.StringIO())
+        self.assertEqual(self._reservado(), {self.envelope.pk: 5, self.caneta.pk: 3})
+
+
+class PeriodoFechadoTests(TestCase):
+    """
+    A trava de período fechado responde do cache, sem consultas, e é
+    invalidada pelo fechamento e pela reabertura.
+    """
+
+    def setUp(self):
+        invalidar_periodos_fechados()
+        self.usuario = UsuarioSistema.objects.create_user('administrador', 'senha', email='admin@teste.com')
+        self.almoxarifado = Almoxarifado.objects.create(nome='Almoxarifado Central')
+        self.produto = Produto.objects.create(
+            categoria=Categoria.objects.create(nome='Material de Escritório'), codigo_produto='131342001',
+            nome_produto='ENVELOPE PLÁSTICO', unidade_medida='Unidade'
+        )
+
+    def tearDown(self):
+        # O cache é do processo e sobreviveria ao rollback do TestCase
+        invalidar_periodos_fechados()
+
+    def test_consulta_em_cache_e_invalidacao(self):
+        self.assertFalse(periodo_fechado())
+        with self.assertNumQueries(0):
+            self.assertFalse(periodo_fechado())
+
+        agora = timezone.localtime()
+        executar_fechamento(agora.month, agora.year, self.usuario)
+        self.assertTrue(periodo_fechado())
+        with self.assertNumQueries(0):
+            self.assertTrue(periodo_fechado())
+
+        with self.assertRaises(PeriodoFechadoError):
+            registrar_entrada(self.produto, 5, '1.00', datetime.date(2030, 1, 1), self.almoxarifado, self.usuario)
+        self.assertFalse(MovimentoEstoque.objects.exists())
+
+        reabrir_ultimo_fechamento(self.usuario)
+        self.assertFalse(periodo_fechado())
+        registrar_entrada(self.produto, 5, '1.00', datetime.date(2030, 1, 1), self.almoxarifado, self.usuario)
+        self.assertEqual(self.produto.saldo_total, 5)
+
+    def test_fechamento_entre_a_validacao_e_a_gravacao_volta_ao_formulario(self):
+        self.usuario.is_superuser = True
+        self.usuario.save()
+        self.client.force_login(self.usuario)
+        agora = timezone.localtime()
+        executar_fechamento(agora.month, agora.year, self.usuario)
+
+        # O formulário validou antes do fechamento; a gravação o encontra fechado
+        with mock.patch('apps.materiais.forms.garantir_periodo_aberto'):
+            resposta = self.client.post(reverse('materiais:registrar_entrada'), {
+                'produto': self.produto.pk, 'quantidade': 5, 'valor_unitario': '1.00',
+                'data_validade': '2030-01-01',
+            })
+        self.assertEqual(resposta.status_code, 200)
+        self.assertIn('já foi fechado', str(resposta.context['form'].non_field_errors()))
+        self.assertFalse(MovimentoEstoque.objects.exists())
+
+
+class FechamentoIncrementalTests(TestCase):
+    """
+    O fechamento parte da fotografia anterior válida e chega às mesmas
+    posições de um reprocessamento completo do razão, inclusive quando a
+    fotografia é descartada ou o período é reaberto.
+    """
+    VALIDADE = datetime.date(2030, 1, 1)
+
+    def setUp(self):
+        invalidar_periodos_fechados()
+        self.usuario = UsuarioSistema.objects.create_user('administrador', 'senha', email='admin@teste.com')
+        self.almoxarifado = Almoxarifado.objects.create(nome='Almoxarifado Central')
+        categoria = Categoria.objects.create(nome='Material de Escritório')
+        self.envelope, self.caneta, self.pasta = [
+            Produto.objects.create(
+                categoria=categoria, codigo_produto=codigo, nome_produto=nome, unidade_medida='Unidade'
+            )
+            for codigo, nome in (('1', 'ENVELOPE'), ('2', 'CANETA'), ('3', 'PASTA'))
+        ]
+
+    def tearDown(self):
+        invalidar_periodos_fechados()
+
+    def _em(self, mes, dia):
+        return timezone.make_aware(datetime.datetime(2026, mes, dia, 12))
+
+    def _entrada(self, produto, quantidade, valor_unitario, data):
+        movimento = registrar_entrada(
+            produto, quantidade, valor_unitario, self.VALIDADE, self.almoxarifado, self.usuario
+        )
+        # Os movimentos são gravados "agora" e levados para a data do cenário
+        MovimentoEstoque.objects.filter(pk=movimento.pk).update(data=data)
+
+    def _saida(self, produto, quantidade, data):
+        movimento = MovimentoEstoque.objects.create(
+            lote=produto.lotes.get(), almoxarifado=self.almoxarifado, quantidade=quantidade,
+            tipo='SAIDA', usuario=self.usuario
+        )
+        MovimentoEstoque.objects.filter(pk=movimento.pk).update(data=data)
+
+    def _reprocessar(self, data_limite):
+        """Posições esperadas: todo o razão reaplicado do início, sem fotografias."""
+        saldos = {}
+        for produto_id, quantidade, valor_unitario in (
+            MovimentoEstoque.objects.filter(data__lte=data_limite).order_by('data', 'id')
+            .values_list('produto_id', 'quantidade', 'valor_unitario')
+        ):
+            saldo = saldos.setdefault(produto_id, SaldoProduto(produto_id=produto_id))
+            saldo.aplicar(quantidade, valor_unitario)
+        posicoes = {produto_id: (saldo.quantidade, saldo.custo_medio) for produto_id, saldo in saldos.items()}
+
+        ativos = set(Produto.objects.filter(ativo=True).values_list('pk', flat=True))
+        for produto_id in ativos - posicoes.keys():
+            posicoes[produto_id] = (0, Decimal('0'))
+        return {
+            produto_id: posicao for produto_id, posicao in posicoes.items()
+            if posicao[0] > 0 or produto_id in ativos
+        }
+
+    def _fechar(self, mes):
+        fechamento = executar_fechamento(mes, 2026, self.usuario).fechamento
+        posicoes = dict(
+            (produto_id, (quantidade, custo_medio))
+            for produto_id, quantidade, custo_medio in fechamento.posicoes.values_list(
+                'produto_id', 'quantidade_final', 'custo_medio_final'
+            )
+        )
+        self.assertEqual(posicoes, self._reprocessar(fim_do_periodo(mes, 2026)))
+        return fechamento
+
+    def test_fechamento_parte_da_fotografia_anterior(self):
+        self._entrada(self.envelope, 10, '2.00', self._em(1, 5))
+        self._entrada(self.pasta, 4, '1.00', self._em(1, 6))
+        self._saida(self.envelope, 3, self._em(1, 20))
+        Produto.objects.filter(pk=self.pasta.pk).update(ativo=False)
+        janeiro = self._fechar(1)
+        # Produto ativo sem movimento entra com saldo zero; o inativo entra porque tem saldo
+        self.assertEqual(janeiro.posicoes.get(produto=self.caneta).quantidade_final, 0)
+        self.assertTrue(janeiro.posicoes.filter(produto=self.pasta).exists())
+
+        self._entrada(self.envelope, 5, '3.33', self._em(2, 3))
+        self._saida(self.envelope, 12, self._em(2, 10))
+        self.assertEqual(fechamento_base(fim_do_periodo(2, 2026)), janeiro)
+        fevereiro = self._fechar(2)
+
+        envelope = fevereiro.posicoes.get(produto=self.envelope)
+        self.assertEqual(envelope.quantidade_final, 0)
+        # (7 * 2,00 + 5 * 3,33) / 12, com as 4 casas do saldo consolidado
+        self.assertEqual(envelope.custo_medio_final, Decimal('2.5542'))
+
+    def test_fotografia_descartada_quando_o_periodo_recebe_movimento_depois(self):
+        self._entrada(self.envelope, 10, '2.00', self._em(1, 5))
+        janeiro = self._fechar(1)
+        FechamentoMensal.objects.filter(pk=janeiro.pk).update(data_fechamento=self._em(1, 25))
+        self._entrada(self.envelope, 10, '4.00', self._em(1, 28))
+
+        self.assertIsNone(fechamento_base(fim_do_periodo(2, 2026)))
+        fevereiro = self._fechar(2)
+        self.assertEqual(fevereiro.posicoes.get(produto=self.envelope).quantidade_final, 20)
+
+    def test_reabertura_e_novo_fechamento(self):
+        self._entrada(self.envelope, 10, '2.00', self._em(1, 5))
+        janeiro = self._fechar(1)
+        self._saida(self.envelope, 4, self._em(2, 10))
+        self._fechar(2)
+
+        reabrir_ultimo_fechamento(self.usuario)
+        self._entrada(self.envelope, 6, '5.00', self._em(2, 20))
+        self.assertEqual(fechamento_base(fim_do_periodo(2, 2026)), janeiro)
+        fevereiro = self._fechar(2)
+        self.assertEqual(fevereiro.posicoes.get(produto=self.envelope).quantidade_final, 12)
+
+        # Março sem movimentos parte de fevereiro e repete as posições
+        self.assertEqual(fechamento_base(fim_do_periodo(3, 2026)), fevereiro)
+        self._fechar(3)
+
+
+class ConsumoDiarioTests(TestCase):
+    """
+    O atendimento acumula o consumo diário valorizado pelo custo do lote das
+    saídas; a reconstrução chega às mesmas linhas e o relatório de consumo
+    lê só desta tabela.
+    """
+    def setUp(self):
+        self.usuario = UsuarioSistema.objects.create_user(
+            'almoxarife', 'senha', email='almoxarife@teste.com', is_superuser=True
+        )
+        self.almoxarifado = Almoxarifado.objects.create(nome='Almoxarifado Central')
+        self.centro_custo = CentroCusto.objects.create(nome='Diretoria')
+        self.produto = Produto.objects.create(
+            categoria=Categoria.objects.create(nome='Material de Escritório'),
+            codigo_produto='131342001', nome_produto='ENVELOPE PLÁSTICO', unidade_medida='Unidade'
+        )
+        # Dois lotes: o que vence primeiro custa 2,00 e o outro, 4,00
+        registrar_entrada(self.produto, 10, '2.00', datetime.date(2030, 1, 1), self.almoxarifado, self.usuario)
+        registrar_entrada(self.produto, 10, '4.00', datetime.date(2031, 1, 1), self.almoxarifado, self.usuario)
+        self.client.force_login(self.usuario)
+
+    def _atender(self, quantidade):
+        requisicao = Requisicao.objects.create(
+            solicitante=self.usuario, centro_custo=self.centro_custo, status='FINALIZADA'
+        )
+        item = ItemRequisicao.objects.create(requisicao=requisicao, produto=self.produto, quantidade=quantidade)
+        self.client.post(reverse('materiais:atendimento_requisicao', kwargs={'pk': requisicao.pk}), {
+            'form-TOTAL_FORMS': 1, 'form-INITIAL_FORMS': 1,
+            'form-0-id': item.pk, 'form-0-quantidade_atendida': quantidade,
+        })
+        requisicao.refresh_from_db()
+        self.assertEqual(requisicao.status, 'ATENDIDA')
+        return requisicao
+
+    def _linhas(self):
+        return list(
+            ConsumoDiario.objects.values('data', 'centro_custo', 'produto')
+            .annotate(total_quantidade=Sum('quantidade'), total_valor=Sum('valor'))
+            .values_list('data', 'centro_custo', 'produto', 'total_quantidade', 'total_valor')
+        )
+
+    def test_atendimento_acumula_e_reconstrucao_confere(self):
+        primeira, segunda = self._atender(5), self._atender(7)
+        # Cada saída aponta para a requisição atendida (a reconstrução agrupa por ela)
+        self.assertEqual(
+            list(MovimentoEstoque.objects.filter(tipo='SAIDA').order_by('pk').values_list('requisicao', 'quantidade')),
+            [(primeira.pk, -5), (segunda.pk, -5), (segunda.pk, -2)]
+        )
+        hoje = timezone.localdate()
+        # FEFO: 10 unidades a 2,00 e 2 a 4,00
+        esperado = [(hoje, self.centro_custo.pk, self.produto.pk, 12, Decimal('28.00'))]
+        self.assertEqual(self._linhas(), esperado)
+        self.assertEqual(ConsumoDiario.objects.count(), 1)
+
+        ConsumoDiario.objects.all().delete()
+        self.assertEqual(reconstruir_consumo(), 1)
+        self.assertEqual(self._linhas(), esperado)
+
+        resposta = self.client.post(reverse('relatorios:relatorio_consumo'), {
+            'data_inicio': hoje.isoformat(), 'data_fim': hoje.isoformat(),
+            'centros_de_custo': [self.centro_custo.pk],
+        })
+        resultado = list(resposta.context['resultados'])
+        self.assertEqual(len(resultado), 1)
+        self.assertEqual(resultado[0]['quantidade_total'], 12)
+        self.assertEqual(resposta.context['valor_total_geral'], Decimal('28.00'))
+
+    def test_linha_criada_por_atendimento_simultaneo_recebe_a_soma(self):
+        primeira = self._atender(5)
+        ConsumoDiario.objects.all().delete()
+
+        # Outra transação grava a linha do dia entre o UPDATE (que não achou
+        # nada) e o INSERT deste atendimento: a restrição única recusa o INSERT
+        ConsumoDiario.objects.create(
+            data=timezone.localdate(), centro_custo=self.centro_custo, produto=self.produto,
+            quantidade=1, valor=Decimal('2.00')
+        )
+        atualizar = QuerySet.update
+        chamadas = []
+
+        def update_sem_ver_a_linha(queryset, **campos):
+            chamadas.append(campos)
+            return 0 if len(chamadas) == 1 else atualizar(queryset, **campos)
+
+        with mock.patch.object(QuerySet, 'update', update_sem_ver_a_linha):
+            registrar_consumo(primeira, MovimentoEstoque.objects.filter(requisicao=primeira))
+        self.assertEqual(len(chamadas), 2)
+        self.assertEqual(self._linhas(), [
+            (timezone.localdate(), self.centro_custo.pk, self.produto.pk, 6, Decimal('12.00'))
+        ])
+        self.assertEqual(ConsumoDiario.objects.count(), 1)
+
+    def test_requisicao_atendida_valorizada_pelo_que_foi_baixado(self):
+        requisicao = self._atender(12)
+        # Nova entrada bem mais cara: o custo médio vigente muda, o atendimento não
+        registrar_entrada(self.produto, 8, '50.00', datetime.date(2032, 1, 1), self.almoxarifado, self.usuario)
+
+        vigente = Requisicao.objects.com_totais().com_itens().get(pk=requisicao.pk)
+        self.assertNotEqual(vigente.valor_total_atendido, Decimal('28.00'))
+
+        with self.assertNumQueries(2):
+            baixada = Requisicao.objects.com_valores_baixados().get(pk=requisicao.pk)
+            item = baixada.itens.all()[0]
+        self.assertEqual(baixada.valor_total_atendido, Decimal('28.00'))
+        self.assertEqual((item.valor_atendido, item.custo_unitario), (Decimal('28.00'), Decimal('2.3333')))
+
+        # O total solicitado não vem anotado: é calculado à parte, sem trocar o atendido
+        with self.assertNumQueries(1):
+            self.assertEqual(baixada.valor_total_solicitado, vigente.valor_total_solicitado)
+        with self.assertNumQueries(0):
+            self.assertEqual(baixada.valor_total_atendido, Decimal('28.00'))
+
+    def test_pdf_em_cache_acompanha_os_valores_gravados(self):
+        requisicao = self._atender(12)
+        url = reverse('materiais:requisicao_pdf', kwargs={'pk': requisicao.pk})
+        renderizar = mock.Mock(return_value=b'%PDF-1')
+        with tempfile.TemporaryDirectory() as diretorio, self.settings(PDF_CACHE_DIR=diretorio), \
+                mock.patch('apps.materiais.views.requisicao_views.renderizar_pdf', renderizar):
+            for _ in range(2):
+                self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(renderizar.call_count, 1)
+            self.assertIn('28,00', renderizar.call_args.args[0])
+
+            # Valores corrigidos no razão (ex.: recalcular_saldos): o PDF antigo não serve mais
+            MovimentoEstoque.objects.filter(requisicao=requisicao).update(valor_total=Decimal('-15.00'))
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.assertEqual(renderizar.call_count, 2)
+            self.assertIn('30,00', renderizar.call_args.args[0])
+
+    def test_movimentos_guardam_produto_e_valor_total(self):
+        self._atender(12)
+        # Nova entrada no segundo lote (8 restantes a 4,00): (8 * 4,00 + 2 * 9,00) / 10 = 5,00
+        registrar_entrada(self.produto, 2, '9.00', datetime.date(2031, 1, 1), self.almoxarifado, self.usuario)
+        lote = Lote.objects.get(data_validade=datetime.date(2031, 1, 1))
+        self.assertEqual(lote.custo_unitario, Decimal('5.0000'))
+        saldo = SaldoProduto.objects.get(produto=self.produto)
+        self.assertEqual((saldo.quantidade, saldo.valor_total), (10, Decimal('50.00')))
+
+        esperado = [
+            ('ENTRADA', self.produto.pk, Decimal('20.00')),
+            ('ENTRADA', self.produto.pk, Decimal('40.00')),
+            ('SAIDA', self.produto.pk, Decimal('-20.00')),
+            ('SAIDA', self.produto.pk, Decimal('-8.00')),
+            ('ENTRADA', self.produto.pk, Decimal('18.00')),
+        ]
+        movimentos = MovimentoEstoque.objects.order_by('pk')
+        self.assertEqual(list(movimentos.values_list('tipo', 'produto', 'valor_total')), esperado)
+
+        # O recálculo dos saldos também regrava os campos desnormalizados; com
+        # páginas de 2 movimentos e a mesma data em todos, só o id as encadeia
+        movimentos.update(produto=None, valor_total=None, data=timezone.now())
+        with mock.patch('apps.materiais.management.commands.recalcular_saldos.TAMANHO_PAGINA', 2):
+            call_command('recalcular_saldos', stdout=io.StringIO())
+        self.assertEqual(list(movimentos.values_list('tipo', 'produto', 'valor_total')), esperado)
+        saldo.refresh_from_db()
+        self.assertEqual((saldo.quantidade, saldo.valor_total), (10, Decimal('50.00')))
+
+        hoje = timezone.localdate()
+        resposta = self.client.get(reverse(
+            'relatorios:relatorio_fechamento_movimentacao', kwargs={'ano': hoje.year, 'mes': hoje.month}
+        ))
+        self.assertEqual(resposta.context['total_entradas'], Decimal('78.00'))
+        self.assertEqual(resposta.context['total_saidas'], Decimal('28.00'))
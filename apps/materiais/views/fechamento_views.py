@@ -5,24 +5,27 @@ from django.views.generic import ListView
 from django.views import View
 from django.contrib import messages
 from django.utils import timezone
-from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy
-from ..models.transacao import FechamentoMensal, PosicaoEstoqueMensal
-from ..models.catalogo import Produto
+from ..models.transacao import FechamentoMensal
+from ..services import executar_fechamento, reabrir_ultimo_fechamento
+from apps.core.permissoes import GRUPO_ADMINISTRADORES, GrupoRequeridoMixin
+
+class AdministradoresMixin(GrupoRequeridoMixin):
+    # Apenas Admins podem ver, executar ou reabrir fechamentos
+    grupos_permitidos = (GRUPO_ADMINISTRADORES,)
+    permitir_superusuario = False
+
 
 # ... Sua view que lista os fechamentos (FechamentoListView) precisa ser ajustada ...
 # Em apps/materiais/views/fechamento.py
 
-class FechamentoListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
+class FechamentoListView(LoginRequiredMixin, AdministradoresMixin, ListView):
     model = FechamentoMensal
     template_name = 'materiais/painel_fechamento.html' 
     context_object_name = 'fechamentos'
     
 
-    def test_func(self):
-        # Apenas Admins podem ver a página de fechamentos
-        return self.request.user.groups.filter(name='Administradores').exists()
-
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         # Adiciona a variável para controlar o botão de reabertura
@@ -31,12 +34,8 @@ class FechamentoListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
 
 
 # --- VIEW PARA EXECUTAR O FECHAMENTO ---
-class FazerFechamentoView(LoginRequiredMixin, UserPassesTestMixin, View):
+class FazerFechamentoView(LoginRequiredMixin, AdministradoresMixin, View):
     
-    def test_func(self):
-        # Apenas Admins podem executar o fechamento
-        return self.request.user.groups.filter(name='Administradores').exists()
-
     def post(self, request, *args, **kwargs):
         # 1. Determinar o próximo período a ser fechado
         ultimo_fechamento = FechamentoMensal.objects.filter(status='ATIVO').order_by('ano', 'mes').last()
@@ -58,51 +57,28 @@ class FazerFechamentoView(LoginRequiredMixin, UserPassesTestMixin, View):
             messages.error(request, f"O fechamento para {mes:02d}/{ano} já foi realizado.")
             return redirect('materiais:painel_fechamento')
             
-        # 3. Criar o registro de Fechamento
-        fechamento = FechamentoMensal.objects.create(
-            ano=ano,
-            mes=mes,
-            responsavel=request.user
-        )
+        # 3. Criar o registro de Fechamento e o "Snapshot" do estoque (PosicaoEstoqueMensal)
+        resultado = executar_fechamento(mes, ano, request.user)
 
-        # 4. Criar o "Snapshot" do estoque (PosicaoEstoqueMensal)
-        produtos = Produto.objects.filter(ativo=True)
-        for produto in produtos:
-            saldo_final = produto.saldo_total # Usando a @property que você já tem
-            custo_medio = produto.custo_medio # Usando a @property
-
-            if saldo_final > 0:
-                PosicaoEstoqueMensal.objects.create(
-                    fechamento=fechamento,
-                    produto=produto,
-                    quantidade_final=saldo_final,
-                    custo_medio_final=custo_medio,
-                    valor_total_final=saldo_final * custo_medio
-                )
-
-        messages.success(request, f"Fechamento de {mes:02d}/{ano} realizado com sucesso!")
+        messages.success(
+            request,
+            f"Fechamento de {mes:02d}/{ano} realizado com sucesso! "
+            f"{resultado.total_posicoes} posições de estoque gravadas em {resultado.duracao:.1f}s."
+        )
         return redirect('materiais:painel_fechamento')
 
 
 # --- VIEW PARA REABRIR O ÚLTIMO FECHAMENTO ---
-class ReabrirUltimoFechamentoView(LoginRequiredMixin, UserPassesTestMixin, View):
+class ReabrirUltimoFechamentoView(LoginRequiredMixin, AdministradoresMixin, View):
     
-    def test_func(self):
-        # Apenas Admins podem reabrir períodos
-        return self.request.user.groups.filter(name='Administradores').exists()
-
     def post(self, request, *args, **kwargs):
-        ultimo_fechamento_ativo = FechamentoMensal.objects.filter(status='ATIVO').order_by('ano', 'mes').last()
+        # Cancela o último fechamento ativo, registra quem e quando cancelou
+        # e descarta o cache de períodos fechados
+        ultimo_fechamento_ativo = reabrir_ultimo_fechamento(request.user)
 
         if not ultimo_fechamento_ativo:
             messages.error(request, "Não há nenhum período de fechamento ativo para ser reaberto.")
             return redirect('materiais:painel_fechamento')
 
-        # Atualiza o status e registra quem e quando cancelou
-        ultimo_fechamento_ativo.status = 'CANCELADO'
-        ultimo_fechamento_ativo.cancelado_por = request.user
-        ultimo_fechamento_ativo.data_cancelamento = timezone.now()
-        ultimo_fechamento_ativo.save()
-
         messages.warning(request, f"O período de fechamento de {ultimo_fechamento_ativo.mes:02d}/{ultimo_fechamento_ativo.ano} foi reaberto (cancelado).")
         return redirect('materiais:painel_fechamento')
\ No newline at end of file
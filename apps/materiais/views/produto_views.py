@@ -17,9 +17,10 @@ class ProdutoListView(LoginRequiredMixin, ListView):
 
     def get_queryset(self):
         """
-        Otimiza a consulta para melhorar a performance.
+        Otimiza a consulta para melhorar a performance: saldo, reservado e
+        custo vêm anotados na própria consulta da página (with_estoque).
         """
-        return Produto.objects.select_related('categoria').order_by('nome_produto')
+        return Produto.objects.with_estoque().select_related('categoria').order_by('nome_produto')
 
     def get_context_data(self, **kwargs):
         """
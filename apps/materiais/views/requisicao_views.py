@@ -7,16 +7,31 @@ from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.urls import reverse_lazy
 from django.db import transaction
+from django.db.models import Prefetch
 from django.utils import timezone
 from django.http import HttpResponse
 from django.template.loader import render_to_string
-from weasyprint import HTML
-
-from apps.materiais.models.transacao import FechamentoMensal
 
 # As importações de modelos e formulários agora usam '..' para subir um nível de diretório.
 from ..models import MovimentoEstoque, Almoxarifado, Requisicao, ItemRequisicao, Produto, Lote
 from ..forms import RequisicaoForm, AtendimentoFormSet, EntradaForm
+from ..services.alocacao import baixar_itens_requisicao
+from ..services.concorrencia import repetir_em_conflito
+from ..services.consumo import registrar_consumo
+from ..services.periodo import PeriodoFechadoError, garantir_periodo_aberto
+from ..services.reserva import liberar_reserva_requisicao, reservar_requisicao
+from apps.core.cache_pdf import chave_pdf, resposta_pdf
+from apps.core.pdf import RenderizacaoPDFError, renderizar_pdf
+from apps.core.permissoes import GRUPO_REQUISITANTES, GrupoRequeridoMixin, eh_gestor
+
+def itens_com_estoque(requisicao):
+    """
+    Itens da requisição com os produtos já anotados com saldo e custo médio
+    (duas consultas, independentemente do número de itens).
+    """
+    return requisicao.itens.prefetch_related(
+        Prefetch('produto', queryset=Produto.objects.with_estoque())
+    )
 
 # ... (outras views como ProdutoListView, RequisicaoCreateView, etc., permanecem as mesmas) ...
 class ProdutoListView(LoginRequiredMixin, ListView):
@@ -26,14 +41,14 @@ class ProdutoListView(LoginRequiredMixin, ListView):
     paginate_by = 20
 
     def get_queryset(self):
-        return Produto.objects.select_related('categoria').order_by('nome_produto')
+        return Produto.objects.with_estoque().select_related('categoria').order_by('nome_produto')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['page_title'] = 'Posição de Estoque'
         return context
 
-class RequisicaoCreateView(LoginRequiredMixin, UserPassesTestMixin, View):
+class RequisicaoCreateView(LoginRequiredMixin, GrupoRequeridoMixin, View):
     template_name = 'materiais/requisicao_form.html'
     form_class = RequisicaoForm
     
@@ -44,15 +59,7 @@ class RequisicaoCreateView(LoginRequiredMixin, UserPassesTestMixin, View):
     
         return super().dispatch(request, *args, **kwargs)
 
-    def test_func(self):
-        user = self.request.user
-        
-        # Vamos ver todos os grupos do usuário
-        grupos_usuario = list(user.groups.values_list('name', flat=True))
-
-        # Verificação da permissão
-        tem_permissao = user.is_superuser or 'Requisitantes' in grupos_usuario
-        return tem_permissao
+    grupos_permitidos = (GRUPO_REQUISITANTES,)
 
     def handle_no_permission(self):
         messages.error(self.request, "Você não tem permissão para acessar esta página.")
@@ -99,14 +106,22 @@ class RequisicaoDetailView(LoginRequiredMixin, UserPassesTestMixin, DetailView):
     template_name = 'materiais/requisicao_detalhe.html'
     context_object_name = 'requisicao'
 
+    def get_queryset(self):
+        return (
+            Requisicao.objects.com_totais().com_itens()
+            .select_related('solicitante__funcionario', 'centro_custo', 'atendido_por')
+        )
+
+    def get_object(self, queryset=None):
+        # test_func e get() pedem o objeto; a consulta (com itens e totais) é feita uma vez só
+        if not hasattr(self, '_requisicao'):
+            self._requisicao = super().get_object(queryset)
+        return self._requisicao
+
     def test_func(self):
         requisicao = self.get_object()
         user = self.request.user
-        if user == requisicao.solicitante:
-            return True
-        if user.is_superuser or user.groups.filter(name__in=['Administradores', 'Almoxarifes']).exists():
-            return True
-        return False
+        return user == requisicao.solicitante or eh_gestor(user)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -143,27 +158,28 @@ class RequisicaoFinalizarView(LoginRequiredMixin, UserPassesTestMixin, View):
             messages.error(request, "Não é possível finalizar uma requisição vazia.")
             return redirect('materiais:detalhe_requisicao', pk=requisicao.pk)
 
-        requisicao.status = 'FINALIZADA'
-        requisicao.data_finalizacao = timezone.now()
-        requisicao.save()
+        with transaction.atomic():
+            requisicao.status = 'FINALIZADA'
+            requisicao.data_finalizacao = timezone.now()
+            requisicao.save()
+            # A partir daqui os itens deixam de estar disponíveis para outras requisições
+            reservar_requisicao(requisicao)
 
         messages.success(request, f"Requisição #{requisicao.id} finalizada e enviada para o almoxarifado com sucesso!")
         return redirect('authentication:dashboard_requisitante')
         
-class RequisicaoPendenteListView(LoginRequiredMixin, UserPassesTestMixin, ListView):
+class RequisicaoPendenteListView(LoginRequiredMixin, GrupoRequeridoMixin, ListView):
     model = Requisicao
     template_name = 'materiais/requisicao_pendente_list.html'
     context_object_name = 'requisicoes_pendentes'
     paginate_by = 20
 
-    def test_func(self):
-        user = self.request.user
-        return user.is_superuser or \
-               user.groups.filter(name='Administradores').exists() or \
-               user.groups.filter(name='Almoxarifes').exists()
-
     def get_queryset(self):
-        return Requisicao.objects.filter(status='FINALIZADA').order_by('data_finalizacao')
+        return (
+            Requisicao.objects.filter(status='FINALIZADA').com_totais()
+            .select_related('solicitante__funcionario', 'centro_custo')
+            .order_by('data_finalizacao')
+        )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -180,14 +196,11 @@ class RequisicaoDeleteView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
         return self.request.user == requisicao.solicitante and requisicao.status == 'ABERTO'
 
     def form_valid(self, form):
+        # Só requisições em aberto podem ser excluídas (test_func), e essas ainda não reservam saldo
         messages.success(self.request, f"Requisição #{self.object.pk} foi cancelada com sucesso.")
         return super().form_valid(form)
 
-class RequisicaoEstornarView(LoginRequiredMixin, UserPassesTestMixin, View):
-
-    def test_func(self):
-        user = self.request.user
-        return user.is_superuser or user.groups.filter(name__in=['Administradores', 'Almoxarifes']).exists()
+class RequisicaoEstornarView(LoginRequiredMixin, GrupoRequeridoMixin, View):
 
     def post(self, request, *args, **kwargs):
         requisicao = get_object_or_404(Requisicao, pk=self.kwargs.get('pk'))
@@ -201,11 +214,13 @@ class RequisicaoEstornarView(LoginRequiredMixin, UserPassesTestMixin, View):
         try:
             # NENHUM MOVIMENTO DE ESTOQUE É NECESSÁRIO AQUI.
             # Apenas atualizamos o status e os dados de auditoria.
-            requisicao.status = 'CANCELADA'
-            requisicao.estornado_por = request.user # Reutilizamos o campo para saber quem cancelou
-            requisicao.data_estorno = timezone.now()
-            requisicao.motivo_estorno = motivo
-            requisicao.save()
+            with transaction.atomic():
+                requisicao.status = 'CANCELADA'
+                requisicao.estornado_por = request.user # Reutilizamos o campo para saber quem cancelou
+                requisicao.data_estorno = timezone.now()
+                requisicao.motivo_estorno = motivo
+                requisicao.save()
+                liberar_reserva_requisicao(requisicao)
 
             messages.success(request, f"Requisição #{requisicao.id} cancelada com sucesso! Nenhum item foi retirado do estoque.")
             return redirect('materiais:lista_requisicoes_pendentes')
@@ -214,17 +229,13 @@ class RequisicaoEstornarView(LoginRequiredMixin, UserPassesTestMixin, View):
             messages.error(request, f"Ocorreu um erro inesperado durante o cancelamento: {e}")
             return redirect('materiais:detalhe_requisicao', pk=requisicao.pk)
 
-class RequisicaoAtendimentoView(LoginRequiredMixin, UserPassesTestMixin, View):
+class RequisicaoAtendimentoView(LoginRequiredMixin, GrupoRequeridoMixin, View):
     template_name = 'materiais/requisicao_atendimento_form.html'
 
-    def test_func(self):
-        user = self.request.user
-        return user.is_superuser or user.groups.filter(name__in=['Administradores', 'Almoxarifes']).exists()
-
     def get(self, request, *args, **kwargs):
         # ... (código do método get sem alterações) ...
         requisicao = get_object_or_404(Requisicao, pk=self.kwargs.get('pk'))
-        formset = AtendimentoFormSet(queryset=requisicao.itens.all())
+        formset = AtendimentoFormSet(queryset=itens_com_estoque(requisicao))
         
         for form in formset:
             form.initial['quantidade_atendida'] = form.instance.quantidade
@@ -237,70 +248,27 @@ class RequisicaoAtendimentoView(LoginRequiredMixin, UserPassesTestMixin, View):
 
     def post(self, request, *args, **kwargs):
         requisicao = get_object_or_404(Requisicao, pk=self.kwargs.get('pk'))
-        formset = AtendimentoFormSet(request.POST, queryset=requisicao.itens.all())
+        formset = AtendimentoFormSet(request.POST, queryset=itens_com_estoque(requisicao))
 
         # =====================================================================
         # MUDANÇA AQUI: Adicionamos a validação de período fechado
         # =====================================================================
-        data_movimentacao = timezone.now()
-        mes = data_movimentacao.month
-        ano = data_movimentacao.year
-        if FechamentoMensal.objects.filter(mes=mes, ano=ano, status='ATIVO').exists():
-            messages.error(
-                request,
-                f"Não é possível atender esta requisição no período de {mes:02d}/{ano}, pois ele já foi fechado."
-            )
+        try:
+            garantir_periodo_aberto(operacao="atender esta requisição")
+        except PeriodoFechadoError as erro:
+            messages.error(request, str(erro))
             return redirect('materiais:detalhe_requisicao', pk=requisicao.pk)
         # =====================================================================
 
         if formset.is_valid():
             try:
-                with transaction.atomic():
-                    # ... (resto do código do método post sem alterações) ...
-                    almoxarifado_padrao = Almoxarifado.objects.filter(ativo=True).first()
-                    if not almoxarifado_padrao:
-                        raise ValueError("Nenhum almoxarifado ativo encontrado.")
-                    
-                    formset.save()
-
-                    for item in requisicao.itens.all():
-                        quantidade_a_atender = item.quantidade_atendida
-                        if not quantidade_a_atender or quantidade_a_atender <= 0:
-                            continue
-
-                        lotes_disponiveis = Lote.objects.filter(
-                            produto=item.produto,
-                            quantidade_atual__gt=0
-                        ).order_by('data_validade')
-
-                        for lote in lotes_disponiveis:
-                            if quantidade_a_atender <= 0:
-                                break
-
-                            quantidade_a_retirar = min(lote.quantidade_atual, quantidade_a_atender)
-                            
-                            MovimentoEstoque.objects.create(
-                                lote=lote,
-                                almoxarifado=almoxarifado_padrao,
-                                quantidade=quantidade_a_retirar,
-                                tipo='SAIDA',
-                                usuario=request.user,
-                                observacao=f"Atendimento da Requisição #{requisicao.id}"
-                            )
-                            
-                            lote.quantidade_atual -= quantidade_a_retirar
-                            lote.save()
-                            
-                            quantidade_a_atender -= quantidade_a_retirar
-                    
-                    requisicao.status = 'ATENDIDA'
-                    requisicao.atendido_por = request.user
-                    requisicao.data_atendimento = timezone.now()
-                    requisicao.save()
-
-                    messages.success(request, f"Requisição #{requisicao.id} atendida com sucesso!")
-                    return redirect('materiais:lista_requisicoes_pendentes')
+                self.efetivar_atendimento(requisicao, formset)
+                messages.success(request, f"Requisição #{requisicao.id} atendida com sucesso!")
+                return redirect('materiais:lista_requisicoes_pendentes')
 
+            except PeriodoFechadoError as erro:
+                # Fechamento concluído entre a verificação acima e as saídas
+                messages.error(request, str(erro))
             except ValueError as e:
                 messages.error(request, str(e))
             except Exception as e:
@@ -312,26 +280,94 @@ class RequisicaoAtendimentoView(LoginRequiredMixin, UserPassesTestMixin, View):
             'page_title': f'Atender Requisição #{requisicao.pk}'
         })
     
+    @repetir_em_conflito
+    def efetivar_atendimento(self, requisicao, formset):
+        """
+        Grava as quantidades atendidas, dá baixa nos lotes e marca a requisição
+        como ATENDIDA em uma única transação, repetida em caso de conflito.
+        """
+        almoxarifado_padrao = Almoxarifado.objects.filter(ativo=True).first()
+        if not almoxarifado_padrao:
+            raise ValueError("Nenhum almoxarifado ativo encontrado.")
+
+        formset.save()
+
+        # Lotes de todos os itens bloqueados e baixados de uma só vez (FEFO)
+        itens = [form.instance for form in formset]
+        saidas = baixar_itens_requisicao(requisicao, itens, almoxarifado_padrao, self.request.user)
+
+        if requisicao.status == 'FINALIZADA':
+            liberar_reserva_requisicao(requisicao)
+
+        requisicao.status = 'ATENDIDA'
+        requisicao.atendido_por = self.request.user
+        requisicao.data_atendimento = timezone.now()
+        requisicao.save()
+
+        # Consumo diário por centro de custo, lido pelo relatório de consumo
+        registrar_consumo(requisicao, saidas)
+    
 class RequisicaoPDFView(LoginRequiredMixin, UserPassesTestMixin, View):
+    template_name = 'materiais/requisicao_pdf.html'
+    # Requisições nestes status não mudam mais: o PDF é gerado uma vez e
+    # servido do cache em disco (apps.core.cache_pdf)
+    status_definitivos = ('ATENDIDA', 'CANCELADA')
+
     def test_func(self):
         # A mesma lógica de permissão da DetailView
         user = self.request.user
-        requisicao = get_object_or_404(Requisicao, pk=self.kwargs.get('pk'))
-        if user == requisicao.solicitante: return True
-        if user.is_superuser or user.groups.filter(name__in=['Administradores', 'Almoxarifes']).exists(): return True
-        return False
+        self.requisicao = get_object_or_404(Requisicao, pk=self.kwargs.get('pk'))
+        return self.requisicao.solicitante_id == user.pk or eh_gestor(user)
+
+    def carregar_requisicao(self):
+        requisicoes = Requisicao.objects.select_related('solicitante__funcionario', 'centro_custo', 'atendido_por')
+        if self.requisicao.status in self.status_definitivos:
+            # Valores pelo que foi baixado, e não pelo custo médio vigente
+            requisicoes = requisicoes.com_valores_baixados()
+        else:
+            requisicoes = requisicoes.com_totais().com_itens()
+        return get_object_or_404(requisicoes, pk=self.kwargs.get('pk'))
+
+    def assinatura(self, requisicao):
+        """
+        Tudo o que o template mostra, exceto a data de geração: se algum
+        valor mudar (por exemplo, depois de um recalcular_saldos), a chave
+        muda e o PDF é gerado de novo, em vez de servir o antigo do cache.
+        """
+        cabecalho = (
+            requisicao.pk, requisicao.status, requisicao.data_criacao, requisicao.data_atendimento,
+            requisicao.data_estorno, requisicao.solicitante.username,
+            requisicao.solicitante.funcionario_id and requisicao.solicitante.funcionario.nome,
+            requisicao.centro_custo_id and requisicao.centro_custo.nome,
+            requisicao.atendido_por_id and requisicao.atendido_por.username,
+            requisicao.valor_total_atendido,
+        )
+        itens = [
+            (item.produto.nome_produto, item.quantidade, item.quantidade_atendida, item.custo_unitario, item.valor_atendido)
+            for item in requisicao.itens.all()
+        ]
+        return repr((cabecalho, itens))
+
+    def gerar_pdf(self, requisicao):
+        # Renderiza o template HTML e gera o PDF no pool de renderização, fora deste processo
+        html_string = render_to_string(self.template_name, {'requisicao': requisicao})
+        return renderizar_pdf(html_string)
 
     def get(self, request, *args, **kwargs):
-        requisicao = get_object_or_404(Requisicao, pk=self.kwargs.get('pk'))
-        
-        # Renderiza o template HTML para uma string
-        html_string = render_to_string('materiais/requisicao_pdf.html', {'requisicao': requisicao})
-        
-        # Gera o PDF a partir da string HTML
-        pdf = HTML(string=html_string).write_pdf()
-        
-        # Cria a resposta HTTP com o conteúdo do PDF
+        nome_arquivo = f'requisicao_{self.requisicao.pk}.pdf'
+        try:
+            requisicao = self.carregar_requisicao()
+            if requisicao.status in self.status_definitivos:
+                # Requisição encerrada: o PDF vem do cache em disco enquanto os
+                # dados mostrados nele forem os mesmos
+                chave = chave_pdf(self.template_name, self.assinatura(requisicao))
+                return resposta_pdf(request, chave, lambda: self.gerar_pdf(requisicao), nome_arquivo)
+            pdf = self.gerar_pdf(requisicao)
+        except RenderizacaoPDFError as e:
+            messages.error(request, str(e))
+            return redirect('materiais:detalhe_requisicao', pk=self.requisicao.pk)
+
+        # Requisição ainda em andamento: o PDF reflete o estado atual e não é guardado
         response = HttpResponse(pdf, content_type='application/pdf')
-        response['Content-Disposition'] = f'inline; filename="requisicao_{requisicao.pk}.pdf"'
-        
+        response['Content-Disposition'] = f'inline; filename="{nome_arquivo}"'
         return response    
\ No newline at end of file
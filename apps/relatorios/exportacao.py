@@ -0,0 +1,239 @@
+# Em apps/relatorios/exportacao.py
+
+import csv
+import datetime
+import re
+import zipfile
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+# Linhas acumuladas antes de enviar um pedaço da resposta
+LINHAS_POR_PEDACO = 500
+
+CONTENT_TYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def _data_local(valor):
+    if timezone.is_aware(valor):
+        valor = timezone.localtime(valor)
+    return valor
+
+
+# --- CSV ---
+
+class _Eco:
+    """Pseudo-arquivo para o csv.writer: devolve a linha em vez de guardá-la."""
+    def write(self, valor):
+        return valor
+
+
+def _texto_csv(valor):
+    # Formato que o Excel em português abre direto: ';' entre colunas e
+    # vírgula decimal
+    if valor is None:
+        return ''
+    if isinstance(valor, datetime.datetime):
+        return _data_local(valor).strftime('%d/%m/%Y %H:%M')
+    if isinstance(valor, datetime.date):
+        return valor.strftime('%d/%m/%Y')
+    if isinstance(valor, Decimal):
+        return format(valor, 'f').replace('.', ',')
+    if isinstance(valor, float):
+        return str(valor).replace('.', ',')
+    return valor
+
+
+def linhas_csv(cabecalho, linhas):
+    """
+    Gera o CSV em pedaços de LINHAS_POR_PEDACO linhas, sem montar o
+    arquivo inteiro em memória. Começa com o BOM do UTF-8 para o Excel.
+    """
+    escritor = csv.writer(_Eco(), delimiter=';')
+    pedaco = ['\ufeff', escritor.writerow(cabecalho)]
+    for linha in linhas:
+        pedaco.append(escritor.writerow([_texto_csv(valor) for valor in linha]))
+        if len(pedaco) >= LINHAS_POR_PEDACO:
+            yield ''.join(pedaco)
+            pedaco = []
+    yield ''.join(pedaco)
+
+
+# --- XLSX ---
+# Planilha mínima no formato Office Open XML (um ZIP de arquivos XML),
+# escrita linha a linha: as células de texto vão inline, sem tabela de
+# strings compartilhadas, e o ZIP é esvaziado a cada pedaço enviado.
+
+_ARQUIVOS_FIXOS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+        'Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    # Estilos: 0 padrão, 1 data e hora, 2 data, 3 valor (#,##0.00), 4 cabeçalho em negrito
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<numFmts count="2"><numFmt numFmtId="164" formatCode="dd/mm/yyyy hh:mm"/>'
+        '<numFmt numFmtId="165" formatCode="dd/mm/yyyy"/></numFmts>'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="5">'
+        '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="165" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="4" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+        '</cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'
+    ),
+}
+
+_INICIO_PLANILHA = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetData>'
+)
+_FIM_PLANILHA = '</sheetData></worksheet>'
+
+_EPOCA_EXCEL = datetime.datetime(1899, 12, 30)
+_CARACTERES_INVALIDOS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+class _Saida:
+    """
+    Destino do ZipFile: acumula o que foi escrito até ser esvaziado. Sem
+    seek(), o zipfile grava cada arquivo em modo de fluxo (data descriptor).
+    """
+    def __init__(self):
+        self.partes = []
+
+    def write(self, dados):
+        self.partes.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def esvaziar(self):
+        dados = b''.join(self.partes)
+        self.partes = []
+        return dados
+
+
+def _celula_xlsx(valor, estilo=0):
+    if valor is None:
+        return '<c/>'
+    if isinstance(valor, bool):
+        valor = 'Sim' if valor else 'Não'
+    if isinstance(valor, datetime.datetime):
+        serial = (_data_local(valor).replace(tzinfo=None) - _EPOCA_EXCEL).total_seconds() / 86400
+        return f'<c s="1"><v>{serial:.6f}</v></c>'
+    if isinstance(valor, datetime.date):
+        return f'<c s="2"><v>{(valor - _EPOCA_EXCEL.date()).days}</v></c>'
+    if isinstance(valor, Decimal):
+        return f'<c s="3"><v>{valor:f}</v></c>'
+    if isinstance(valor, (int, float)):
+        return f'<c><v>{valor}</v></c>'
+    texto = escape(_CARACTERES_INVALIDOS.sub('', str(valor)))
+    return f'<c t="inlineStr" s="{estilo}"><is><t xml:space="preserve">{texto}</t></is></c>'
+
+
+def _linha_xlsx(valores, estilo=0):
+    return '<row>' + ''.join(_celula_xlsx(valor, estilo) for valor in valores) + '</row>'
+
+
+def linhas_xlsx(cabecalho, linhas, nome_planilha='Planilha'):
+    """
+    Gera um arquivo XLSX em pedaços, com memória constante: cada bloco de
+    LINHAS_POR_PEDACO linhas é comprimido e enviado antes do próximo.
+    """
+    saida = _Saida()
+    with zipfile.ZipFile(saida, 'w', compression=zipfile.ZIP_DEFLATED) as pacote:
+        for nome, conteudo in _ARQUIVOS_FIXOS.items():
+            pacote.writestr(nome, conteudo)
+        pacote.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            f'<sheets><sheet name="{escape(nome_planilha[:31])}" sheetId="1" r:id="rId1"/></sheets>'
+            '</workbook>'
+        ))
+        yield saida.esvaziar()
+
+        with pacote.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as planilha:
+            planilha.write((_INICIO_PLANILHA + _linha_xlsx(cabecalho, estilo=4)).encode())
+            pendentes = 0
+            for linha in linhas:
+                planilha.write(_linha_xlsx(linha).encode())
+                pendentes += 1
+                if pendentes >= LINHAS_POR_PEDACO:
+                    pendentes = 0
+                    yield saida.esvaziar()
+            planilha.write(_FIM_PLANILHA.encode())
+    yield saida.esvaziar()
+
+
+# --- Resposta ---
+
+async def _em_thread(pedacos):
+    """
+    Versão assíncrona do gerador, para o servidor ASGI: cada pedaço é
+    produzido na thread síncrona do Django (onde fica a conexão com o
+    banco). Um gerador síncrono seria consumido inteiro antes do envio.
+    """
+    proximo = sync_to_async(next)
+    fim = object()
+    while True:
+        pedaco = await proximo(pedacos, fim)
+        if pedaco is fim:
+            return
+        yield pedaco
+
+
+def resposta_exportacao(request, pedacos, content_type, nome_arquivo):
+    """
+    StreamingHttpResponse para um arquivo gerado em pedaços (linhas_csv,
+    linhas_xlsx), baixado como anexo.
+    """
+    if isinstance(request, ASGIRequest):
+        pedacos = _em_thread(pedacos)
+    response = StreamingHttpResponse(pedacos, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{nome_arquivo}"'
+    return response
@@ -2,6 +2,7 @@
 
 from django import forms
 from apps.core.models import CentroCusto
+from apps.core.widgets import ArvoreCentroCustoWidget
 
 class ReportFilterForm(forms.Form):
     """
@@ -32,17 +33,21 @@ class ReportFilterForm(forms.Form):
     )
 
     # Usamos um ModelMultipleChoiceField para permitir a seleção de um ou mais Centros de Custo.
+    # O widget em árvore carrega os níveis sob demanda, sem listar todos os centros na página.
     centros_de_custo = forms.ModelMultipleChoiceField(
         label="Centros de Custo",
         queryset=CentroCusto.objects.all().order_by('nome'),
         required=True,
-        widget=forms.SelectMultiple(
-            attrs={
-                'class': 'form-select',
-                'size': '8' # Define a altura da caixa de seleção
-            }
-        ),
-        help_text="Selecione um ou mais centros de custo (mantenha Ctrl ou Shift pressionado para selecionar vários)."
+        widget=ArvoreCentroCustoWidget(),
+        help_text="Expanda a hierarquia e marque um ou mais centros de custo."
+    )
+
+    incluir_subordinados = forms.BooleanField(
+        label="Incluir unidades subordinadas",
+        required=False,
+        initial=True,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+        help_text="Soma também o consumo de todos os centros abaixo dos selecionados."
     )
 
     def clean(self):
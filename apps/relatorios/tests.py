@@ -1,3 +1,103 @@
+import csv
+import datetime
+import io
+import zipfile
+from decimal import Decimal
+from unittest import mock
+from xml.etree import ElementTree
+
 from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.materiais.models import Almoxarifado, Categoria, Produto
+from apps.materiais.services.entrada import registrar_entrada
+from apps.users.models import UsuarioSistema
+
+from . import exportacao
+from .views import RelatorioMovimentacaoView
+
+PLANILHA = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+
+# Lotes de 3 movimentos por consulta e pedaços de 2 linhas: sete movimentos
+# atravessam várias consultas e vários pedaços da resposta
+@mock.patch.object(RelatorioMovimentacaoView, 'tamanho_lote_exportacao', 3)
+@mock.patch.object(exportacao, 'LINHAS_POR_PEDACO', 2)
+class ExportacaoMovimentacaoTests(TestCase):
+    """
+    Exportação da movimentação do mês em CSV e XLSX, lida em lotes e
+    enviada em pedaços, no WSGI e no ASGI.
+    """
+    QUANTIDADE = 7
+
+    def setUp(self):
+        usuario = UsuarioSistema.objects.create_user(
+            'almoxarife', 'senha', email='almoxarife@teste.com', is_superuser=True
+        )
+        almoxarifado = Almoxarifado.objects.create(nome='Almoxarifado Central')
+        produto = Produto.objects.create(
+            categoria=Categoria.objects.create(nome='Material de Escritório'),
+            codigo_produto='131342001', nome_produto='ENVELOPE PLÁSTICO', unidade_medida='Unidade'
+        )
+        for indice in range(self.QUANTIDADE):
+            registrar_entrada(
+                produto, indice + 1, '1.10', datetime.date(2030, 1, 1), almoxarifado, usuario,
+                observacao=f'NF {indice}'
+            )
+        self.client.force_login(usuario)
+        self.async_client.force_login(usuario)
+        hoje = timezone.localdate()
+        self.url = reverse(
+            'relatorios:relatorio_fechamento_movimentacao', kwargs={'ano': hoje.year, 'mes': hoje.month}
+        )
+        self.observacoes = [f'NF {indice}' for indice in range(self.QUANTIDADE)]
+
+    def _linhas_csv(self, conteudo):
+        texto = conteudo.decode('utf-8')
+        self.assertTrue(texto.startswith('\ufeff'))
+        cabecalho, *linhas = csv.reader(io.StringIO(texto[1:]), delimiter=';')
+        self.assertEqual(tuple(cabecalho), RelatorioMovimentacaoView.CABECALHO_EXPORTACAO)
+        return linhas
+
+    def test_csv_em_pedacos_com_todas_as_linhas_em_ordem(self):
+        resposta = self.client.get(self.url, {'formato': 'csv'})
+        self.assertTrue(resposta.streaming)
+        self.assertIn('movimentacao_', resposta['Content-Disposition'])
+        pedacos = list(resposta.streaming_content)
+        self.assertGreater(len(pedacos), 2)
+
+        linhas = self._linhas_csv(b''.join(pedacos))
+        self.assertEqual([linha[-1] for linha in linhas], self.observacoes)
+        self.assertEqual([linha[8] for linha in linhas], [str(indice + 1) for indice in range(self.QUANTIDADE)])
+        # Vírgula decimal; o número de casas do valor unitário depende do banco
+        valor_unitario, valor_total = (Decimal(valor.replace(',', '.')) for valor in linhas[0][9:11])
+        self.assertEqual((valor_unitario, valor_total), (Decimal('1.1'), Decimal('1.10')))
+
+    def test_xlsx_e_um_pacote_valido(self):
+        resposta = self.client.get(self.url, {'formato': 'xlsx'})
+        self.assertEqual(resposta['Content-Type'], exportacao.CONTENT_TYPE_XLSX)
+        pedacos = list(resposta.streaming_content)
+        self.assertGreater(len(pedacos), 2)
+
+        with zipfile.ZipFile(io.BytesIO(b''.join(pedacos))) as pacote:
+            self.assertIsNone(pacote.testzip())
+            self.assertTrue({
+                '[Content_Types].xml', '_rels/.rels', 'xl/workbook.xml', 'xl/_rels/workbook.xml.rels',
+                'xl/styles.xml', 'xl/worksheets/sheet1.xml',
+            } <= set(pacote.namelist()))
+            planilha = ElementTree.fromstring(pacote.read('xl/worksheets/sheet1.xml'))
+            ElementTree.fromstring(pacote.read('xl/workbook.xml'))
+
+        linhas = planilha.find(f'{PLANILHA}sheetData').findall(f'{PLANILHA}row')
+        self.assertEqual(len(linhas), self.QUANTIDADE + 1)
+        observacoes = [linha.findall(f'{PLANILHA}c')[-1].findtext(f'.//{PLANILHA}t') for linha in linhas[1:]]
+        self.assertEqual(observacoes, self.observacoes)
 
-# Create your tests here.
+    async def test_asgi_envia_os_pedacos_de_forma_assincrona(self):
+        resposta = await self.async_client.get(self.url, {'formato': 'csv'})
+        self.assertTrue(resposta.is_async)
+        pedacos = [pedaco async for pedaco in resposta.streaming_content]
+        self.assertGreater(len(pedacos), 2)
+        linhas = self._linhas_csv(b''.join(pedacos))
+        self.assertEqual([linha[-1] for linha in linhas], self.observacoes)
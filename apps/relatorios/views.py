@@ -1,30 +1,31 @@
 # Em apps/relatorios/views.py
 
 import datetime
+from decimal import Decimal
+from django.contrib import messages
 from django.shortcuts import render
 from django.views import View
 from django.views.generic import DetailView, TemplateView
-from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
+from django.contrib.auth.mixins import LoginRequiredMixin
 from django.db.models import (
-    Sum, F, Value, DecimalField, OuterRef, Subquery, ExpressionWrapper
+    Sum, F, Value, DecimalField, ExpressionWrapper
 )
 from django.db.models.functions import Coalesce
 from django.utils import timezone
-from django.http import HttpResponse
 from django.template.loader import render_to_string
-from weasyprint import HTML
 
 from apps.materiais.models import (
-    FechamentoMensal, MovimentoEstoque, ItemRequisicao
+    ConsumoDiario, FechamentoMensal, MovimentoEstoque
 )
+from apps.core.cache_pdf import chave_pdf, resposta_pdf
+from apps.core.pdf import RenderizacaoPDFError, renderizar_pdf
+from apps.core.permissoes import GrupoRequeridoMixin
+from .exportacao import CONTENT_TYPE_XLSX, linhas_csv, linhas_xlsx, resposta_exportacao
 from .forms import ReportFilterForm
 
 
-class RelatorioBaseView(LoginRequiredMixin, UserPassesTestMixin):
-    """Classe base para garantir a segurança em todos os relatórios."""
-    def test_func(self):
-        user = self.request.user
-        return user.is_superuser or user.groups.filter(name__in=['Administradores', 'Almoxarifes']).exists()
+class RelatorioBaseView(LoginRequiredMixin, GrupoRequeridoMixin):
+    """Classe base para garantir a segurança em todos os relatórios (gestores do estoque)."""
 
 
 class RelatorioConsumoView(RelatorioBaseView, View):
@@ -47,53 +48,31 @@ class RelatorioConsumoView(RelatorioBaseView, View):
             data_inicio = form.cleaned_data['data_inicio']
             data_fim = form.cleaned_data['data_fim']
             centros_de_custo = form.cleaned_data['centros_de_custo']
-
-            # Define o intervalo de datas com fuso horário
-            dt_inicio_aware = timezone.make_aware(datetime.datetime.combine(data_inicio, datetime.time.min))
-            dt_fim_aware = timezone.make_aware(datetime.datetime.combine(data_fim, datetime.time.max))
-
-            itens_consumidos = ItemRequisicao.objects.filter(
-                requisicao__status='ATENDIDA',
-                requisicao__data_atendimento__range=(dt_inicio_aware, dt_fim_aware),
-                requisicao__centro_custo__in=centros_de_custo
-            ).select_related('produto', 'produto__categoria')
-
-            # =====================================================================
-            # CORREÇÃO 1: Adicionada ExpressionWrapper na subquery de valor
-            # =====================================================================
-            entradas_valor_subquery = MovimentoEstoque.objects.filter(
-                lote__produto_id=OuterRef('produto_id'), tipo='ENTRADA'
-            ).values('lote__produto_id').annotate(
-                total=Sum(
-                    ExpressionWrapper(F('quantidade') * F('valor_unitario'), output_field=DecimalField())
-                )
-            ).values('total')
-
-            entradas_qtd_subquery = MovimentoEstoque.objects.filter(
-                lote__produto_id=OuterRef('produto_id'), tipo='ENTRADA'
-            ).values('lote__produto_id').annotate(total=Sum('quantidade')).values('total')
-
-            resultados_relatorio = itens_consumidos.values(
+            centros_filtrados = centros_de_custo
+            if form.cleaned_data['incluir_subordinados']:
+                # Subárvores inteiras pelo caminho materializado (prefixo indexado)
+                centros_filtrados = centros_de_custo.com_subordinados()
+
+            # Lê só a tabela de consumo diário (ConsumoDiario), já agregada por
+            # dia, centro de custo e produto e valorizada pelo custo do lote de cada saída
+            consumo = ConsumoDiario.objects.filter(
+                data__range=(data_inicio, data_fim),
+                centro_custo__in=centros_filtrados
+            )
+
+            resultados_relatorio = consumo.values(
                 'produto__nome_produto', 'produto__unidade_medida', 'produto_id'
             ).annotate(
-                quantidade_total=Sum('quantidade_atendida'),
-                custo_medio_calculado=Coalesce(
-                    Subquery(entradas_valor_subquery, output_field=DecimalField()) /
-                    Subquery(entradas_qtd_subquery, output_field=DecimalField()),
-                    Value(0), output_field=DecimalField()
-                )
+                quantidade_total=Sum('quantidade'),
+                valor_total=Sum('valor'),
             ).annotate(
-                # =====================================================================
-                # CORREÇÃO 2: Adicionada ExpressionWrapper no cálculo do valor total
-                # =====================================================================
-                valor_total=ExpressionWrapper(
-                    F('quantidade_total') * F('custo_medio_calculado'),
-                    output_field=DecimalField()
+                custo_medio_calculado=ExpressionWrapper(
+                    F('valor_total') / F('quantidade_total'), output_field=DecimalField()
                 )
             ).order_by('produto__nome_produto')
 
-            valor_total_geral = resultados_relatorio.aggregate(
-                total_geral=Sum('valor_total')
+            valor_total_geral = consumo.aggregate(
+                total_geral=Sum('valor')
             )['total_geral'] or 0
 
             contexto_render['resultados'] = resultados_relatorio
@@ -107,12 +86,18 @@ class RelatorioConsumoView(RelatorioBaseView, View):
                     'data_inicio': data_inicio,
                     'data_fim': data_fim,
                     'centros_de_custo': centros_de_custo,
+                    'incluir_subordinados': form.cleaned_data['incluir_subordinados'],
                 }
-                html_string = render_to_string('relatorios/relatorio_consumo_pdf.html', contexto_pdf)
-                pdf = HTML(string=html_string).write_pdf()
-                response = HttpResponse(pdf, content_type='application/pdf')
-                response['Content-Disposition'] = 'inline; filename="relatorio_consumo.pdf"'
-                return response
+                nome_template = 'relatorios/relatorio_consumo_pdf.html'
+                html_string = render_to_string(nome_template, contexto_pdf)
+                # Mesmos filtros e mesmos dados geram o mesmo HTML: o PDF vem do cache em disco
+                chave = chave_pdf(nome_template, html_string)
+                try:
+                    return resposta_pdf(
+                        request, chave, lambda: renderizar_pdf(html_string), 'relatorio_consumo.pdf'
+                    )
+                except RenderizacaoPDFError as e:
+                    messages.error(request, str(e))
 
         return render(request, self.template_name, contexto_render)
 
@@ -135,6 +120,60 @@ class RelatorioInventarioView(RelatorioBaseView, DetailView):
 
 class RelatorioMovimentacaoView(RelatorioBaseView, TemplateView):
     template_name = 'relatorios/relatorio_movimentacao.html'
+    # Movimentos lidos do banco por consulta na exportação
+    tamanho_lote_exportacao = 2000
+
+    CABECALHO_EXPORTACAO = (
+        'Data', 'Tipo', 'Código do Produto', 'Produto', 'Unidade', 'Lote', 'Validade',
+        'Almoxarifado', 'Quantidade', 'Valor Unitário', 'Valor Total', 'Usuário', 'Observação',
+    )
+
+    def get(self, request, *args, **kwargs):
+        formato = request.GET.get('formato')
+        if formato in ('csv', 'xlsx'):
+            return self.exportar(formato)
+        return super().get(request, *args, **kwargs)
+
+    def linhas_exportacao(self):
+        """
+        Razão do mês (todos os movimentos, na ordem em que foram gravados),
+        lido em lotes por chave primária (pk > último lido) com os joins já
+        feitos: a memória não cresce com o número de movimentos, inclusive
+        no MySQL, cujo driver carrega o resultado inteiro de cada consulta.
+        """
+        ano, mes = self.kwargs['ano'], self.kwargs['mes']
+        inicio = timezone.make_aware(datetime.datetime(ano, mes, 1))
+        fim = timezone.make_aware(datetime.datetime(ano + mes // 12, mes % 12 + 1, 1))
+        movimentos = (
+            MovimentoEstoque.objects.filter(data__gte=inicio, data__lt=fim)
+            # Saídas anteriores ao custo por lote não têm valor unitário: usam o custo médio vigente
+            .annotate(valor_efetivo=Coalesce('valor_unitario', 'custo_medio'))
+            .order_by('pk')
+            .values_list(
+                'pk', 'data', 'tipo', 'produto__codigo_produto', 'produto__nome_produto',
+                'produto__unidade_medida', 'lote__codigo_lote', 'lote__data_validade',
+                'almoxarifado__nome', 'quantidade', 'valor_efetivo', 'valor_total', 'usuario__username', 'observacao',
+            )
+        )
+        ultimo_pk = 0
+        while True:
+            lote = list(movimentos.filter(pk__gt=ultimo_pk)[:self.tamanho_lote_exportacao])
+            if not lote:
+                return
+            for pk, *colunas in lote:
+                yield colunas
+            ultimo_pk = lote[-1][0]
+
+    def exportar(self, formato):
+        nome = f"movimentacao_{self.kwargs['ano']}_{self.kwargs['mes']:02d}"
+        if formato == 'csv':
+            pedacos = linhas_csv(self.CABECALHO_EXPORTACAO, self.linhas_exportacao())
+            return resposta_exportacao(self.request, pedacos, 'text/csv; charset=utf-8', f'{nome}.csv')
+        pedacos = linhas_xlsx(
+            self.CABECALHO_EXPORTACAO, self.linhas_exportacao(),
+            nome_planilha=f"Movimentação {self.kwargs['mes']:02d}-{self.kwargs['ano']}"
+        )
+        return resposta_exportacao(self.request, pedacos, CONTENT_TYPE_XLSX, f'{nome}.xlsx')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -145,14 +184,16 @@ class RelatorioMovimentacaoView(RelatorioBaseView, TemplateView):
 
         movimentos = MovimentoEstoque.objects.filter(data__year=ano, data__month=mes)
         
+        # Valores já gravados em cada movimento (valor_total): basta somar a coluna
         entradas = movimentos.filter(tipo='ENTRADA').order_by('data')
         total_entradas = entradas.aggregate(
-            total=Coalesce(Sum(ExpressionWrapper(F('quantidade') * F('valor_unitario'), output_field=DecimalField())), Value(0))
+            total=Coalesce(Sum('valor_total'), Value(Decimal('0')))
         )['total']
         
+        # Saídas têm valor total negativo; o relatório mostra o valor consumido
         saidas = movimentos.filter(tipo='SAIDA').order_by('data')
-        total_saidas = saidas.aggregate(
-            total=Coalesce(Sum(ExpressionWrapper(F('quantidade') * F('lote__custo_unitario'), output_field=DecimalField())), Value(0))
+        total_saidas = -saidas.aggregate(
+            total=Coalesce(Sum('valor_total'), Value(Decimal('0')))
         )['total']
 
         context['entradas'] = entradas
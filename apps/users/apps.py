@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class UsersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.users'
+
+    def ready(self):
+        # Invalidação do cache de usuários usado por UsuarioSistemaBackend.get_user
+        from . import signals  # noqa: F401
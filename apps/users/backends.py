@@ -1,33 +1,55 @@
 # Em apps/users/backends.py
 
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from apps.core.permissoes import ATRIBUTO_CACHE
 from .models import UsuarioSistema
 
-class UsuarioSistemaBackend:
+TTL_USUARIO_PADRAO = 60  # segundos
+
+
+def chave_cache_usuario(user_id):
+    return f'users:sessao:{user_id}'
+
+
+def invalidar_usuario_em_cache(*user_ids):
     """
-    Backend de autenticação refatorado para funcionar com o modelo
-    UsuarioSistema que herda de AbstractBaseUser.
+    Remove do cache os usuários informados; a próxima requisição de cada um
+    volta a buscá-lo no banco.
+    """
+    cache.delete_many([chave_cache_usuario(user_id) for user_id in user_ids])
+
+
+class UsuarioSistemaBackend(ModelBackend):
+    """
+    Backend de autenticação do UsuarioSistema (AbstractBaseUser).
+
+    A autenticação é a do ModelBackend: busca pela matrícula, check_password()
+    e recusa de usuários inativos. Por isso ele deve ser o único backend em
+    AUTHENTICATION_BACKENDS; com o ModelBackend logo depois, cada login que
+    falhava calculava o hash da senha duas vezes. As permissões do admin
+    (has_perm) também vêm do ModelBackend.
     """
-    def authenticate(self, request, username=None, password=None):
-        try:
-            # 1. Busca o usuário pelo username (matrícula)
-            user = UsuarioSistema.objects.get(username=username)
-
-            # 2. Usa o método check_password() do próprio modelo, que já sabe
-            #    como comparar a senha fornecida com o hash no banco.
-            if user.check_password(password) and user.is_active:
-                return user
-            
-            # Se a senha estiver incorreta ou o usuário inativo, retorna None.
-            return None
-        except UsuarioSistema.DoesNotExist:
-            # Se o usuário não existe, retorna None.
-            return None
 
     def get_user(self, user_id):
         """
-        Busca um usuário pelo seu ID (usado pelo Django para gerenciar a sessão).
+        Busca um usuário pelo seu ID (usado pelo Django para gerenciar a sessão
+        em cada requisição e no handshake dos WebSockets).
+
+        O usuário vem com funcionário, centro de custo e nomes dos grupos já
+        carregados e fica em cache por USUARIO_CACHE_TTL segundos; o cache é
+        invalidado quando o usuário, seus grupos ou um grupo são alterados
+        (ver apps/users/signals.py).
         """
-        try:
-            return UsuarioSistema.objects.get(pk=user_id)
-        except UsuarioSistema.DoesNotExist:
-            return None
\ No newline at end of file
+        chave = chave_cache_usuario(user_id)
+        user = cache.get(chave)
+        if user is None:
+            try:
+                user = UsuarioSistema.objects.select_related('funcionario', 'centro_custo').get(pk=user_id)
+            except UsuarioSistema.DoesNotExist:
+                return None
+            setattr(user, ATRIBUTO_CACHE, frozenset(user.groups.values_list('name', flat=True)))
+            cache.set(chave, user, getattr(settings, 'USUARIO_CACHE_TTL', TTL_USUARIO_PADRAO))
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,52 @@
+# Em apps/users/signals.py
+
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.db.models import Q
+from django.dispatch import receiver
+
+from apps.core.models import CentroCusto, Employee
+
+from .backends import invalidar_usuario_em_cache
+from .models import UsuarioSistema
+
+
+@receiver([post_save, post_delete], sender=UsuarioSistema)
+def usuario_alterado(sender, instance, **kwargs):
+    invalidar_usuario_em_cache(instance.pk)
+
+
+@receiver(m2m_changed, sender=UsuarioSistema.groups.through)
+def grupos_do_usuario_alterados(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear', 'pre_clear'):
+        return
+    if not reverse:
+        # usuario.groups.add(...) / remove / clear
+        invalidar_usuario_em_cache(instance.pk)
+    elif pk_set:
+        # grupo.user_set.add(...) / remove
+        invalidar_usuario_em_cache(*pk_set)
+    else:
+        # grupo.user_set.clear(): 'pre_clear' ainda enxerga os membros
+        invalidar_usuario_em_cache(*instance.user_set.values_list('pk', flat=True))
+
+
+@receiver([post_save, pre_delete], sender=Group)
+def grupo_alterado(sender, instance, **kwargs):
+    # Renomear ou excluir um grupo muda os nomes de grupo em cache dos membros
+    invalidar_usuario_em_cache(*instance.user_set.values_list('pk', flat=True))
+
+
+# O usuário em cache leva o funcionário e o centro de custo (select_related);
+# na exclusão os membros são lidos antes (pre_delete), como nos grupos acima.
+@receiver([post_save, pre_delete], sender=Employee)
+def funcionario_alterado(sender, instance, **kwargs):
+    invalidar_usuario_em_cache(*UsuarioSistema.objects.filter(funcionario=instance).values_list('pk', flat=True))
+
+
+@receiver([post_save, pre_delete], sender=CentroCusto)
+def centro_custo_alterado(sender, instance, **kwargs):
+    # Mover um centro muda o caminho de toda a subárvore (CentroCusto.save)
+    subarvore = CentroCusto.objects.filter(pk=instance.pk).com_subordinados()
+    usuarios = UsuarioSistema.objects.filter(Q(centro_custo=instance) | Q(centro_custo__in=subarvore))
+    invalidar_usuario_em_cache(*usuarios.values_list('pk', flat=True))
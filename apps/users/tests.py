@@ -1,3 +1,72 @@
+from django.contrib.auth.models import Group
 from django.test import TestCase
 
-# Create your tests here.
+from apps.core.models import CentroCusto, Employee
+
+from .backends import UsuarioSistemaBackend
+from .models import UsuarioSistema
+
+
+class UsuarioSistemaBackendTests(TestCase):
+    """
+    get_user serve o usuário da sessão do cache, com grupos já carregados,
+    e o cache é invalidado quando o usuário, seus grupos, seu funcionário
+    ou seu centro de custo mudam.
+    """
+
+    def setUp(self):
+        self.backend = UsuarioSistemaBackend()
+        self.usuario = UsuarioSistema.objects.create_user('12345', 'senha', email='usuario@teste.com')
+        self.grupo = Group.objects.create(name='Almoxarifes')
+
+    def test_usuario_em_cache_com_grupos(self):
+        self.usuario.groups.add(self.grupo)
+        self.backend.get_user(self.usuario.pk)
+
+        with self.assertNumQueries(0):
+            usuario = self.backend.get_user(self.usuario.pk)
+            self.assertEqual(usuario._nomes_grupos, {'Almoxarifes'})
+
+        self.usuario.groups.remove(self.grupo)
+        self.assertEqual(self.backend.get_user(self.usuario.pk)._nomes_grupos, frozenset())
+
+        self.grupo.user_set.add(self.usuario)
+        self.grupo.name = 'Administradores'
+        self.grupo.save()
+        self.assertEqual(self.backend.get_user(self.usuario.pk)._nomes_grupos, {'Administradores'})
+
+    def test_usuario_inativo_nao_e_retornado(self):
+        self.backend.get_user(self.usuario.pk)
+        self.usuario.is_active = False
+        self.usuario.save()
+        self.assertIsNone(self.backend.get_user(self.usuario.pk))
+
+    def test_autenticacao(self):
+        self.assertEqual(self.backend.authenticate(None, username='12345', password='senha'), self.usuario)
+        self.assertIsNone(self.backend.authenticate(None, username='12345', password='errada'))
+        self.assertIsNone(self.backend.authenticate(None, username='inexistente', password='senha'))
+
+    def test_funcionario_e_centro_de_custo_alterados(self):
+        diretoria = CentroCusto.objects.create(nome='Diretoria')
+        lotacao = CentroCusto.objects.create(nome='Lotação', parent=diretoria)
+        self.usuario.funcionario = Employee.objects.create(matricula='12345', nome='Maria')
+        self.usuario.centro_custo = lotacao
+        self.usuario.save()
+        self.backend.get_user(self.usuario.pk)
+
+        self.usuario.funcionario.nome = 'Maria da Silva'
+        self.usuario.funcionario.save()
+        self.assertEqual(self.backend.get_user(self.usuario.pk).funcionario.nome, 'Maria da Silva')
+
+        lotacao.nome = 'Lotação Central'
+        lotacao.save()
+        self.assertEqual(self.backend.get_user(self.usuario.pk).centro_custo.nome, 'Lotação Central')
+
+        # Mover a Diretoria reescreve o caminho da Lotação, abaixo dela
+        presidencia = CentroCusto.objects.create(nome='Presidência')
+        diretoria.parent = presidencia
+        diretoria.save()
+        self.assertEqual(
+            self.backend.get_user(self.usuario.pk).centro_custo.caminho,
+            f'/{presidencia.pk}/{diretoria.pk}/{lotacao.pk}/'
+        )
@@ -0,0 +1,122 @@
+// static/js/arvore_centro_custo.js
+
+// Seletor de centros de custo em árvore (ArvoreCentroCustoWidget): cada nível
+// é buscado no servidor só quando o nó é expandido. Os centros marcados ficam
+// como campos ocultos (e etiquetas) no topo do widget, mesmo quando o nó
+// correspondente ainda não foi carregado.
+document.addEventListener('DOMContentLoaded', function() {
+    document.querySelectorAll('.arvore-centro-custo').forEach(function(arvore) {
+        const urlFilhos = arvore.dataset.urlFilhos;
+        const nomeCampo = arvore.dataset.nome;
+        const selecionados = arvore.querySelector('.arvore-selecionados');
+        const raiz = arvore.querySelector('.arvore-nos');
+
+        function estaSelecionado(id) {
+            return selecionados.querySelector(`[data-id="${id}"]`) !== null;
+        }
+
+        function selecionar(centro) {
+            if (estaSelecionado(centro.id)) {
+                return;
+            }
+            const etiqueta = document.createElement('span');
+            etiqueta.className = 'badge bg-secondary me-1 mb-1';
+            etiqueta.setAttribute('role', 'button');
+            etiqueta.title = 'Remover';
+            etiqueta.dataset.id = centro.id;
+            etiqueta.textContent = centro.nome;
+            const campo = document.createElement('input');
+            campo.type = 'hidden';
+            campo.name = nomeCampo;
+            campo.value = centro.id;
+            etiqueta.appendChild(campo);
+            selecionados.appendChild(etiqueta);
+        }
+
+        function desmarcar(id) {
+            const etiqueta = selecionados.querySelector(`[data-id="${id}"]`);
+            if (etiqueta) {
+                etiqueta.remove();
+            }
+        }
+
+        function criarNo(centro) {
+            const item = document.createElement('li');
+
+            const alternar = document.createElement('button');
+            alternar.type = 'button';
+            alternar.className = 'btn btn-sm btn-link text-decoration-none p-0 me-1';
+            alternar.style.width = '1.25rem';
+            alternar.textContent = centro.tem_filhos ? '+' : '';
+            alternar.disabled = !centro.tem_filhos;
+
+            const rotulo = document.createElement('label');
+            rotulo.className = 'form-check-label';
+            const marcador = document.createElement('input');
+            marcador.type = 'checkbox';
+            marcador.className = 'form-check-input me-1';
+            marcador.dataset.id = centro.id;
+            marcador.checked = estaSelecionado(centro.id);
+            marcador.addEventListener('change', function() {
+                if (marcador.checked) {
+                    selecionar(centro);
+                } else {
+                    desmarcar(centro.id);
+                }
+            });
+            rotulo.appendChild(marcador);
+            rotulo.appendChild(document.createTextNode(centro.nome));
+
+            const filhos = document.createElement('ul');
+            filhos.className = 'list-unstyled ms-4';
+            filhos.hidden = true;
+
+            let carregado = false;
+            alternar.addEventListener('click', function() {
+                filhos.hidden = !filhos.hidden;
+                alternar.textContent = filhos.hidden ? '+' : '−';
+                if (!carregado) {
+                    carregado = true;
+                    carregarNivel(centro.id, filhos);
+                }
+            });
+
+            item.append(alternar, rotulo, filhos);
+            return item;
+        }
+
+        function carregarNivel(parentId, lista) {
+            const url = parentId ? `${urlFilhos}?parent=${parentId}` : urlFilhos;
+            lista.innerHTML = '<li class="text-muted small">Carregando...</li>';
+            fetch(url, { credentials: 'same-origin' })
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error(response.statusText);
+                    }
+                    return response.json();
+                })
+                .then(dados => {
+                    lista.innerHTML = '';
+                    dados.centros.forEach(centro => lista.appendChild(criarNo(centro)));
+                })
+                .catch(() => {
+                    lista.innerHTML = '<li class="text-danger small">Não foi possível carregar os centros de custo.</li>';
+                });
+        }
+
+        // Clicar em uma etiqueta remove a seleção
+        selecionados.addEventListener('click', function(event) {
+            const etiqueta = event.target.closest('[data-id]');
+            if (!etiqueta) {
+                return;
+            }
+            const marcador = arvore.querySelector(`.arvore-nos [data-id="${etiqueta.dataset.id}"]`);
+            desmarcar(etiqueta.dataset.id);
+            if (marcador) {
+                marcador.checked = false;
+            }
+        });
+
+        carregarNivel(null, raiz);
+    });
+});
@@ -11,23 +11,79 @@ document.addEventListener('DOMContentLoaded', function() {
     let chatSocket = null;
     let currentConversationId = null;
 
+    // Paginação do histórico: o servidor envia as últimas mensagens ao conectar
+    // e um cursor para buscar as anteriores quando o usuário rola para cima.
+    let olderCursor = null;
+    let hasOlderMessages = false;
+    let loadingOlder = false;
+
+    // Reconexão: guarda o id da última mensagem recebida para pedir ao
+    // servidor só o que chegou enquanto o socket estava fora do ar.
+    let lastMessageId = null;
+    let reconnectAttempts = 0;
+    let reconnectTimer = null;
+    const MAX_RECONNECT_DELAY = 30000;
+
+    // Protocolo binário (MessagePack), usado quando a biblioteca foi carregada;
+    // sem ela, o chat continua em JSON. Nos quadros binários cada mensagem é
+    // [id, id do autor, nome, texto, timestamp em ms] e o 'is_me' é calculado aqui.
+    const MSGPACK_SUBPROTOCOL = 'chat.msgpack';
+    const useMsgpack = typeof window.MessagePack !== 'undefined';
+    const currentUserId = Number(chatLog.dataset.userId);
+
     // Função para rolar o chat para a última mensagem
     function scrollToBottom() {
         chatLog.scrollTop = chatLog.scrollHeight;
     }
 
+    function formatTimestamp(ms) {
+        const date = new Date(ms);
+        const pad = n => String(n).padStart(2, '0');
+        return `${pad(date.getDate())}/${pad(date.getMonth() + 1)}/${date.getFullYear()} ` +
+            `${pad(date.getHours())}:${pad(date.getMinutes())}`;
+    }
+
+    function expandMessage([id, authorId, user, message, timestamp]) {
+        return {
+            id: id,
+            user: user,
+            message: message,
+            timestamp: formatTimestamp(timestamp),
+            is_me: authorId === currentUserId
+        };
+    }
+
+    // Converte um quadro recebido (texto JSON ou binário) no mesmo formato
+    function decodeFrame(raw) {
+        if (typeof raw === 'string') {
+            return JSON.parse(raw);
+        }
+        const frame = window.MessagePack.decode(new Uint8Array(raw));
+        if (frame.type === 'message') {
+            return expandMessage(frame.message);
+        }
+        if (frame.history) {
+            frame.history = frame.history.map(expandMessage);
+        }
+        return frame;
+    }
+
+    function sendFrame(frame) {
+        if (chatSocket.protocol === MSGPACK_SUBPROTOCOL) {
+            chatSocket.send(window.MessagePack.encode(frame));
+        } else {
+            chatSocket.send(JSON.stringify(frame));
+        }
+    }
+
     // --- MUDANÇA: Função 'renderMessage' refatorada com Template Literals e 'is_me' ---
     // Agora usa 'data.is_me' vindo do backend para estilizar a mensagem.
-    function renderMessage(data) {
-        // Remove a mensagem "Nenhuma mensagem ainda" se ela existir
-        const emptyMsg = document.querySelector('#chat-empty-message');
-        if (emptyMsg) emptyMsg.remove();
-
+    function messageHTML(data) {
         const bubbleClasses = data.is_me ? 'justify-content-end' : 'justify-content-start';
         const messageClasses = data.is_me ? 'bg-primary text-white' : 'bg-light text-dark';
         
         // Usando template literal para criar o HTML de forma mais limpa
-        const messageHTML = `
+        return `
             <div class="d-flex mb-3 ${bubbleClasses}">
                 <div class="p-2 rounded ${messageClasses}" style="max-width: 80%;">
                     <p class="mb-1 small"><strong>${data.user}</strong></p>
@@ -35,10 +91,65 @@ document.addEventListener('DOMContentLoaded', function() {
                     <p class="mb-0 text-end small opacity-75 mt-1">${data.timestamp}</p>
                 </div>
             </div>`;
-        
-        chatLog.insertAdjacentHTML('beforeend', messageHTML);
     }
 
+    function renderMessage(data) {
+        // Remove a mensagem "Nenhuma mensagem ainda" se ela existir
+        const emptyMsg = document.querySelector('#chat-empty-message');
+        if (emptyMsg) emptyMsg.remove();
+
+        chatLog.insertAdjacentHTML('beforeend', messageHTML(data));
+        if (data.id && (lastMessageId === null || data.id > lastMessageId)) {
+            lastMessageId = data.id;
+        }
+    }
+
+    function showResyncNotice() {
+        chatLog.insertAdjacentHTML('beforeend', `
+            <div class="alert alert-warning text-center mt-3">
+                Você ficou desconectado por muito tempo e há muitas mensagens novas.
+                <a href="#" onclick="window.location.reload(); return false;">Recarregue a página</a>.
+            </div>`);
+    }
+
+    function scheduleReconnect() {
+        // Espera exponencial com um pouco de aleatoriedade, para que todos os
+        // clientes não reconectem ao mesmo tempo depois de uma queda de rede
+        const delay = Math.min(1000 * 2 ** reconnectAttempts, MAX_RECONNECT_DELAY) * (0.5 + Math.random() / 2);
+        reconnectAttempts += 1;
+        reconnectTimer = setTimeout(openSocket, delay);
+    }
+
+    // Insere uma página antiga no topo sem deslocar o que o usuário está lendo
+    function prependMessages(messages) {
+        const previousHeight = chatLog.scrollHeight;
+        chatLog.insertAdjacentHTML('afterbegin', messages.map(messageHTML).join(''));
+        chatLog.scrollTop += chatLog.scrollHeight - previousHeight;
+    }
+
+    function updatePagination(data) {
+        hasOlderMessages = Boolean(data.has_more);
+        olderCursor = data.cursor || null;
+        loadingOlder = false;
+    }
+
+    function requestOlderMessages() {
+        if (!hasOlderMessages || loadingOlder || !chatSocket || chatSocket.readyState !== WebSocket.OPEN) {
+            return;
+        }
+        loadingOlder = true;
+        sendFrame({
+            'type': 'load_older',
+            'cursor': olderCursor
+        });
+    }
+
+    chatLog.addEventListener('scroll', function() {
+        if (chatLog.scrollTop < 50) {
+            requestOlderMessages();
+        }
+    });
+
     function connectToChat(conversaId) {
         // Evita reconexões desnecessárias para a mesma conversa
         if (chatSocket && currentConversationId === conversaId) {
@@ -47,26 +158,58 @@ document.addEventListener('DOMContentLoaded', function() {
         currentConversationId = conversaId;
 
         // Fecha qualquer socket anterior
+        clearTimeout(reconnectTimer);
         if (chatSocket) {
+            chatSocket.onclose = null;
             chatSocket.close();
         }
         
         // --- MUDANÇA: Lógica de carregamento agora é interna do WebSocket ---
         chatLog.innerHTML = '<p class="text-center text-muted">A ligar ao chat...</p>';
+        lastMessageId = null;
+        reconnectAttempts = 0;
+        updatePagination({});
+        openSocket();
+    }
 
+    function openSocket() {
         // --- MUDANÇA: Protocolo dinâmico (ws:// ou wss://) para segurança 🔒 ---
         const protocol = window.location.protocol === 'https:' ? 'wss://' : 'ws://';
-        const wsURL = `${protocol}${window.location.host}/ws/chat/${conversaId}/`;
+        let wsURL = `${protocol}${window.location.host}/ws/chat/${currentConversationId}/`;
+        if (lastMessageId !== null) {
+            // Reconexão: o servidor envia só as mensagens posteriores a esta
+            wsURL += `?after=${lastMessageId}`;
+        }
         
-        chatSocket = new WebSocket(wsURL);
+        const socket = useMsgpack ? new WebSocket(wsURL, [MSGPACK_SUBPROTOCOL]) : new WebSocket(wsURL);
+        socket.binaryType = 'arraybuffer';
+        chatSocket = socket;
 
         // --- MUDANÇA: Lógica 'onmessage' agora trata o histórico e novas mensagens ---
-        chatSocket.onmessage = function(e) {
-            const data = JSON.parse(e.data);
+        socket.onmessage = function(e) {
+            const data = decodeFrame(e.data);
+
+            if (data.type === 'older_messages') {
+                // Página mais antiga pedida ao rolar para cima: vai para o topo
+                prependMessages(data.history || []);
+                updatePagination(data);
+                return;
+            }
+
+            if (data.type === 'resync_required') {
+                showResyncNotice();
+                socket.onclose = null;
+                socket.close();
+                return;
+            }
 
-            if (data.type === 'message_history') {
+            if (data.type === 'catch_up') {
+                // Reconexão: só as mensagens perdidas enquanto estava desconectado
+                (data.history || []).forEach(msg => renderMessage(msg));
+            } else if (data.type === 'message_history') {
                 // Limpa a mensagem "A ligar..."
                 chatLog.innerHTML = ''; 
+                updatePagination(data);
                 
                 if (data.history && data.history.length > 0) {
                     // Renderiza cada mensagem do histórico recebido
@@ -82,15 +225,18 @@ document.addEventListener('DOMContentLoaded', function() {
             scrollToBottom();
         };
 
-        chatSocket.onopen = function(e) {
+        socket.onopen = function(e) {
             // Mostra o campo de input apenas quando a conexão estiver pronta
+            reconnectAttempts = 0;
             chatInputContainer.style.display = 'flex';
             messageInput.focus();
         };
 
-        chatSocket.onclose = function(e) {
-            console.error('O socket do chat fechou inesperadamente.');
+        socket.onclose = function(e) {
+            console.error('O socket do chat fechou inesperadamente. Tentando reconectar...');
             chatInputContainer.style.display = 'none';
+            loadingOlder = false;
+            scheduleReconnect();
         };
     }
 
@@ -100,9 +246,9 @@ document.addEventListener('DOMContentLoaded', function() {
             return;
         }
         
-        chatSocket.send(JSON.stringify({
+        sendFrame({
             'message': message
-        }));
+        });
         
         messageInput.value = '';
         messageInput.focus();
@@ -0,0 +1,262 @@
+// static/js/msgpack.js
+//
+// Codificador/decodificador MessagePack mínimo, servido junto com os demais
+// estáticos (sem script de CDN de terceiros na página do chat). Cobre os
+// tipos dos quadros do chat: nil, booleanos, inteiros (até 53 bits), floats,
+// strings, binários, arrays e mapas com chaves string. Expõe
+// window.MessagePack.encode/decode, a mesma interface do @msgpack/msgpack.
+(function (global) {
+    'use strict';
+
+    const textEncoder = new TextEncoder();
+    const textDecoder = new TextDecoder();
+
+    function encode(value) {
+        let buffer = new Uint8Array(256);
+        let view = new DataView(buffer.buffer);
+        let offset = 0;
+
+        function ensure(size) {
+            if (offset + size <= buffer.length) {
+                return;
+            }
+            let length = buffer.length * 2;
+            while (length < offset + size) {
+                length *= 2;
+            }
+            const bigger = new Uint8Array(length);
+            bigger.set(buffer);
+            buffer = bigger;
+            view = new DataView(buffer.buffer);
+        }
+
+        function byte(b) {
+            ensure(1);
+            buffer[offset++] = b;
+        }
+
+        function bytes(data) {
+            ensure(data.length);
+            buffer.set(data, offset);
+            offset += data.length;
+        }
+
+        function header(size, fix, fixMax, code8, code16, code32) {
+            if (fix !== null && size <= fixMax) {
+                byte(fix | size);
+            } else if (code8 !== null && size < 0x100) {
+                byte(code8);
+                byte(size);
+            } else if (size < 0x10000) {
+                byte(code16);
+                ensure(2);
+                view.setUint16(offset, size);
+                offset += 2;
+            } else {
+                byte(code32);
+                ensure(4);
+                view.setUint32(offset, size);
+                offset += 4;
+            }
+        }
+
+        function integer(n) {
+            if (n >= 0) {
+                if (n < 0x80) {
+                    byte(n);
+                } else if (n < 0x100) {
+                    byte(0xcc);
+                    byte(n);
+                } else if (n < 0x10000) {
+                    byte(0xcd);
+                    ensure(2);
+                    view.setUint16(offset, n);
+                    offset += 2;
+                } else if (n < 0x100000000) {
+                    byte(0xce);
+                    ensure(4);
+                    view.setUint32(offset, n);
+                    offset += 4;
+                } else {
+                    byte(0xcf);
+                    ensure(8);
+                    view.setBigUint64(offset, BigInt(n));
+                    offset += 8;
+                }
+            } else if (n >= -0x20) {
+                byte(n & 0xff);
+            } else if (n >= -0x80) {
+                byte(0xd0);
+                ensure(1);
+                view.setInt8(offset++, n);
+            } else if (n >= -0x8000) {
+                byte(0xd1);
+                ensure(2);
+                view.setInt16(offset, n);
+                offset += 2;
+            } else if (n >= -0x80000000) {
+                byte(0xd2);
+                ensure(4);
+                view.setInt32(offset, n);
+                offset += 4;
+            } else {
+                byte(0xd3);
+                ensure(8);
+                view.setBigInt64(offset, BigInt(n));
+                offset += 8;
+            }
+        }
+
+        function write(item) {
+            if (item === null || item === undefined) {
+                byte(0xc0);
+            } else if (item === false) {
+                byte(0xc2);
+            } else if (item === true) {
+                byte(0xc3);
+            } else if (typeof item === 'number') {
+                if (Number.isSafeInteger(item)) {
+                    integer(item);
+                } else {
+                    byte(0xcb);
+                    ensure(8);
+                    view.setFloat64(offset, item);
+                    offset += 8;
+                }
+            } else if (typeof item === 'string') {
+                const data = textEncoder.encode(item);
+                header(data.length, 0xa0, 0x1f, 0xd9, 0xda, 0xdb);
+                bytes(data);
+            } else if (item instanceof Uint8Array) {
+                header(item.length, null, 0, 0xc4, 0xc5, 0xc6);
+                bytes(item);
+            } else if (Array.isArray(item)) {
+                header(item.length, 0x90, 0x0f, null, 0xdc, 0xdd);
+                item.forEach(write);
+            } else if (typeof item === 'object') {
+                const keys = Object.keys(item).filter(key => item[key] !== undefined);
+                header(keys.length, 0x80, 0x0f, null, 0xde, 0xdf);
+                keys.forEach(key => {
+                    write(key);
+                    write(item[key]);
+                });
+            } else {
+                throw new TypeError(`MessagePack: tipo não suportado (${typeof item})`);
+            }
+        }
+
+        write(value);
+        return buffer.slice(0, offset);
+    }
+
+    function decode(data) {
+        const view = new DataView(data.buffer, data.byteOffset, data.byteLength);
+        let offset = 0;
+
+        function need(size) {
+            if (offset + size > data.length) {
+                throw new RangeError('MessagePack: quadro incompleto');
+            }
+        }
+
+        function uint(size) {
+            need(size);
+            let value;
+            if (size === 1) {
+                value = view.getUint8(offset);
+            } else if (size === 2) {
+                value = view.getUint16(offset);
+            } else if (size === 4) {
+                value = view.getUint32(offset);
+            } else {
+                value = Number(view.getBigUint64(offset));
+            }
+            offset += size;
+            return value;
+        }
+
+        function int(size) {
+            need(size);
+            let value;
+            if (size === 1) {
+                value = view.getInt8(offset);
+            } else if (size === 2) {
+                value = view.getInt16(offset);
+            } else if (size === 4) {
+                value = view.getInt32(offset);
+            } else {
+                value = Number(view.getBigInt64(offset));
+            }
+            offset += size;
+            return value;
+        }
+
+        function raw(size) {
+            need(size);
+            const value = data.subarray(offset, offset + size);
+            offset += size;
+            return value;
+        }
+
+        function array(size) {
+            const items = new Array(size);
+            for (let i = 0; i < size; i++) {
+                items[i] = read();
+            }
+            return items;
+        }
+
+        function map(size) {
+            const object = {};
+            for (let i = 0; i < size; i++) {
+                const key = read();
+                object[key] = read();
+            }
+            return object;
+        }
+
+        function read() {
+            const code = uint(1);
+            if (code < 0x80) return code;
+            if (code < 0x90) return map(code & 0x0f);
+            if (code < 0xa0) return array(code & 0x0f);
+            if (code < 0xc0) return textDecoder.decode(raw(code & 0x1f));
+            if (code >= 0xe0) return code - 0x100;
+            switch (code) {
+                case 0xc0: return null;
+                case 0xc2: return false;
+                case 0xc3: return true;
+                case 0xc4: return raw(uint(1)).slice();
+                case 0xc5: return raw(uint(2)).slice();
+                case 0xc6: return raw(uint(4)).slice();
+                case 0xca: need(4); offset += 4; return view.getFloat32(offset - 4);
+                case 0xcb: need(8); offset += 8; return view.getFloat64(offset - 8);
+                case 0xcc: return uint(1);
+                case 0xcd: return uint(2);
+                case 0xce: return uint(4);
+                case 0xcf: return uint(8);
+                case 0xd0: return int(1);
+                case 0xd1: return int(2);
+                case 0xd2: return int(4);
+                case 0xd3: return int(8);
+                case 0xd9: return textDecoder.decode(raw(uint(1)));
+                case 0xda: return textDecoder.decode(raw(uint(2)));
+                case 0xdb: return textDecoder.decode(raw(uint(4)));
+                case 0xdc: return array(uint(2));
+                case 0xdd: return array(uint(4));
+                case 0xde: return map(uint(2));
+                case 0xdf: return map(uint(4));
+                default:
+                    throw new TypeError(`MessagePack: código 0x${code.toString(16)} não suportado`);
+            }
+        }
+
+        const value = read();
+        if (offset !== data.length) {
+            throw new RangeError('MessagePack: bytes sobrando após o quadro');
+        }
+        return value;
+    }
+
+    global.MessagePack = { encode: encode, decode: decode };
+})(window);